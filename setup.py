@@ -14,6 +14,7 @@ INSTALL_REQUIRES = [
     'sortedcontainers>=2.0',
     'ezenum>=0.0.3',
     'speks',
+    'numpy',
 ]
 TEST_REQUIRES = [
     # testing and coverage
@@ -0,0 +1,70 @@
+"""Testing the binary, columnar edge list."""
+
+import gzip
+
+import numpy as np
+
+from twikwak17.binary_edges import (
+    INDEX_COLUMNS,
+    UID_COLUMNS,
+    BinaryEdgeList,
+    BinaryEdgeListWriter,
+    binary_edge_list_exists,
+)
+from twikwak17.edges import format_int_pairs
+from twikwak17.phases.phase7 import (
+    dump_graphml_edges,
+    iter_edge_chunks,
+)
+
+
+def test_binary_edge_list_roundtrip(tmpdir):
+    dpath = str(tmpdir.join('edges'))
+    writer = BinaryEdgeListWriter(
+        dpath, UID_COLUMNS + INDEX_COLUMNS, chunk_edges=3)
+    writer.add_pairs(
+        np.array([[10, 20], [30, 40]]), np.array([[0, 1], [2, 3]]))
+    writer.add_pairs(
+        np.array([[50, 60], [70, 80]]), np.array([[4, 5], [6, 7]]))
+    writer.add_pairs(np.array([[90, 2 ** 40]]), np.array([[8, 9]]))
+    assert not binary_edge_list_exists(dpath)
+    writer.finish()
+    assert binary_edge_list_exists(dpath)
+    edges = BinaryEdgeList(dpath)
+    assert len(edges) == 5
+    assert edges.chunk_counts == [4, 1]
+    assert edges.has_columns(INDEX_COLUMNS)
+    assert [chunk.tolist() for chunk in edges.iter_pairs()] == [
+        [[10, 20], [30, 40], [50, 60], [70, 80]], [[90, 2 ** 40]]]
+    assert edges.column('dst_index').tolist() == [1, 3, 5, 7, 9]
+    assert edges.column('dst_index').dtype == np.int32
+
+
+def test_phase7_prefers_binary_edges(tmpdir):
+    text_fpath = str(tmpdir.join('edges.txt.gz'))
+    with gzip.open(text_fpath, 'wt') as f:
+        f.write('1 2\n3 4\n')
+    dpath = str(tmpdir.join('edges'))
+    writer = BinaryEdgeListWriter(dpath, UID_COLUMNS)
+    writer.add_pairs(np.array([[5, 6]]))
+    chunks = iter_edge_chunks(text_fpath, dpath)
+    assert [chunk.tolist() for chunk in chunks] == [[[1, 2], [3, 4]]]
+    writer.finish()
+    chunks = iter_edge_chunks(text_fpath, dpath)
+    assert [chunk.tolist() for chunk in chunks] == [[[5, 6]]]
+    chunks = iter_edge_chunks(text_fpath, dpath, INDEX_COLUMNS)
+    assert [chunk.tolist() for chunk in chunks] == [[[1, 2], [3, 4]]]
+
+
+def test_dump_graphml_edges(tmpdir):
+    out_fpath = str(tmpdir.join('out.graphml'))
+    sample_fpath = str(tmpdir.join('sample.graphml'))
+    with open(out_fpath, 'wt+') as out_f, open(sample_fpath, 'wt+') as s_f:
+        dumped = dump_graphml_edges(
+            [np.array([[1, 23]]), np.array([[456, 7]])], out_f, s_f)
+    assert dumped == 2
+    with open(out_fpath, 'rt') as f:
+        assert f.read() == (
+            '    <edge source="1" target="23" />\n'
+            '    <edge source="456" target="7" />\n')
+    assert format_int_pairs(np.array([[1, 23]])) == b'1 23\n'
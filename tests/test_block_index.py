@@ -0,0 +1,75 @@
+"""Testing sparse block indices over sorted username files."""
+
+import gzip
+import random
+
+from twikwak17.block_index import (
+    BlockIndex,
+    block_index_exists,
+    index_sorted_username_file,
+    iter_galloping_intersection,
+)
+
+
+def _sorted_unames_file(fpath, unames):
+    with gzip.open(fpath, 'wb') as f:
+        f.write(b'\n'.join(sorted(unames)) + b'\n\n')
+
+
+def test_index_sorted_username_file(tmpdir):
+    fpath = str(tmpdir.join('unames.txt.gz'))
+    unames = [f'user{i:05d}'.encode() for i in range(1000)]
+    _sorted_unames_file(fpath, unames)
+    index = index_sorted_username_file(fpath, block_lines=64)
+    assert block_index_exists(fpath)
+    assert len(index) == 16
+    assert index.line_count == 1000
+    with gzip.open(fpath, 'rb') as f:
+        assert f.read().split() == unames
+    assert index.gallop(b'user00000', 0) == 0
+    assert index.gallop(b'user00130', 0) == 2
+    assert index.gallop(b'user00999', 3) == 15
+    assert index.gallop(b'zzz', 0) == 15
+    with open(fpath, 'rb') as f:
+        assert index.read_block(f, 2).split()[0] == b'user00128'
+
+
+def test_iter_galloping_intersection(tmpdir):
+    rand = random.Random(31)
+    pool = sorted({
+        ''.join(rand.choice('abcdef_') for _ in range(rand.randint(1, 10)))
+        for _ in range(8000)
+    })
+    pool = [p.encode() for p in pool]
+    large = rand.sample(pool, 3000)
+    small = sorted(rand.sample(pool, 150))
+    fpath = str(tmpdir.join('large.txt.gz'))
+    _sorted_unames_file(fpath, large)
+    index_sorted_username_file(fpath, block_lines=50)
+    counts = {}
+    small_blocks = [small[i:i+20] for i in range(0, len(small), 20)]
+    common = [
+        key
+        for block in iter_galloping_intersection(small_blocks, fpath, counts)
+        for key in block.tolist()
+    ]
+    assert common == sorted(set(small) & set(large))
+    assert counts['left'] == len(small)
+    assert counts['blocks_read'] <= len(BlockIndex(fpath))
+
+
+def test_iter_range_keys_partitions_the_file(tmpdir):
+    fpath = str(tmpdir.join('unames.txt.gz'))
+    unames = [f'user{i:05d}'.encode() for i in range(1000)]
+    _sorted_unames_file(fpath, unames)
+    index = index_sorted_username_file(fpath, block_lines=64)
+    splitters = index.splitter_keys(5) + [b'user00500']
+    splitters = sorted(set(splitters))
+    bounds = list(zip([None] + splitters, splitters + [None]))
+    with open(fpath, 'rb') as f:
+        ranges = [
+            [key for keys in index.iter_range_keys(f, lo, hi) for key in keys]
+            for lo, hi in bounds
+        ]
+    assert [key for keys in ranges for key in keys] == unames
+    assert ranges[0][-1] < splitters[0] <= ranges[1][0]
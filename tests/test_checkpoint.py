@@ -0,0 +1,54 @@
+"""Testing checkpointed, resumable outputs."""
+
+import os
+import gzip
+
+from twikwak17.checkpoint import (
+    CheckpointedGzipOutput,
+    checkpoint_fpath,
+    skip_lines,
+)
+
+
+LINES = [f'user{i:03d} {i % 2}\n' for i in range(50)]
+
+
+def _write(output, start, stop_at=None):
+    for i in range(start, len(LINES)):
+        if i == stop_at:
+            return
+        output.write(LINES[i])
+        if i % 10 == 9:
+            output.commit({'lines_written': i + 1})
+    output.finish()
+
+
+def test_resumed_output_is_bit_identical(tmpdir):
+    config = {'inputs': ['a', 1]}
+    full_fpath = str(tmpdir.join('full.txt.gz'))
+    _write(CheckpointedGzipOutput(full_fpath, config), 0)
+    with gzip.open(full_fpath, 'rt') as f:
+        assert f.readlines() == LINES
+    fpath = str(tmpdir.join('resumed.txt.gz'))
+    _write(CheckpointedGzipOutput(fpath, config), 0, stop_at=25)
+    assert os.path.isfile(checkpoint_fpath(fpath))
+    output = CheckpointedGzipOutput(fpath, config)
+    assert output.resumed
+    assert output.progress == {'lines_written': 20}
+    _write(output, output.progress['lines_written'])
+    assert not os.path.isfile(checkpoint_fpath(fpath))
+    with open(fpath, 'rb') as f, open(full_fpath, 'rb') as full_f:
+        assert f.read() == full_f.read()
+    # a checkpoint of a different configuration is ignored
+    _write(CheckpointedGzipOutput(fpath, config), 0, stop_at=25)
+    assert not CheckpointedGzipOutput(fpath, {'inputs': ['b', 1]}).resumed
+
+
+def test_skip_lines(tmpdir):
+    fpath = str(tmpdir.join('lines.txt'))
+    with open(fpath, 'wt') as f:
+        f.write(''.join(LINES[:5]))
+    with open(fpath, 'rt') as f:
+        assert skip_lines(f, 3) == LINES[2]
+        assert f.readline() == LINES[3]
+        assert skip_lines(f, 10) == LINES[4]
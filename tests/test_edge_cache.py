@@ -0,0 +1,53 @@
+"""Testing the binary edge cache."""
+
+import zipfile
+
+import numpy as np
+import pytest
+
+from twikwak17.edge_cache import (
+    EdgeCacheWriter,
+    iter_edge_cache_chunks,
+    open_edge_cache,
+    source_signature,
+)
+
+
+def _write_zip(fpath, text):
+    with zipfile.ZipFile(fpath, 'w', zipfile.ZIP_DEFLATED) as zip_f:
+        zip_f.writestr('edges.net', text)
+
+
+def test_edge_cache_roundtrip(tmpdir):
+    zip_fpath = str(tmpdir.join('edges.zip'))
+    cache_fpath = str(tmpdir.join('edges.bin'))
+    _write_zip(zip_fpath, '1\t2\n3\t4\n5\t6\n')
+    signature = source_signature(zip_fpath, 'edges.net')
+    assert open_edge_cache(cache_fpath, signature) == (None, None)
+    writer = EdgeCacheWriter(cache_fpath, signature)
+    writer.add(np.array([[1, 2], [3, 4]]))
+    writer.add(np.array([[5, 6]]), malformed_lines=2)
+    assert open_edge_cache(cache_fpath, signature) == (None, None)
+    writer.finish()
+    edges, header = open_edge_cache(cache_fpath, signature)
+    assert edges.tolist() == [[1, 2], [3, 4], [5, 6]]
+    assert header['malformed_lines'] == 2
+    chunks = list(iter_edge_cache_chunks(edges, chunk_edges=2))
+    assert [chunk.tolist() for chunk in chunks] == [[[1, 2], [3, 4]], [[5, 6]]]
+
+    _write_zip(zip_fpath, '1\t2\n3\t4\n')
+    assert open_edge_cache(
+        cache_fpath, source_signature(zip_fpath, 'edges.net')) == (None, None)
+    with open(cache_fpath, 'ab') as f:
+        f.write(b'\0')
+    assert open_edge_cache(cache_fpath, signature) == (None, None)
+
+
+def test_edge_cache_writer_range(tmpdir):
+    cache_fpath = str(tmpdir.join('edges.bin'))
+    writer = EdgeCacheWriter(cache_fpath, {})
+    with pytest.raises(ValueError):
+        writer.add(np.array([[1, 2 ** 33]]))
+    writer.abort()
+    assert not tmpdir.join('edges.bin.tmp').exists()
+    assert not tmpdir.join('edges.bin').exists()
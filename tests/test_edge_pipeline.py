@@ -0,0 +1,76 @@
+"""Testing the shared-memory edge filtering pipeline."""
+
+import io
+
+import numpy as np
+import pytest
+
+from twikwak17.edges import format_int_pairs
+from twikwak17.uid_bitmap import UidBitmap
+from twikwak17.node_index import (
+    NodeIndex,
+    write_node_index,
+)
+from twikwak17.binary_edges import (
+    BinaryEdgeList,
+    BinaryEdgeListWriter,
+    INDEX_COLUMNS,
+    UID_COLUMNS,
+)
+from twikwak17.edge_pipeline import filter_edge_list_in_parallel
+
+
+def test_filter_edge_list_in_parallel(tmpdir):
+    rng = np.random.RandomState(0)
+    uids = np.unique(rng.randint(0, 5000, size=1000))
+    edges = rng.randint(0, 5000, size=(5000, 2))
+    uid_bitmap_dpath = str(tmpdir.join('uid_bitmap'))
+    UidBitmap.from_uids(uids).save(uid_bitmap_dpath)
+    out_f = io.BytesIO()
+    counts = filter_edge_list_in_parallel(
+        io.BytesIO(format_int_pairs(edges)), out_f, 2,
+        uid_bitmap_dpath=uid_bitmap_dpath, block_bytes=1000)
+    keep = np.isin(edges, uids).all(axis=1)
+    assert out_f.getvalue() == format_int_pairs(edges[keep])
+    assert counts == {
+        'edges_read': 5000, 'edges_dumped': int(keep.sum()),
+        'malformed_lines': 0}
+
+
+def test_filter_edge_list_in_parallel_worker_failure(tmpdir):
+    with pytest.raises(RuntimeError):
+        filter_edge_list_in_parallel(
+            io.BytesIO(b"1 2\n" * 100), io.BytesIO(), 2,
+            uid_bitmap_dpath=str(tmpdir.join('missing')))
+
+
+@pytest.mark.parametrize('n_uids', [1000, 5000])
+def test_filter_edge_list_in_parallel_dense_and_binary(tmpdir, n_uids):
+    # with all users kept, raw pairs outgrow the output buffers and are
+    # sent through the result queue instead
+    rng = np.random.RandomState(1)
+    uids = np.unique(rng.randint(0, 5000, size=n_uids))
+    edges = rng.randint(0, 5000, size=(5000, 2))
+    node_index_dpath = str(tmpdir.join('node_index'))
+    write_node_index(uids, np.zeros(len(uids)), node_index_dpath)
+    binary_dpath = str(tmpdir.join('edges'))
+    binary_writer = BinaryEdgeListWriter(
+        binary_dpath, UID_COLUMNS + INDEX_COLUMNS)
+    out_f = io.BytesIO()
+    dense_out_f = io.BytesIO()
+    counts = filter_edge_list_in_parallel(
+        io.BytesIO(format_int_pairs(edges)), out_f, 2,
+        node_index_dpath=node_index_dpath, dense_out_f=dense_out_f,
+        binary_writer=binary_writer, block_bytes=1000)
+    binary_writer.finish()
+    keep = np.isin(edges, uids).all(axis=1)
+    kept_indices = NodeIndex(node_index_dpath).lookup(
+        edges[keep].ravel()).reshape(-1, 2)
+    assert out_f.getvalue() == format_int_pairs(edges[keep])
+    assert dense_out_f.getvalue() == format_int_pairs(kept_indices)
+    binary_edges = BinaryEdgeList(binary_dpath)
+    assert np.concatenate(list(binary_edges.iter_pairs())).tolist() == (
+        edges[keep].tolist())
+    assert binary_edges.column('src_index').tolist() == (
+        kept_indices[:, 0].tolist())
+    assert counts['edges_dumped'] == int(keep.sum())
@@ -0,0 +1,54 @@
+"""Testing vectorized edge list parsing and formatting."""
+
+import io
+
+import numpy as np
+
+from twikwak17.edges import (
+    parse_int_pairs,
+    iter_int_pair_blocks,
+    is_in_sorted,
+    lookup_sorted,
+    format_int_pairs,
+)
+
+
+def test_parse_int_pairs_well_formed():
+    pairs, malformed = parse_int_pairs(b"12\t34\n5 6\n")
+    assert pairs.tolist() == [[12, 34], [5, 6]]
+    assert malformed == 0
+
+
+def test_parse_int_pairs_malformed():
+    data = b"12\t34\n\n5 6\n7\n8 9 10\n1234567890123456789 1\n0\t0"
+    pairs, malformed = parse_int_pairs(data)
+    assert pairs.tolist() == [[12, 34], [5, 6], [0, 0]]
+    assert malformed == 3
+
+
+def test_iter_int_pair_blocks_across_block_boundaries():
+    rng = np.random.RandomState(0)
+    edges = rng.randint(0, 10 ** 9, size=(1000, 2))
+    data = "".join(f"{a}\t{b}\n" for a, b in edges.tolist()).encode()
+    counts = {}
+    blocks = list(iter_int_pair_blocks(io.BytesIO(data[:-1]), 100, counts))
+    assert np.concatenate(blocks).tolist() == edges.tolist()
+    assert counts['pairs'] == 1000
+    assert counts['bytes_read'] == len(data) - 1
+
+
+def test_is_in_sorted_and_format_int_pairs():
+    edges = np.array([[3, 10], [0, 7], [10, 3]])
+    keep = is_in_sorted(np.array([3, 7, 10]), edges).all(axis=1)
+    assert keep.tolist() == [True, False, True]
+    assert format_int_pairs(edges) == b"3 10\n0 7\n10 3\n"
+    assert format_int_pairs(np.empty((0, 2))) == b""
+
+
+def test_lookup_sorted():
+    indices, found = lookup_sorted(
+        np.array([3, 7, 10]), np.array([[10, 0], [7, 11]]))
+    assert found.tolist() == [[True, False], [True, False]]
+    assert indices[found].tolist() == [2, 1]
+    indices, found = lookup_sorted(np.empty(0, dtype=np.int64), [4, 5])
+    assert not found.any() and indices.shape == (2,)
@@ -0,0 +1,30 @@
+"""Testing the external sort."""
+
+import os
+
+import numpy as np
+
+from twikwak17.extsort import ExternalSorter
+
+
+def test_external_sort_merges_runs(tmpdir):
+    rng = np.random.RandomState(0)
+    keys = rng.randint(0, 500, size=2000)
+    payloads = rng.randint(0, 2, size=2000)
+    dpath = str(tmpdir.join('runs'))
+    with ExternalSorter(dpath, run_size=300, n_workers=2) as sorter:
+        for start in range(0, len(keys), 170):
+            sorter.add(keys[start:start + 170], payloads[start:start + 170])
+        blocks = list(sorter.iter_sorted(block_size=64))
+        assert len(os.listdir(dpath)) == 2 * 6
+    assert not os.path.exists(dpath)
+    sorted_keys = np.concatenate([block[0] for block in blocks])
+    sorted_payloads = np.concatenate([block[1] for block in blocks])
+    assert sorted_keys.tolist() == sorted(keys.tolist())
+    assert sorted(zip(sorted_keys.tolist(), sorted_payloads.tolist())) == \
+        sorted(zip(keys.tolist(), payloads.tolist()))
+
+
+def test_external_sort_empty(tmpdir):
+    with ExternalSorter(str(tmpdir.join('runs'))) as sorter:
+        assert list(sorter.iter_sorted()) == []
@@ -0,0 +1,60 @@
+"""Testing sharded SPEKS feature caches."""
+
+import random
+
+import pytest
+from speks import predict_gender_by_tweets
+from speks.gender_lex import GENDER_LEXICON
+
+from twikwak17.gender import SpeksLexiconModel
+from twikwak17.feature_cache import (
+    FeatureCache,
+    FeatureCacheWriter,
+    feature_cache_exists,
+)
+
+
+def test_feature_cache_rescoring(tmpdir):
+    dpath = str(tmpdir.join('features'))
+    rand = random.Random(5)
+    words = list(GENDER_LEXICON.keys())[:200] + ['qwzx', 'lol']
+    texts = [
+        ' '.join(rand.choice(words) for _ in range(rand.randint(0, 40)))
+        for _ in range(250)
+    ]
+    users = [f'user{i:03d}' for i in range(len(texts))]
+    model = SpeksLexiconModel()
+    with FeatureCacheWriter(
+            dpath, vocab=model.vocab.keys(), shard_rows=60) as writer:
+        for start in range(0, len(texts), 25):
+            predictions, features = model.predict_with_features(
+                texts[start:start+25])
+            writer.add(users[start:start+25], features)
+    assert feature_cache_exists(dpath)
+    cache = FeatureCache(dpath)
+    assert len(cache) == len(texts)
+    assert len(cache.shard_sizes) == 4
+    rescored_users = []
+    rescored = []
+    for chunk_users, predictions in cache.iter_predictions(model, 40):
+        rescored_users.extend(chunk_users)
+        rescored.extend(predictions.tolist())
+    assert rescored_users == users
+    assert rescored == [predict_gender_by_tweets(text) for text in texts]
+    with pytest.raises(ValueError):
+        next(cache.iter_predictions(SpeksLexiconModel(lexicon={'x1y2': 1})))
+
+
+def test_feature_cache_writer_discards_interrupted_cache(tmpdir):
+    dpath = str(tmpdir.join('features'))
+    model = SpeksLexiconModel()
+    inputs = [['/some/tweets.gz', 10, 20]]
+    with FeatureCacheWriter(
+            dpath, vocab=model.vocab.keys(), inputs=inputs) as writer:
+        writer.add(['u1'], model.predict_with_features(['man'])[1])
+    assert FeatureCache(dpath).inputs == inputs
+    with pytest.raises(KeyboardInterrupt):
+        with FeatureCacheWriter(dpath, vocab=model.vocab.keys()) as writer:
+            writer.add(['u1'], model.predict_with_features(['man'])[1])
+            raise KeyboardInterrupt
+    assert not feature_cache_exists(dpath)
@@ -0,0 +1,53 @@
+"""Testing batched, vectorized SPEKS gender prediction."""
+
+import random
+from collections import Counter
+
+from speks import predict_gender_by_tweets
+from speks.gender_lex import GENDER_LEXICON
+
+from twikwak17.gender import (
+    SpeksLexiconModel,
+    word_prefix,
+)
+
+
+def test_predict_matches_per_user_speks():
+    rand = random.Random(7)
+    words = list(GENDER_LEXICON.keys())[:300] + [
+        ':D', '&amp;', '&#65;', 'Hello', '@bob', '#tag', 'qwzx']
+    texts = [
+        ' '.join(rand.choice(words) for _ in range(rand.randint(0, 80)))
+        for _ in range(500)
+    ] + ['', ' \n']
+    model = SpeksLexiconModel()
+    predictions = model.predict(texts, bucket_size=37)
+    assert predictions.tolist() == [
+        predict_gender_by_tweets(text) for text in texts]
+    assert model.predict_one(texts[0]) == predict_gender_by_tweets(texts[0])
+
+
+def test_predict_adaptive():
+    rand = random.Random(11)
+    words = list(GENDER_LEXICON.keys())[:300]
+    texts = [
+        ' '.join(rand.choice(words) for _ in range(rand.randint(1, 60)))
+        for _ in range(300)
+    ]
+    model = SpeksLexiconModel()
+    stats = Counter()
+    predictions = model.predict_adaptive(
+        texts, margin=2, prefix_words=[5, 20], stats=stats)
+    assert predictions.tolist() == model.predict(texts).tolist()
+    assert stats['exit_5'] == stats['exit_20'] == 0
+    assert stats['exit_full'] == len(texts)
+    stats = Counter()
+    predictions = model.predict_adaptive(
+        texts, margin=0, prefix_words=[5], validation_every=1, stats=stats)
+    long_texts = [text for text in texts if word_prefix(text, 5) is not None]
+    assert stats['exit_5'] == stats['validated'] == len(long_texts)
+    assert stats['exit_full'] == len(texts) - len(long_texts)
+    assert predictions.tolist() == [
+        predict_gender_by_tweets(word_prefix(text, 5) or text)
+        for text in texts
+    ]
@@ -0,0 +1,57 @@
+"""Testing single-pass multi-model scoring and gender columns."""
+
+import os
+import random
+
+import pytest
+import numpy as np
+from speks import predict_gender_by_tweets
+from speks.gender_lex import GENDER_LEXICON
+
+from twikwak17.gender import (
+    MultiModelScorer,
+    SpeksLexiconModel,
+)
+from twikwak17.gender_columns import (
+    MODELS_FNAME,
+    GenderColumnsWriter,
+    load_gender_columns,
+)
+
+
+def test_multi_model_scoring_to_columns(tmpdir):
+    dpath = str(tmpdir.join('columns'))
+    rand = random.Random(11)
+    words = list(GENDER_LEXICON.keys())[:200] + ['qwzx', 'lol']
+    texts = [
+        ' '.join(rand.choice(words) for _ in range(rand.randint(0, 40)))
+        for _ in range(120)
+    ]
+    other = SpeksLexiconModel(
+        lexicon={'lol': 0.5, 'qwzx': -0.25}, threshold=0.1, name='other')
+    models = [SpeksLexiconModel(), other]
+    scorer = MultiModelScorer(models)
+    assert scorer.names == ['speks', 'other']
+    with GenderColumnsWriter(dpath, models, with_scores=True) as writer:
+        for start in range(0, len(texts), 50):
+            writer.add(*scorer.predict(texts[start:start+50]))
+    meta, genders, scores = load_gender_columns(dpath)
+    assert meta['user_count'] == len(texts)
+    assert genders['speks'].tolist() == [
+        predict_gender_by_tweets(text) for text in texts]
+    assert genders['other'].tolist() == other.predict(texts).tolist()
+    assert np.allclose(scores['other'], other.scores(texts), atol=1e-6)
+
+
+def test_gender_columns_writer_discards_interrupted_columns(tmpdir):
+    dpath = str(tmpdir.join('columns'))
+    models = [SpeksLexiconModel()]
+    scorer = MultiModelScorer(models)
+    with GenderColumnsWriter(dpath, models) as writer:
+        writer.add(*scorer.predict(['man']))
+    assert load_gender_columns(dpath)[0]['user_count'] == 1
+    with pytest.raises(KeyboardInterrupt):
+        with GenderColumnsWriter(dpath, models) as writer:
+            writer.add(*scorer.predict(['man', 'woman']))
+            raise KeyboardInterrupt
+    assert not os.path.exists(os.path.join(dpath, MODELS_FNAME))
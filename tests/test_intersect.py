@@ -0,0 +1,36 @@
+"""Testing the block-wise intersection of sorted username lists."""
+
+import random
+
+from twikwak17.intersect import iter_sorted_intersection
+
+
+def _blocks(keys, sizes):
+    i = 0
+    for size in sizes:
+        yield keys[i:i+size]
+        i += size
+    if i < len(keys):
+        yield keys[i:]
+
+
+def test_iter_sorted_intersection_across_block_boundaries():
+    rand = random.Random(17)
+    pool = sorted({
+        ''.join(rand.choice('abcd_') for _ in range(rand.randint(1, 8)))
+        for _ in range(3000)
+    })
+    pool = [p.encode() for p in pool]
+    left = sorted(rand.sample(pool, 900))
+    right = sorted(rand.sample(pool, 1500))
+    left_sizes = [rand.randint(0, 40) for _ in range(100)]
+    right_sizes = [rand.randint(0, 70) for _ in range(100)]
+    counts = {}
+    common = [
+        key
+        for block in iter_sorted_intersection(
+            _blocks(left, left_sizes), _blocks(right, right_sizes), counts)
+        for key in block.tolist()
+    ]
+    assert common == sorted(set(left) & set(right))
+    assert counts['left'] <= len(left)
@@ -0,0 +1,44 @@
+"""Testing latency histograms and classification profiles."""
+
+import io
+
+from twikwak17.latency import (
+    LatencyHistogram,
+    ClassificationProfile,
+    TimedReader,
+    length_bucket_name,
+)
+
+
+def test_latency_histogram_precision():
+    hist = LatencyHistogram()
+    for value_us in range(1, 100001):
+        hist.record(value_us / 1e6)
+    assert hist.count == 100000
+    assert hist.min_us == 1 and hist.max_us == 100000
+    for percent in (50, 90, 99):
+        expected = percent * 1000
+        assert abs(hist.percentile(percent) - expected) <= 0.035 * expected
+    assert hist.percentile(100) == 100000
+    summary = hist.to_dict()
+    assert sum(count for _, count in summary['buckets']) == 100000
+    assert len(summary['buckets']) < 500
+
+
+def test_classification_profile():
+    profile = ClassificationProfile()
+    reader = TimedReader(io.StringIO('a 1\nb 2\n'), profile)
+    assert reader.readline() == 'a 1\n'
+    users = ['light', 'heavy', 'medium']
+    profile.record_batch(users, [10, 20000, 1000], 1.0)
+    profile.record_dump(3, 0.01)
+    result = profile.to_dict()
+    assert result['stages']['read']['count'] == 1
+    assert result['stages']['score']['count'] == 1
+    assert list(result['user_latency_by_tweet_chars']) == [
+        length_bucket_name(10), length_bucket_name(1000),
+        length_bucket_name(20000)]
+    assert [u['user'] for u in result['slowest_users']] == [
+        'heavy', 'medium', 'light']
+    assert result['throughput'][-1]['users'] == 3
+    assert result['throughput'][-1]['chars_read'] == 4
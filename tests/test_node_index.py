@@ -0,0 +1,26 @@
+"""Testing the dense node index."""
+
+import gzip
+
+from twikwak17.node_index import (
+    NOT_FOUND,
+    NodeIndex,
+    build_node_index,
+    node_index_exists,
+)
+
+
+def test_node_index(tmpdir):
+    uid2gender_fpath = str(tmpdir.join('uid2gender.txt.gz'))
+    dpath = str(tmpdir.join('node_index'))
+    with gzip.open(uid2gender_fpath, 'wt') as f:
+        f.write('900 1\n12 0\n5000000000 1\n12 1\nbad\n77 0\n')
+    assert not node_index_exists(dpath)
+    assert build_node_index(uid2gender_fpath, dpath) == 4
+    assert node_index_exists(dpath)
+    index = NodeIndex(dpath)
+    assert len(index) == 4
+    assert index.uid_by_index.tolist() == [12, 77, 900, 5000000000]
+    assert index.gender_by_index.tolist() == [1, 0, 1, 1]
+    assert index.lookup([900, 13, 12, 5000000000, 6000000000]).tolist() == [
+        2, NOT_FOUND, 0, 3, NOT_FOUND]
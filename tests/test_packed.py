@@ -0,0 +1,22 @@
+"""Testing packed string arrays."""
+
+import numpy as np
+
+from twikwak17.packed import PackedStrings
+
+
+STRINGS = [b'bobo34', b'_', b'__asd7', b'bob', b'', b'zed_zed_zed', b'bobo']
+
+
+def test_packed_strings_roundtrip():
+    packed = PackedStrings.from_list(STRINGS)
+    assert len(packed) == len(STRINGS)
+    assert packed.tolist() == STRINGS
+    assert packed[5] == b'zed_zed_zed'
+    assert packed.max_len() == 11
+
+
+def test_padded_sort_order_is_byte_order():
+    packed = PackedStrings.from_list(STRINGS)
+    order = np.argsort(packed.padded(), kind='stable')
+    assert packed.take(order).tolist() == sorted(STRINGS)
@@ -0,0 +1,74 @@
+"""Testing phase 2 functionalities."""
+
+import os
+import gzip
+import random
+
+from twikwak17.phases.phase2 import (
+    USR_FNAME_MARKER,
+    inverse_numeric2screen_into_multiple_files,
+)
+from twikwak17.shared import (
+    phase_output_report_fpath,
+    uname2id_fpath_by_dpath,
+    kwak10_unames_fpath_by_dpath,
+)
+from twikwak17.phases import phase2
+
+
+N_USERS = 25000
+
+
+def _write_numeric2screen(kpath):
+    rand = random.Random(17)
+    lines = []
+    for uid in range(1, N_USERS + 1):
+        uname = 'User{}'.format(rand.randint(0, 10 ** 9))
+        lines.append(f'{uid} {uname}\n')
+        # a username re-assigned right after, within the same run
+        if uid % 1000 == 0:
+            lines.append(f'{uid + 10 ** 6} {uname.upper()}\n')
+    # a username of the first run re-assigned in the last one
+    lines.append('{} {}'.format(
+        2 * 10 ** 6, lines[0].split()[1]) + '\n')
+    with open(os.path.join(kpath, 'numeric2screen'), 'wt') as f:
+        f.write(''.join(lines))
+
+
+def _read(fpath):
+    with gzip.open(fpath, 'rt') as f:
+        return f.read()
+
+
+def test_phase2_in_memory_and_spilled_outputs_match(tmpdir):
+    kpath = str(tmpdir.mkdir('kwak10'))
+    _write_numeric2screen(kpath)
+    in_mem_dpath = str(tmpdir.mkdir('in_memory'))
+    spill_dpath = str(tmpdir.mkdir('spilled'))
+
+    assert inverse_numeric2screen_into_multiple_files(
+        in_mem_dpath, kpath) == 0
+    assert inverse_numeric2screen_into_multiple_files(
+        spill_dpath, kpath, mem_budget_mb=0) == 3
+    assert not os.path.exists(uname2id_fpath_by_dpath(spill_dpath))
+    assert len([
+        fname for fname in os.listdir(spill_dpath)
+        if fname.startswith(USR_FNAME_MARKER)]) == 3
+
+    phase2(in_mem_dpath, kpath=kpath)
+    phase2(spill_dpath, kpath=kpath, mem_budget_mb=0)
+    with open(phase_output_report_fpath(2, in_mem_dpath), 'rt') as f:
+        assert 'No run files to merge; skipping.' in f.read()
+    with open(phase_output_report_fpath(2, spill_dpath), 'rt') as f:
+        assert 'Found 3 files to merge.' in f.read()
+    uname2id = _read(uname2id_fpath_by_dpath(in_mem_dpath))
+    assert uname2id == _read(uname2id_fpath_by_dpath(spill_dpath))
+    lines = uname2id.splitlines()
+    assert len(lines) == len(set(line.split()[0] for line in lines))
+    assert lines == sorted(lines, key=lambda line: line.split()[0].encode())
+    # the last of several lines with the same username is kept
+    reassigned = [line for line in lines if int(line.split()[1]) > 10 ** 6]
+    assert len(reassigned) == N_USERS // 1000 + 1
+    assert not any(line.endswith(' 1') for line in lines)
+    assert _read(kwak10_unames_fpath_by_dpath(in_mem_dpath, sorted=True)) == (
+        _read(kwak10_unames_fpath_by_dpath(spill_dpath, sorted=True)))
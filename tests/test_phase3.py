@@ -0,0 +1,95 @@
+"""Testing phase 3 functionalities."""
+
+import os
+import gzip
+import random
+
+from twikwak17.shared import (
+    t7_user_list_fpath_by_dpath,
+    kwak10_unames_fpath_by_dpath,
+    uname_intersection_fpath_by_dpath,
+    phase_output_report_fpath,
+)
+from twikwak17.block_index import index_sorted_username_file
+from twikwak17.phases import phase3
+
+
+def _random_unames(rand, count):
+    return {
+        ''.join(rand.choice('abcdefgh_') for _ in range(rand.randint(1, 9)))
+        for _ in range(count)
+    }
+
+
+def _write_unames(fpath, unames):
+    with gzip.open(fpath, 'wt') as f:
+        f.write(''.join(f'{uname}\n' for uname in sorted(unames)))
+
+
+def _make_inputs(tmpdir, t7_count, k10_count):
+    rand = random.Random(17)
+    pool = sorted(_random_unames(rand, 3 * max(t7_count, k10_count)))
+    t7_unames = set(rand.sample(pool, t7_count)) | {'_'}
+    k10_unames = set(rand.sample(pool, k10_count)) | {'_'}
+    dpaths = [str(tmpdir.mkdir(f'phase{i}')) for i in (1, 2, 3)]
+    _write_unames(t7_user_list_fpath_by_dpath(dpaths[0], sorted=True),
+                  t7_unames)
+    _write_unames(kwak10_unames_fpath_by_dpath(dpaths[1], sorted=True),
+                  k10_unames)
+    expected = ''.join(
+        f'{uname}\n' for uname in sorted(t7_unames & k10_unames - {'_'}))
+    return dpaths, expected
+
+
+def _read(fpath):
+    with gzip.open(fpath, 'rt') as f:
+        return f.read()
+
+
+def _report(dpath):
+    with open(phase_output_report_fpath(3, dpath), 'rt') as f:
+        return f.read()
+
+
+def test_phase3_intersects_block_wise_by_default(tmpdir):
+    dpaths, expected = _make_inputs(tmpdir, 3000, 5000)
+    out_fpath = uname_intersection_fpath_by_dpath(dpaths[2])
+
+    phase3(*dpaths)
+    assert 'Galloping over' not in _report(dpaths[2])
+    assert _read(out_fpath) == expected
+
+
+def test_phase3_gallops_over_indexed_username_files(tmpdir):
+    dpaths, expected = _make_inputs(tmpdir, 300, 5000)
+    t7_fpath = t7_user_list_fpath_by_dpath(dpaths[0], sorted=True)
+    k10_fpath = kwak10_unames_fpath_by_dpath(dpaths[1], sorted=True)
+    with gzip.open(k10_fpath, 'rt') as f:
+        k10_text = f.read()
+    for fpath in [t7_fpath, k10_fpath]:
+        index_sorted_username_file(fpath, block_lines=64)
+    with gzip.open(k10_fpath, 'rt') as f:
+        assert f.read() == k10_text
+
+    phase3(*dpaths)
+    assert 'Galloping over the block index of' in _report(dpaths[2])
+    assert _read(uname_intersection_fpath_by_dpath(dpaths[2])) == expected
+
+
+def test_phase3_intersects_username_ranges_in_parallel(tmpdir):
+    dpaths, expected = _make_inputs(tmpdir, 4000, 5000)
+    for fpath in [
+            t7_user_list_fpath_by_dpath(dpaths[0], sorted=True),
+            kwak10_unames_fpath_by_dpath(dpaths[1], sorted=True)]:
+        index_sorted_username_file(fpath, block_lines=64)
+    out_fpath = uname_intersection_fpath_by_dpath(dpaths[2])
+
+    phase3(*dpaths)
+    sequential = _read(out_fpath)
+    assert sequential == expected
+
+    phase3(*dpaths, n_workers=2)
+    report = _report(dpaths[2])
+    assert 'Intersecting 8 username ranges with 2 worker processes' in report
+    assert _read(out_fpath) == sequential
+    assert not any('.part' in fname for fname in os.listdir(dpaths[2]))
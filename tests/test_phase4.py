@@ -1,6 +1,26 @@
 """Testing phase 4 functionalities."""
 
-from twikwak17.phases.phase4 import uname_and_tweets_from_line
+import os
+import gzip
+import random
+
+from speks import predict_gender_by_tweets
+from speks.gender_lex import GENDER_LEXICON
+
+from twikwak17.shared import (
+    gender_prediction_cache_fpath_by_dpath,
+    phase_output_report_fpath,
+    twitter7_tweet_list_fpath_by_dpath,
+    uname_intersection_fpath_by_dpath,
+    uname_to_gender_map_fpath_by_dpath,
+)
+from twikwak17.phases import phase4
+from twikwak17.phases.phase4 import (
+    IN_FLIGHT_BATCHES_PER_WORKER,
+    uname_and_tweets_from_line,
+    iter_user_batches,
+    _iter_classified,
+)
 
 
 USERS = [' df9k', '  39048fd', '__asd7', 'bobo34', 'terk*#4']
@@ -21,3 +41,101 @@ def test_uname_and_tweets_from_line():
         ruser, rtweets = uname_and_tweets_from_line(line)
         assert ruser == user
         assert rtweets == tweets
+
+
+def test_iter_user_batches():
+    pairs = list(zip(USERS, TWEETS))
+    batches = list(iter_user_batches(pairs, max_users=2, max_chars=50))
+    assert [users for users, _ in batches] == [
+        USERS[0:2], USERS[2:4], USERS[4:5]]
+    batches = list(iter_user_batches(pairs, max_users=10, max_chars=40))
+    assert [users for users, _ in batches] == [
+        USERS[0:2], USERS[2:3], USERS[3:4], USERS[4:5]]
+    assert [t for _, tweets in batches for t in tweets] == TWEETS
+
+
+def _write_gz_lines(fpath, lines):
+    with gzip.open(fpath, 'wt') as f:
+        f.write(''.join(f'{line}\n' for line in lines))
+
+
+def _write_phase4_inputs(tmpdir):
+    dpaths = [str(tmpdir.mkdir(f'phase{i}')) for i in (1, 3, 4)]
+    unames = sorted(user.strip() for user in USERS)
+    tweets_fpath = twitter7_tweet_list_fpath_by_dpath(dpaths[0], sorted=False)
+    _write_gz_lines(tweets_fpath, [
+        f'{uname} {tweets}' for uname, tweets in zip(unames, TWEETS)])
+    _write_gz_lines(uname_intersection_fpath_by_dpath(dpaths[1]), unames)
+    return dpaths, unames, tweets_fpath
+
+
+def _run_phase4(dpaths, **kwargs):
+    phase4(*dpaths, **kwargs)
+    with open(phase_output_report_fpath(4, dpaths[2]), 'rt') as f:
+        report = f.read()
+    with gzip.open(uname_to_gender_map_fpath_by_dpath(dpaths[2]), 'rt') as f:
+        return report, f.read()
+
+
+def test_phase4_profiles_only_when_asked(tmpdir):
+    dpaths, unames, _ = _write_phase4_inputs(tmpdir)
+    expected = ''.join(
+        f'{uname} {predict_gender_by_tweets(tweets)}\n'
+        for uname, tweets in zip(unames, TWEETS))
+    report, output = _run_phase4(dpaths)
+    assert 'Classification profile:' not in report
+    assert output == expected
+    report, output = _run_phase4(dpaths, profile=True)
+    assert 'Classification profile:' in report
+    assert output == expected
+
+
+def test_phase4_rescores_only_a_current_feature_cache(tmpdir):
+    dpaths, unames, tweets_fpath = _write_phase4_inputs(tmpdir)
+
+    _, classified = _run_phase4(dpaths, save_features=True)
+    report, rescored = _run_phase4(dpaths, rescore=True)
+    assert 'Rescoring the users of' in report
+    assert rescored == classified
+
+    # tweets appended after the cache was saved make it stale
+    _write_gz_lines(tweets_fpath, [
+        f'{uname} {tweets} man man' for uname, tweets in zip(unames, TWEETS)])
+    report, _ = _run_phase4(dpaths, rescore=True)
+    assert 'was saved from other input files' in report
+    assert 'Rescoring the users of' not in report
+
+
+def test_iter_classified_keeps_input_order_with_workers():
+    rand = random.Random(3)
+    words = list(GENDER_LEXICON.keys())[:300]
+    # batches of very different sizes, so workers finish them out of order
+    jobs = [
+        (i, [
+            ' '.join(rand.choice(words)
+                     for _ in range(rand.randint(0, 4000 if i % 3 else 5)))
+            for _ in range(rand.randint(1, 6))])
+        for i in range(4 * 2 * IN_FLIGHT_BATCHES_PER_WORKER)
+    ]
+    expected = [
+        (i, [predict_gender_by_tweets(tweets) for tweets in tweets_list])
+        for i, tweets_list in jobs
+    ]
+    sequential = [
+        (i, list(genders)) for i, genders, _ in _iter_classified(jobs)]
+    assert sequential == expected
+    parallel = [
+        (i, list(genders))
+        for i, genders, _ in _iter_classified(jobs, n_workers=2)]
+    assert parallel == expected
+
+
+def test_phase4_uses_the_prediction_cache_only_when_asked(tmpdir):
+    dpaths, _, _ = _write_phase4_inputs(tmpdir)
+    cache_fpath = gender_prediction_cache_fpath_by_dpath(dpaths[2])
+    _, classified = _run_phase4(dpaths)
+    assert not os.path.exists(cache_fpath)
+    report, cached = _run_phase4(dpaths, use_cache=True)
+    assert 'Using the gender prediction cache' in report
+    assert os.path.exists(cache_fpath)
+    assert cached == classified
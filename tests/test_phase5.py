@@ -0,0 +1,106 @@
+"""Testing phase 5 functionalities."""
+
+import gzip
+
+import pytest
+
+from twikwak17.extsort import ExternalSorter
+from twikwak17.shared import (
+    phase_output_report_fpath,
+    uname2id_fpath_by_dpath,
+    uname_index_dpath_by_dpath,
+    uname_to_gender_map_fpath_by_dpath,
+    uid_to_gender_map_fpath_by_dpath,
+)
+from twikwak17.uname_index import build_uname_index_from_file
+from twikwak17.phases import phase5
+from twikwak17.phases.phase5 import (
+    iter_last_of_each_uname,
+    convert_uname2gender_map_by_merge_join,
+    dump_uid_sorted_maps,
+)
+
+
+UNAME2ID_LINES = [
+    'aa 1\n', 'ab 2\n', 'ab 3\n', 'bad_line\n', 'b_x nan\n', 'c 5\n',
+    'c 6\n', 'c 7\n', 'dd 8\n',
+]
+UNAME2GENDER_LINES = [
+    'a 1\n', 'ab 0\n', 'b_x 1\n', 'c 1\n', 'cc 0\n', 'dd 1\n',
+]
+
+
+def test_iter_last_of_each_uname():
+    pairs = [('a', '1'), ('b', '2'), ('b', '3'), ('c', '4')]
+    assert list(iter_last_of_each_uname(pairs)) == [
+        ('a', '1'), ('b', '3'), ('c', '4')]
+    with pytest.raises(ValueError):
+        list(iter_last_of_each_uname([('b', '1'), ('a', '2')]))
+
+
+def test_convert_uname2gender_map_by_merge_join(tmpdir):
+    uname2id_fpath = str(tmpdir.join('uname2id.txt.gz'))
+    uname2gender_fpath = str(tmpdir.join('uname2gender.txt.gz'))
+    uid2gender_fpath = str(tmpdir.join('uid2gender.txt.gz'))
+    uid_list_fpath = str(tmpdir.join('uids.txt.gz'))
+    with gzip.open(uname2id_fpath, 'wt') as f:
+        f.write(''.join(UNAME2ID_LINES))
+    with gzip.open(uname2gender_fpath, 'wt') as f:
+        f.write(''.join(UNAME2GENDER_LINES))
+    dumped = convert_uname2gender_map_by_merge_join(
+        uname2gender_fpath, uname2id_fpath, uid2gender_fpath, uid_list_fpath)
+    assert dumped == 3
+    with gzip.open(uid2gender_fpath, 'rt') as f:
+        assert f.read() == '3 0\n7 1\n8 1\n'
+    with gzip.open(uid_list_fpath, 'rt') as f:
+        assert f.read() == '3\n7\n8\n'
+
+
+def test_dump_uid_sorted_maps(tmpdir):
+    uname2id_fpath = str(tmpdir.join('uname2id.txt.gz'))
+    uname2gender_fpath = str(tmpdir.join('uname2gender.txt.gz'))
+    with gzip.open(uname2id_fpath, 'wt') as f:
+        f.write(''.join(['a 9\n', 'b 4\n', 'c 7\n', 'd 1\n']))
+    with gzip.open(uname2gender_fpath, 'wt') as f:
+        f.write(''.join(['a 1\n', 'b 0\n', 'c 1\n', 'd 0\n']))
+    uid2gender_fpath = str(tmpdir.join('uid2gender_sorted.txt.gz'))
+    uid_list_fpath = str(tmpdir.join('uids_sorted.txt.gz'))
+    with ExternalSorter(str(tmpdir.join('runs')), run_size=2) as sorter:
+        convert_uname2gender_map_by_merge_join(
+            uname2gender_fpath, uname2id_fpath,
+            str(tmpdir.join('uid2gender.txt.gz')),
+            str(tmpdir.join('uids.txt.gz')), sorter=sorter)
+        assert dump_uid_sorted_maps(
+            sorter, uid2gender_fpath, uid_list_fpath) == 4
+    with gzip.open(uid2gender_fpath, 'rt') as f:
+        assert f.read() == '1 0\n4 0\n7 1\n9 1\n'
+    with gzip.open(uid_list_fpath, 'rt') as f:
+        assert f.read() == '1\n4\n7\n9\n'
+
+
+def test_phase5_merge_joins_unless_told_to_use_the_index(tmpdir):
+    dpaths = [str(tmpdir.mkdir(f'phase{i}')) for i in (2, 4, 5)]
+    uname2id_fpath = uname2id_fpath_by_dpath(dpaths[0])
+    with gzip.open(uname2id_fpath, 'wt') as f:
+        f.write(''.join(['a 9\n', 'b 4\n', 'b 5\n', 'c 7\n', 'd 1\n']))
+    build_uname_index_from_file(
+        uname2id_fpath, uname_index_dpath_by_dpath(dpaths[0]))
+    with gzip.open(uname_to_gender_map_fpath_by_dpath(dpaths[1]), 'wt') as f:
+        f.write(''.join(['a 1\n', 'b 0\n', 'bb 1\n', 'd 0\n']))
+
+    def _run(**kwargs):
+        phase5(*dpaths, **kwargs)
+        with open(phase_output_report_fpath(5, dpaths[2]), 'rt') as f:
+            report = f.read()
+        with gzip.open(uid_to_gender_map_fpath_by_dpath(
+                dpaths[2], sorted=True), 'rt') as f:
+            return report, f.read()
+
+    report, merge_joined = _run()
+    assert 'Merge-joining the uname2uid map' in report
+    assert '0 bad mappings|1 users not found.' in report
+    assert merge_joined == '1 0\n5 0\n9 1\n'
+    report, looked_up = _run(use_uname_index=True)
+    assert 'Memory-mapped index of 4 usernames opened.' in report
+    assert '1 users not found.' in report
+    assert looked_up == merge_joined
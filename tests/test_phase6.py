@@ -0,0 +1,72 @@
+"""Testing phase 6 functionalities."""
+
+import gzip
+import zipfile
+
+import numpy as np
+
+from twikwak17 import edges as edges_module
+from twikwak17 import edge_pipeline
+from twikwak17.shared import TWITTER_RV_MEMBER_FNAME
+from twikwak17.edges import format_int_pairs
+from twikwak17.edge_cache import (
+    open_edge_cache,
+    source_signature,
+)
+from twikwak17.uid_bitmap import UidBitmap
+from twikwak17.phases.phase6 import project_edge_list_to_user_intersection
+
+
+def _write_inputs(tmpdir):
+    rng = np.random.RandomState(6)
+    uids = np.unique(rng.randint(0, 3000, size=600))
+    edges = rng.randint(0, 3000, size=(4000, 2))
+    lines = format_int_pairs(edges).decode().splitlines(keepends=True)
+    # malformed lines, spread over many blocks
+    for i in range(3900, 0, -700):
+        lines.insert(i, '17\n' if i % 2 else '1 2 3\n')
+    twitter_rv_fpath = str(tmpdir.join('twitter_rv.zip'))
+    with zipfile.ZipFile(twitter_rv_fpath, 'w', zipfile.ZIP_DEFLATED) as f:
+        f.writestr(TWITTER_RV_MEMBER_FNAME, ''.join(lines).replace(' ', '\t'))
+    uid2gender_fpath = str(tmpdir.join('uid2gender.txt.gz'))
+    with gzip.open(uid2gender_fpath, 'wt') as f:
+        f.write(''.join(f'{uid} {uid % 2}\n' for uid in uids))
+    uid_bitmap_dpath = str(tmpdir.join('uid_bitmap'))
+    UidBitmap.from_uids(uids).save(uid_bitmap_dpath)
+    keep = np.isin(edges, uids).all(axis=1)
+    expected_thrown = int((~keep).sum()) + 6
+    return (twitter_rv_fpath, uid2gender_fpath, uid_bitmap_dpath,
+            format_int_pairs(edges[keep]), (expected_thrown, int(keep.sum())))
+
+
+def test_phase6_projection_modes_agree(tmpdir, monkeypatch, capsys):
+    monkeypatch.setattr(edges_module, 'EDGE_BLOCK_BYTES', 2048)
+    monkeypatch.setattr(edge_pipeline, 'EDGE_BLOCK_BYTES', 2048)
+    (twitter_rv_fpath, uid2gender_fpath, uid_bitmap_dpath, expected,
+     expected_counts) = _write_inputs(tmpdir)
+    cache_fpath = str(tmpdir.join('twitter_rv_edges.bin'))
+
+    def _project(mode, **kwargs):
+        output_fpath = str(tmpdir.join(f'social_graph_{mode}.txt.gz'))
+        counts = project_edge_list_to_user_intersection(
+            twitter_rv_fpath, uid2gender_fpath, output_fpath,
+            uid_bitmap_dpath=uid_bitmap_dpath, **kwargs)
+        with gzip.open(output_fpath, 'rb') as f:
+            return counts, f.read()
+
+    assert _project('serial') == (expected_counts, expected)
+    capsys.readouterr()
+    assert _project(
+        'tee', edge_cache_fpath=cache_fpath, build_edge_cache=True,
+        n_workers=2) == (expected_counts, expected)
+    assert 'n_workers=2 is ignored' in capsys.readouterr().out
+    cached_edges, header = open_edge_cache(
+        cache_fpath,
+        source_signature(twitter_rv_fpath, TWITTER_RV_MEMBER_FNAME))
+    assert len(cached_edges) == 4000
+    assert header['malformed_lines'] == 6
+    assert _project('cached', edge_cache_fpath=cache_fpath) == (
+        expected_counts, expected)
+    assert 'Scanning 4,000 cached edges' in capsys.readouterr().out
+    assert _project('parallel', n_workers=2) == (expected_counts, expected)
+    assert 'with 2 worker processes' in capsys.readouterr().out
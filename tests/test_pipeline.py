@@ -0,0 +1,44 @@
+"""Testing the pipeline runner."""
+
+import gzip
+
+from speks import predict_gender_by_tweets
+
+from twikwak17.shared import (
+    phase_output_dpath,
+    phase_output_report_fpath,
+    twitter7_tweet_list_fpath_by_dpath,
+    uname_intersection_fpath_by_dpath,
+    uname_to_gender_map_fpath_by_dpath,
+)
+from twikwak17.pipeline import run_phases
+
+
+UNAMES = ['ab', 'cd', 'ef', 'gh', 'ij']
+TWEETS = [
+    'my wife and i', 'my husband', 'so cute omg', 'beer and football', 'lol',
+]
+
+
+def test_run_phases_passes_phase4_options(tmpdir):
+    output_dpath = str(tmpdir.mkdir('output'))
+    with gzip.open(twitter7_tweet_list_fpath_by_dpath(
+            phase_output_dpath(1, output_dpath), sorted=False), 'wt') as f:
+        f.write(''.join(
+            f'{uname} {tweets}\n' for uname, tweets in zip(UNAMES, TWEETS)))
+    with gzip.open(uname_intersection_fpath_by_dpath(
+            phase_output_dpath(3, output_dpath)), 'wt') as f:
+        f.write(''.join(f'{uname}\n' for uname in UNAMES))
+    run_phases(
+        ['4'], tpath=str(tmpdir), kpath=str(tmpdir),
+        output_dpath=output_dpath, batch_size=2, checkpoint_every=2,
+        profile=True)
+    phase4_dpath = phase_output_dpath(4, output_dpath)
+    with open(phase_output_report_fpath(4, phase4_dpath), 'rt') as f:
+        report = f.read()
+    assert 'Committing a checkpoint every 2 users' in report
+    assert 'Classification profile:' in report
+    with gzip.open(uname_to_gender_map_fpath_by_dpath(phase4_dpath)) as f:
+        assert f.read().decode() == ''.join(
+            f'{uname} {predict_gender_by_tweets(tweets)}\n'
+            for uname, tweets in zip(UNAMES, TWEETS))
@@ -0,0 +1,27 @@
+"""Testing the persistent gender prediction cache."""
+
+from twikwak17.prediction_cache import (
+    speks_model_version,
+    tweets_digest,
+    PredictionCacheReader,
+    PredictionCacheWriter,
+)
+
+
+def test_prediction_cache_round_trip(tmpdir):
+    fpath = str(tmpdir.join('cache.txt.gz'))
+    version = speks_model_version()
+    users = [' df9k', 'bobo34', 'terk*#4']
+    tweets = ['i like fish', 'so tired lol', 'no you did not']
+    digests = [tweets_digest(t, version) for t in tweets]
+    with PredictionCacheReader(fpath) as reader:
+        assert reader.get(users[0], digests[0]) is None
+    with PredictionCacheWriter(fpath) as writer:
+        writer.write(users, digests, [1, 0, 1])
+    with PredictionCacheReader(fpath) as reader:
+        assert reader.get(users[0], digests[0]) == 1
+        assert reader.get('aaa', digests[1]) is None
+        assert reader.get(users[1], tweets_digest('changed', version)) is None
+        assert reader.get(users[2], digests[2]) == 1
+        assert (reader.hits, reader.misses) == (2, 2)
+    assert tweets_digest(tweets[0], 'other-model') != digests[0]
@@ -0,0 +1,40 @@
+"""Testing the prefetching readers of twikwak17."""
+
+import io
+import os
+import tarfile
+
+from twikwak17.readers import (
+    PrefetchingReader,
+    open_member_or_file,
+)
+
+
+LINES = [f'{i} User_{i}\n'.encode('utf-8') for i in range(1000)]
+CONTENT = b''.join(LINES)
+
+
+def test_prefetching_reader_lines():
+    raw_f = io.BytesIO(CONTENT)
+    with PrefetchingReader(raw_f, block_size=97, prefetch=2) as reader:
+        lines = list(reader.iter_lines())
+    assert lines == LINES
+
+
+def test_open_member_from_tar_gz(tmpdir):
+    dpath = str(tmpdir)
+    archive_fpath = os.path.join(dpath, 'numeric2screen.tar.gz')
+    with tarfile.open(archive_fpath, 'w:gz') as tar_f:
+        info = tarfile.TarInfo('data/numeric2screen')
+        info.size = len(CONTENT)
+        tar_f.addfile(info, io.BytesIO(CONTENT))
+    with open_member_or_file(dpath, 'numeric2screen') as member_f:
+        assert member_f.read() == CONTENT
+
+
+def test_open_member_prefers_plain_file(tmpdir):
+    dpath = str(tmpdir)
+    with open(os.path.join(dpath, 'numeric2screen'), 'wb') as f:
+        f.write(CONTENT[:100])
+    with open_member_or_file(dpath, 'numeric2screen') as member_f:
+        assert member_f.read() == CONTENT[:100]
@@ -0,0 +1,17 @@
+"""Testing shared functionalities."""
+
+import gzip
+
+from twikwak17.block_index import block_index_exists
+from twikwak17.shared import sort_username_file
+
+
+def test_sort_username_file_keeps_whole_lines(tmpdir):
+    input_fpath = str(tmpdir.join('uname2id.txt.gz'))
+    with gzip.open(input_fpath, 'wt') as f:
+        f.write('cc 3\nAa 1\nb_b 2\naa 1\n')
+    output_fpath = sort_username_file(input_fpath)
+    assert output_fpath == str(tmpdir.join('uname2id_sorted.txt.gz'))
+    with gzip.open(output_fpath, 'rt') as f:
+        assert f.read() == 'aa 1\nb_b 2\ncc 3\n'
+    assert not block_index_exists(output_fpath)
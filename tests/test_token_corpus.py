@@ -0,0 +1,69 @@
+"""Testing the memory-mapped token corpus."""
+
+import pytest
+from speks.tokenization import tokenize_no_case_preserving
+
+from twikwak17.gender import SpeksLexiconModel
+from twikwak17.token_corpus import (
+    TokenCorpus,
+    TokenCorpusWriter,
+    token_corpus_exists,
+)
+
+
+def test_token_corpus_round_trip(tmpdir):
+    dpath = str(tmpdir.join('corpus'))
+    users = ['bobo34', '__asd7', 'empty', 'ünï']
+    tokens = [['i', 'like', 'fish', 'i'], ['fish', ':D'], [], ['דג', 'i']]
+    assert not token_corpus_exists(dpath)
+    with TokenCorpusWriter(dpath) as writer:
+        for user, user_tokens in zip(users, tokens):
+            writer.add(user, user_tokens)
+    assert token_corpus_exists(dpath)
+    corpus = TokenCorpus(dpath)
+    assert len(corpus) == 4
+    assert corpus.meta['token_count'] == 8
+    assert corpus.vocabulary() == ['i', 'like', 'fish', ':D', 'דג']
+    assert corpus.token_ids(0).tolist() == [0, 1, 2, 0]
+    for i in range(len(users)):
+        assert corpus.user(i) == users[i]
+        assert corpus.decode(corpus.token_ids(i)) == tokens[i]
+
+
+def test_token_corpus_writer_drops_interrupted_corpus(tmpdir):
+    dpath = str(tmpdir.join('corpus'))
+    with TokenCorpusWriter(dpath) as writer:
+        writer.add('bobo34', ['i', 'like', 'fish'])
+    assert token_corpus_exists(dpath)
+    with pytest.raises(RuntimeError):
+        with TokenCorpusWriter(dpath) as writer:
+            writer.add('bobo34', ['i', 'like', 'fish'])
+            raise RuntimeError("Tokenization failed.")
+    assert not token_corpus_exists(dpath)
+    assert not tmpdir.join('corpus').exists()
+
+
+def test_token_corpus_features_match_model_features(tmpdir):
+    dpath = str(tmpdir.join('corpus'))
+    users = ['bobo34', '__asd7', 'empty', 'fishy']
+    texts = [
+        'I love my Wife!! :) lol LOL',
+        'the game the game #game @bob',
+        '',
+        'i like fish, fish like me zzqx',
+    ]
+    with TokenCorpusWriter(dpath) as writer:
+        for user, text in zip(users, texts):
+            writer.add(user, tokenize_no_case_preserving(text))
+    corpus = TokenCorpus(dpath)
+    model = SpeksLexiconModel()
+    columns = corpus.vocab_columns(model)
+    for start, stop in [(0, 4), (1, 3), (2, 2)]:
+        from_corpus = corpus.features(
+            model, start=start, stop=stop, columns=columns)
+        from_texts = model.features(texts[start:stop])
+        for corpus_part, text_part in zip(from_corpus, from_texts):
+            assert corpus_part.dtype == text_part.dtype
+            assert corpus_part.tolist() == text_part.tolist()
+    assert model.score_features(*corpus.features(model)).tolist() == (
+        model.scores(texts).tolist())
@@ -0,0 +1,45 @@
+"""Testing the uid bitmap."""
+
+import gzip
+
+import numpy as np
+import pytest
+
+from twikwak17.uid_bitmap import (
+    BITMAP,
+    SORTED,
+    UidBitmap,
+    uid_bitmap_exists,
+)
+
+
+UID2GENDER_LINES = ['7 1\n', '3 0\n', '12 1\n', '3 1\n', '100 0\n']
+QUERY_UIDS = [3, 7, 12, 100, 0, 5, 101, 10 ** 9, -1]
+
+
+@pytest.mark.parametrize('kind', [BITMAP, SORTED])
+def test_uid_bitmap(tmpdir, kind):
+    uid2gender_fpath = str(tmpdir.join('uid2gender.txt.gz'))
+    with gzip.open(uid2gender_fpath, 'wt') as f:
+        f.write(''.join(UID2GENDER_LINES))
+    uid_bitmap = UidBitmap.from_uid2gender_file(uid2gender_fpath, kind=kind)
+    dpath = str(tmpdir.join('uid_bitmap'))
+    uid_bitmap.save(dpath)
+    assert uid_bitmap_exists(dpath)
+    loaded = UidBitmap.load(dpath)
+    assert loaded.kind == kind
+    assert len(loaded) == 4
+    assert loaded.contains(QUERY_UIDS).tolist() == [
+        True, True, True, True, False, False, False, False, False]
+    assert loaded.genders(QUERY_UIDS).tolist() == [
+        1, 1, 1, 0, -1, -1, -1, -1, -1]
+    assert loaded.contains(np.array([[3, 5], [7, 12]])).tolist() == [
+        [True, False], [True, True]]
+
+
+def test_uid_bitmap_kind_by_density():
+    assert UidBitmap.from_uids(np.arange(0, 1000, 3)).kind == BITMAP
+    sparse = UidBitmap.from_uids(np.array([5, 10 ** 12]))
+    assert sparse.kind == SORTED
+    with pytest.raises(ValueError):
+        sparse.genders([5])
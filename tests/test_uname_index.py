@@ -0,0 +1,41 @@
+"""Testing the memory-mapped username-to-uid index."""
+
+import gzip
+import os
+
+import numpy as np
+
+from twikwak17.packed import PackedStrings
+from twikwak17.uname_index import (
+    NOT_FOUND,
+    UnameIndex,
+    write_uname_index,
+    build_uname_index_from_file,
+)
+
+
+UNAMES = sorted([b'_', b'__asd7', b'bob', b'bobo', b'bobo34', b'zed_zed'])
+UIDS = np.arange(len(UNAMES), dtype=np.int64) * 10 + 3
+
+
+def test_uname_index_lookup(tmpdir):
+    dpath = os.path.join(str(tmpdir), 'index')
+    write_uname_index(PackedStrings.from_list(UNAMES), UIDS, dpath)
+    index = UnameIndex(dpath)
+    assert len(index) == len(UNAMES)
+    queries = ['bobo', 'zed_zed', 'nope', '_', 'bobo345678901234', '', 'bo']
+    expected = [UIDS[3], UIDS[5], NOT_FOUND, UIDS[0], NOT_FOUND, NOT_FOUND,
+                NOT_FOUND]
+    assert index.lookup(queries).tolist() == expected
+    assert index.get('bob') == UIDS[2]
+    assert index.get('bobb') is None
+
+
+def test_build_uname_index_from_file_keeps_last(tmpdir):
+    fpath = os.path.join(str(tmpdir), 'uname2id.txt.gz')
+    with gzip.open(fpath, 'wt') as f:
+        f.write('alice 1\nbob 2\nbob 3\ncarol 4\n')
+    dpath = os.path.join(str(tmpdir), 'index')
+    assert build_uname_index_from_file(fpath, dpath) == 3
+    index = UnameIndex(dpath)
+    assert index.lookup(['bob', 'alice', 'carol']).tolist() == [3, 1, 4]
@@ -0,0 +1,165 @@
+"""A binary, columnar edge list, written in chunks.
+
+An edge list of unknown length is written as a folder of chunks, each holding
+one .npy file per column - like ``src_00000.npy`` and ``dst_00000.npy`` - and
+a ``manifest.json`` listing the columns, their dtypes, and the edge count of
+each chunk. The manifest is written last, so a folder without one holds no
+complete edge list. Chunks are memory-mapped on reading.
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+
+
+MANIFEST_FNAME = 'manifest.json'
+CHUNK_FNAME_TEMPLATE = '{}_{:05d}.npy'
+DEF_CHUNK_EDGES = 4 * 1024 * 1024
+SRC = 'src'
+DST = 'dst'
+SRC_INDEX = 'src_index'
+DST_INDEX = 'dst_index'
+UID_COLUMNS = (SRC, DST)
+INDEX_COLUMNS = (SRC_INDEX, DST_INDEX)
+COLUMN_DTYPES = {
+    SRC: 'int64',
+    DST: 'int64',
+    SRC_INDEX: 'int32',
+    DST_INDEX: 'int32',
+}
+
+
+def binary_edge_list_exists(dpath):
+    return os.path.isfile(os.path.join(dpath, MANIFEST_FNAME))
+
+
+class BinaryEdgeListWriter(object):
+    """Writes a binary, columnar edge list, in chunks.
+
+    Any existing edge list in the folder is removed first.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to the edge list folder.
+    columns : sequence of str
+        The names of the columns written, from 'src', 'dst', 'src_index' and
+        'dst_index'.
+    chunk_edges : int, optional
+        The number of edges buffered into each chunk. Defaults to 4 Mi.
+    """
+
+    def __init__(self, dpath, columns, chunk_edges=None):
+        if chunk_edges is None:
+            chunk_edges = DEF_CHUNK_EDGES
+        self.dpath = dpath
+        self.columns = tuple(columns)
+        self.chunk_edges = chunk_edges
+        self.count = 0
+        self.chunk_counts = []
+        self._buffers = {column: [] for column in self.columns}
+        self._buffered = 0
+        if os.path.exists(dpath):
+            shutil.rmtree(dpath)
+        os.makedirs(dpath)
+
+    def add(self, **columns):
+        """Adds edges, given as one array per column."""
+        lengths = {len(columns[column]) for column in self.columns}
+        if len(lengths) != 1:
+            raise ValueError("All columns must be of the same length.")
+        for column in self.columns:
+            self._buffers[column].append(np.asarray(
+                columns[column], dtype=COLUMN_DTYPES[column]))
+        self._buffered += lengths.pop()
+        if self._buffered >= self.chunk_edges:
+            self._flush()
+
+    def add_pairs(self, pairs, index_pairs=None):
+        """Adds an (n, 2) array of uid pairs, and optionally of node index
+        pairs, to the uid and node index columns."""
+        columns = {SRC: pairs[:, 0], DST: pairs[:, 1]}
+        if index_pairs is not None:
+            columns[SRC_INDEX] = index_pairs[:, 0]
+            columns[DST_INDEX] = index_pairs[:, 1]
+        self.add(**columns)
+
+    def _flush(self):
+        if self._buffered < 1:
+            return
+        chunk_ix = len(self.chunk_counts)
+        for column in self.columns:
+            np.save(
+                os.path.join(
+                    self.dpath, CHUNK_FNAME_TEMPLATE.format(column, chunk_ix)),
+                np.concatenate(self._buffers[column]))
+            self._buffers[column] = []
+        self.chunk_counts.append(self._buffered)
+        self.count += self._buffered
+        self._buffered = 0
+
+    def finish(self):
+        """Writes the last chunk and the manifest."""
+        self._flush()
+        with open(os.path.join(self.dpath, MANIFEST_FNAME), 'wt+') as f:
+            json.dump({
+                'count': self.count,
+                'columns': {
+                    column: COLUMN_DTYPES[column] for column in self.columns},
+                'chunk_counts': self.chunk_counts,
+            }, f)
+
+
+class BinaryEdgeList(object):
+    """A read-only binary, columnar edge list.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to an edge list folder written by BinaryEdgeListWriter.
+    """
+
+    def __init__(self, dpath):
+        self.dpath = dpath
+        with open(os.path.join(dpath, MANIFEST_FNAME), 'rt') as f:
+            manifest = json.load(f)
+        self.count = manifest['count']
+        self.columns = tuple(manifest['columns'])
+        self.chunk_counts = manifest['chunk_counts']
+
+    def __len__(self):
+        return self.count
+
+    def has_columns(self, columns):
+        return all(column in self.columns for column in columns)
+
+    def _chunk(self, column, chunk_ix):
+        return np.load(
+            os.path.join(
+                self.dpath, CHUNK_FNAME_TEMPLATE.format(column, chunk_ix)),
+            mmap_mode='r')
+
+    def iter_pairs(self, columns=UID_COLUMNS):
+        """Yields each chunk of two columns as an (n, 2) int64 array.
+
+        Parameters
+        ----------
+        columns : pair of str, default ('src', 'dst')
+            The names of the source and destination columns.
+        """
+        for chunk_ix in range(len(self.chunk_counts)):
+            yield np.column_stack([
+                np.asarray(self._chunk(column, chunk_ix), dtype=np.int64)
+                for column in columns])
+
+    def column(self, column):
+        """Returns all values of a column as one in-memory array."""
+        chunks = [
+            self._chunk(column, chunk_ix)
+            for chunk_ix in range(len(self.chunk_counts))
+        ]
+        if len(chunks) == 0:
+            return np.empty(0, dtype=COLUMN_DTYPES[column])
+        return np.concatenate(chunks)
@@ -0,0 +1,270 @@
+"""Sparse block indices over sorted, gzipped username files.
+
+A block-indexed file is a regular multi-member gzip file - readable as is by
+gzip.open() and `gzip -dc` - in which every run of block_lines lines is
+compressed as a separate gzip member. A sidecar index file records the first
+key of each block and the byte offset of its member, so any block can be
+decompressed on its own, without inflating the file up to it.
+"""
+
+import os
+import gzip
+
+import numpy as np
+
+from twikwak17.readers import (
+    iter_uname_keys,
+    uname_keys_from_block,
+)
+
+
+DEF_BLOCK_LINES = 4096
+INDEX_FNAME_SUFFIX = '.blkidx.npz'
+GALLOP_MAX_SIZE_RATIO = 0.1
+
+
+def block_index_fpath(fpath):
+    return fpath + INDEX_FNAME_SUFFIX
+
+
+def block_index_exists(fpath):
+    index_fpath = block_index_fpath(fpath)
+    return os.path.isfile(index_fpath) and (
+        os.path.getmtime(index_fpath) >= os.path.getmtime(fpath))
+
+
+class BlockIndexedGzipWriter(object):
+    """Writes lines of a sorted file as a block-indexed gzip file.
+
+    Parameters
+    ----------
+    fpath : str
+        The path to the designated output file.
+    block_lines : int, optional
+        The number of lines in each independently compressed block. Defaults
+        to 4096.
+    """
+
+    def __init__(self, fpath, block_lines=None):
+        if block_lines is None:
+            block_lines = DEF_BLOCK_LINES
+        self.fpath = fpath
+        self.block_lines = block_lines
+        self._f = open(fpath, 'wb+')
+        self._lines = []
+        self._first_keys = []
+        self._offsets = [0]
+        self._line_counts = []
+
+    def write_lines(self, lines):
+        """Writes the given lines, each a bytes object with no line break."""
+        for line in lines:
+            self._lines.append(line)
+            if len(self._lines) >= self.block_lines:
+                self._flush()
+
+    def _flush(self):
+        if len(self._lines) < 1:
+            return
+        keys = uname_keys_from_block(self._lines[0])
+        self._first_keys.append(keys[0] if keys else b'')
+        self._line_counts.append(len(self._lines))
+        member = gzip.compress(b'\n'.join(self._lines) + b'\n', mtime=0)
+        self._f.write(member)
+        self._offsets.append(self._offsets[-1] + len(member))
+        self._lines = []
+
+    def close(self):
+        """Writes the last block and the index file."""
+        self._flush()
+        self._f.close()
+        np.savez(
+            block_index_fpath(self.fpath),
+            first_keys=np.array(self._first_keys, dtype=bytes),
+            offsets=np.array(self._offsets, dtype=np.int64),
+            line_counts=np.array(self._line_counts, dtype=np.int64),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def index_sorted_username_file(fpath, block_lines=None):
+    """Rewrites a sorted, gzipped username file as a block-indexed one.
+
+    Only the username key - the first token - of each line is kept, so only
+    username lists should be indexed. Blank lines are dropped. The rewritten
+    file replaces the given one.
+
+    Parameters
+    ----------
+    fpath : str
+        The full qualified path to a sorted, gzipped username file.
+    block_lines : int, optional
+        The number of lines in each independently compressed block.
+
+    Returns
+    -------
+    BlockIndex
+        The index of the rewritten file.
+    """
+    tmp_fpath = fpath + '.tmp'
+    with BlockIndexedGzipWriter(tmp_fpath, block_lines) as writer:
+        for keys in iter_uname_keys(fpath):
+            writer.write_lines(keys)
+    os.replace(tmp_fpath, fpath)
+    os.replace(block_index_fpath(tmp_fpath), block_index_fpath(fpath))
+    return BlockIndex(fpath)
+
+
+class BlockIndex(object):
+    """The sparse block index of a block-indexed gzip file.
+
+    Parameters
+    ----------
+    fpath : str
+        The full qualified path to a block-indexed gzip file.
+    """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        with np.load(block_index_fpath(fpath)) as index:
+            self.first_keys = index['first_keys']
+            self.offsets = index['offsets']
+            self.line_counts = index['line_counts']
+
+    def __len__(self):
+        return len(self.first_keys)
+
+    @property
+    def line_count(self):
+        return int(self.line_counts.sum())
+
+    def read_block(self, f, i):
+        """Decompresses and returns block i, read from the open file f."""
+        f.seek(self.offsets[i])
+        return gzip.decompress(f.read(self.offsets[i+1] - self.offsets[i]))
+
+    def iter_range_keys(self, f, lo_key=None, hi_key=None):
+        """Yields the keys of the file in [lo_key, hi_key), block by block.
+
+        Only the blocks that can hold keys of the range are decompressed.
+
+        Parameters
+        ----------
+        f : file
+            The indexed file, opened for binary reading.
+        lo_key : bytes, optional
+            The inclusive lower bound of the range. Unbounded if not given.
+        hi_key : bytes, optional
+            The exclusive upper bound of the range. Unbounded if not given.
+
+        Yields
+        ------
+        list of bytes
+            The keys of the range found in each block, in order.
+        """
+        start = 0
+        if lo_key is not None:
+            start = max(int(np.searchsorted(
+                self.first_keys, lo_key, side='right')) - 1, 0)
+        end = len(self)
+        if hi_key is not None:
+            end = int(np.searchsorted(self.first_keys, hi_key, side='left'))
+        for i in range(start, end):
+            keys = uname_keys_from_block(self.read_block(f, i))
+            if lo_key is not None and i == start:
+                keys = [key for key in keys if key >= lo_key]
+            if hi_key is not None and i == end - 1:
+                keys = [key for key in keys if key < hi_key]
+            yield keys
+
+    def splitter_keys(self, n_ranges):
+        """Picks up to n_ranges - 1 block-aligned keys splitting the file into
+        key ranges of about the same number of blocks."""
+        block_ixs = np.unique(np.linspace(
+            0, len(self), num=n_ranges, endpoint=False).astype(np.int64)[1:])
+        return np.unique(self.first_keys[block_ixs]).tolist()
+
+    def gallop(self, key, lo):
+        """Finds the last block at or after lo that can contain key.
+
+        Probes blocks lo+1, lo+2, lo+4, ... until one starting after key is
+        found, then binary searches the last stretch; O(log d) in the distance
+        d skipped, rather than in the size of the index.
+
+        Returns
+        -------
+        int
+            The largest i >= lo with first_keys[i] <= key, or lo - 1 if there
+            is none.
+        """
+        step = 1
+        while lo + step < len(self) and self.first_keys[lo + step] <= key:
+            step *= 2
+        hi = min(lo + step, len(self))
+        start = lo + step // 2
+        return start + int(np.searchsorted(
+            self.first_keys[start:hi], key, side='right')) - 1
+
+
+def iter_galloping_intersection(small_blocks, large_fpath, counts=None):
+    """Yields the intersection of a small key stream and a large indexed file.
+
+    For each block of the small stream the large file's block index is
+    galloped forward to the first block that can contain it, and only the
+    large blocks that can contain a key of the small block are decompressed.
+
+    Parameters
+    ----------
+    small_blocks : iterable of list of bytes
+        Blocks of keys of the small stream, sorted in native byte order.
+    large_fpath : str
+        The full qualified path to a sorted, block-indexed username file.
+    counts : dict, optional
+        If given, the number of keys read from the small stream and the number
+        of blocks decompressed from the large file are accumulated in its
+        'left' and 'blocks_read' entries.
+
+    Yields
+    ------
+    numpy.ndarray
+        Sorted 'S' arrays of the unique keys common to both.
+    """
+    if counts is None:
+        counts = {}
+    counts.setdefault('left', 0)
+    counts.setdefault('blocks_read', 0)
+    index = BlockIndex(large_fpath)
+    if len(index) < 1:
+        return
+    cursor = 0
+    cached_block_ix = None
+    cached_keys = None
+    with open(large_fpath, 'rb') as large_f:
+        for keys in small_blocks:
+            if len(keys) < 1:
+                continue
+            counts['left'] += len(keys)
+            keys = np.array(keys, dtype=bytes)
+            cursor = max(index.gallop(keys[0], cursor), 0)
+            last = index.gallop(keys[-1], cursor)
+            block_ixs = cursor + np.searchsorted(
+                index.first_keys[cursor:last+1], keys, side='right') - 1
+            large_keys = []
+            for block_ix in np.unique(block_ixs[block_ixs >= 0]).tolist():
+                if block_ix != cached_block_ix:
+                    cached_keys = uname_keys_from_block(
+                        index.read_block(large_f, block_ix))
+                    cached_block_ix = block_ix
+                    counts['blocks_read'] += 1
+                large_keys.extend(cached_keys)
+            if len(large_keys) < 1:
+                continue
+            common = np.intersect1d(keys, np.array(large_keys, dtype=bytes))
+            if len(common) > 0:
+                yield common
+            cursor = max(last, 0)
@@ -0,0 +1,177 @@
+"""Checkpointed outputs, for resuming long runs after an interruption.
+
+A checkpointed output is written as a sequence of gzipped segment files. Once
+a segment is complete it is committed: closed, and recorded - along with the
+progress made through the inputs - in a JSON checkpoint file next to the
+output. Segments are compressed deterministically, with no timestamp or file
+name in their gzip headers, so the output concatenated from them once the run
+finishes is bit-identical whether or not the run was interrupted and resumed.
+"""
+
+import os
+import gzip
+import json
+import shutil
+
+from twikwak17.shared import qprint
+
+
+CHECKPOINT_FNAME_SUFFIX = '.checkpoint.json'
+SEGMENT_FNAME_TEMPLATE = '{}.seg{:05d}'
+CHECKPOINT_VERSION = 1
+TMP_SUFFIX = '.tmp'
+
+
+def checkpoint_fpath(output_fpath):
+    return output_fpath + CHECKPOINT_FNAME_SUFFIX
+
+
+def segment_fpath(output_fpath, segment_ix):
+    return SEGMENT_FNAME_TEMPLATE.format(output_fpath, segment_ix)
+
+
+def input_signature(fpath):
+    """Returns a JSON-able signature of a file, changing if the file does."""
+    stat = os.stat(fpath)
+    return [os.path.abspath(fpath), stat.st_size, stat.st_mtime_ns]
+
+
+def _dump_json_atomically(obj, fpath):
+    tmp_fpath = fpath + TMP_SUFFIX
+    with open(tmp_fpath, 'wt+') as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_fpath, fpath)
+
+
+class CheckpointedGzipOutput(object):
+    """A gzipped text output committed in segments, resumable from its last
+    commit.
+
+    Parameters
+    ----------
+    output_fpath : str
+        The full qualified path of the final output file.
+    config : dict
+        A JSON-able description of the run - e.g. input signatures and
+        parameters. A checkpoint is only resumed from if it was written by a
+        run of an equal configuration; otherwise, the run starts over.
+
+    Attributes
+    ----------
+    progress : dict or None
+        The progress recorded by the last commit, if resuming; otherwise None.
+    """
+
+    def __init__(self, output_fpath, config):
+        self.output_fpath = output_fpath
+        self.config = config
+        self.progress = None
+        self._segments = 0
+        self._raw_f = None
+        self._gz_f = None
+        cp_fpath = checkpoint_fpath(output_fpath)
+        if not os.path.isfile(cp_fpath):
+            return
+        with open(cp_fpath, 'rt') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('version') != CHECKPOINT_VERSION or (
+                checkpoint.get('config') != config):
+            qprint(f"Ignoring the stale checkpoint at {cp_fpath}.")
+            return
+        self._segments = checkpoint['segments']
+        self.progress = checkpoint['progress']
+
+    @property
+    def resumed(self):
+        return self.progress is not None
+
+    def _open_segment(self):
+        seg_fpath = segment_fpath(self.output_fpath, self._segments)
+        self._raw_f = open(seg_fpath + TMP_SUFFIX, 'wb+')
+        self._gz_f = gzip.GzipFile(
+            filename='', mode='wb', fileobj=self._raw_f, mtime=0)
+
+    def write(self, text):
+        """Writes text into the current segment."""
+        if self._gz_f is None:
+            self._open_segment()
+        self._gz_f.write(text.encode('utf-8'))
+
+    def _close_segment(self):
+        if self._gz_f is None:
+            self._open_segment()
+        self._gz_f.close()
+        self._raw_f.flush()
+        os.fsync(self._raw_f.fileno())
+        self._raw_f.close()
+        self._gz_f = None
+        self._raw_f = None
+        seg_fpath = segment_fpath(self.output_fpath, self._segments)
+        os.replace(seg_fpath + TMP_SUFFIX, seg_fpath)
+        self._segments += 1
+
+    def commit(self, progress):
+        """Closes the current segment and records it, with the given progress,
+        in the checkpoint file.
+
+        Parameters
+        ----------
+        progress : dict
+            A JSON-able description of the progress made through the inputs
+            up to the end of the current segment.
+        """
+        self._close_segment()
+        self.progress = progress
+        _dump_json_atomically({
+            'version': CHECKPOINT_VERSION,
+            'config': self.config,
+            'segments': self._segments,
+            'progress': progress,
+        }, checkpoint_fpath(self.output_fpath))
+
+    def finish(self):
+        """Closes the last segment and concatenates all segments into the
+        output file, removing the segments and the checkpoint."""
+        if self._gz_f is not None or self._segments == 0:
+            self._close_segment()
+        tmp_fpath = self.output_fpath + TMP_SUFFIX
+        with open(tmp_fpath, 'wb+') as out_f:
+            for segment_ix in range(self._segments):
+                with open(segment_fpath(
+                        self.output_fpath, segment_ix), 'rb') as seg_f:
+                    shutil.copyfileobj(seg_f, out_f)
+        os.replace(tmp_fpath, self.output_fpath)
+        for segment_ix in range(self._segments):
+            os.remove(segment_fpath(self.output_fpath, segment_ix))
+        cp_fpath = checkpoint_fpath(self.output_fpath)
+        if os.path.isfile(cp_fpath):
+            os.remove(cp_fpath)
+
+    def abort(self):
+        """Discards the uncommitted part of the current segment."""
+        if self._gz_f is None:
+            return
+        self._gz_f.close()
+        self._raw_f.close()
+        os.remove(self._raw_f.name)
+        self._gz_f = None
+        self._raw_f = None
+
+
+def skip_lines(f, n_lines):
+    """Reads and discards n_lines lines of the given file.
+
+    Returns
+    -------
+    str
+        The last non-empty line read, or an empty string if there is none.
+    """
+    last_line = ''
+    for _ in range(n_lines):
+        line = f.readline()
+        if not line:
+            break
+        last_line = line
+    return last_line
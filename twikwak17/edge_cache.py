@@ -0,0 +1,190 @@
+"""A binary, memory-mappable cache of a parsed edge list.
+
+Parsing kwak10's ``twitter_rv.net`` out of ``twitter_rv.zip`` takes hours,
+yet the source graph never changes. The cache is a single file holding:
+
+* A fixed-size header - the magic bytes ``TWKEDGE1``, then the length of a
+  JSON document and the document itself, zero padded. The document records
+  the edge count and dtype, the number of malformed lines skipped, and a
+  signature of the source: the CRC32 and size of the archived edge list, as
+  recorded in the zip's directory, and the size of the zip file.
+* The edges, as a C-ordered (n, 2) array of uint32 or int64 uid pairs.
+
+A cache is only used if its header matches the current source, and it is
+written to a temporary path and renamed into place once complete, so an
+interrupted conversion never leaves a valid-looking partial cache.
+"""
+
+import os
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+
+MAGIC = b'TWKEDGE1'
+HEADER_BYTES = 4096
+CACHE_VERSION = 1
+DEF_CACHE_DTYPE = 'uint32'
+DEF_CHUNK_EDGES = 8 * 1024 * 1024
+TMP_SUFFIX = '.tmp'
+_LENGTH_STRUCT = struct.Struct('<I')
+
+
+def source_signature(zip_fpath, member_name):
+    """Returns a signature of an edge list archived in a zip file.
+
+    Parameters
+    ----------
+    zip_fpath : str
+        The full qualified path to the zip file.
+    member_name : str
+        The name of the edge list in the zip file.
+
+    Returns
+    -------
+    dict
+        The CRC32, size and compressed size of the edge list, as recorded in
+        the zip's directory, and the size of the zip file.
+    """
+    with zipfile.ZipFile(zip_fpath, 'r') as zip_f:
+        info = zip_f.getinfo(member_name)
+    return {
+        'member': member_name,
+        'crc32': info.CRC,
+        'file_size': info.file_size,
+        'compress_size': info.compress_size,
+        'zip_size': os.path.getsize(zip_fpath),
+    }
+
+
+def _read_header(f):
+    prefix = f.read(len(MAGIC) + _LENGTH_STRUCT.size)
+    if len(prefix) < len(MAGIC) + _LENGTH_STRUCT.size:
+        return None
+    if prefix[:len(MAGIC)] != MAGIC:
+        return None
+    length, = _LENGTH_STRUCT.unpack(prefix[len(MAGIC):])
+    if length > HEADER_BYTES - len(prefix):
+        return None
+    try:
+        return json.loads(f.read(length).decode('utf-8'))
+    except ValueError:
+        return None
+
+
+def read_edge_cache_header(cache_fpath):
+    """Returns the header document of an edge cache, or None if the file is
+    missing or is not an edge cache."""
+    if not os.path.isfile(cache_fpath):
+        return None
+    with open(cache_fpath, 'rb') as f:
+        return _read_header(f)
+
+
+def open_edge_cache(cache_fpath, signature):
+    """Memory-maps an edge cache if it is complete and matches its source.
+
+    Parameters
+    ----------
+    cache_fpath : str
+        The full qualified path to the cache file.
+    signature : dict
+        The signature of the current source, as returned by
+        source_signature().
+
+    Returns
+    -------
+    edges : numpy.memmap or None
+        A read-only (n, 2) array of the cached edges, or None if there is no
+        valid cache.
+    header : dict or None
+        The header document of the cache.
+    """
+    header = read_edge_cache_header(cache_fpath)
+    if header is None or header.get('version') != CACHE_VERSION:
+        return None, None
+    if header.get('source') != signature:
+        return None, None
+    dtype = np.dtype(header['dtype'])
+    expected_size = HEADER_BYTES + header['count'] * 2 * dtype.itemsize
+    if os.path.getsize(cache_fpath) != expected_size:
+        return None, None
+    if header['count'] == 0:
+        return np.empty((0, 2), dtype=dtype), header
+    edges = np.memmap(
+        cache_fpath, dtype=dtype, mode='r', offset=HEADER_BYTES,
+        shape=(header['count'], 2))
+    return edges, header
+
+
+def iter_edge_cache_chunks(edges, chunk_edges=None):
+    """Yields consecutive chunks of cached edges as in-memory int64 arrays."""
+    if chunk_edges is None:
+        chunk_edges = DEF_CHUNK_EDGES
+    for start in range(0, len(edges), chunk_edges):
+        yield np.asarray(edges[start:start + chunk_edges], dtype=np.int64)
+
+
+class EdgeCacheWriter(object):
+    """Writes parsed edges to an edge cache, a block at a time.
+
+    Parameters
+    ----------
+    cache_fpath : str
+        The full qualified path to the cache file.
+    signature : dict
+        The signature of the source, as returned by source_signature().
+    dtype : str, default 'uint32'
+        The dtype uids are stored as. Adding a uid out of its range raises a
+        ValueError.
+    """
+
+    def __init__(self, cache_fpath, signature, dtype=None):
+        if dtype is None:
+            dtype = DEF_CACHE_DTYPE
+        self.cache_fpath = cache_fpath
+        self.tmp_fpath = cache_fpath + TMP_SUFFIX
+        self.signature = signature
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.malformed_lines = 0
+        self._f = open(self.tmp_fpath, 'wb')
+        self._f.write(b'\0' * HEADER_BYTES)
+
+    def add(self, edges, malformed_lines=0):
+        """Appends an (n, 2) array of edges to the cache."""
+        if len(edges) > 0:
+            info = np.iinfo(self.dtype)
+            if edges.min() < info.min or edges.max() > info.max:
+                raise ValueError(
+                    f"An edge uid is out of the range of {self.dtype}.")
+        self._f.write(np.ascontiguousarray(edges, dtype=self.dtype).data)
+        self.count += len(edges)
+        self.malformed_lines += malformed_lines
+
+    def finish(self):
+        """Writes the header and moves the complete cache into place."""
+        doc = json.dumps({
+            'version': CACHE_VERSION,
+            'dtype': self.dtype.name,
+            'count': self.count,
+            'malformed_lines': self.malformed_lines,
+            'source': self.signature,
+        }).encode('utf-8')
+        header = MAGIC + _LENGTH_STRUCT.pack(len(doc)) + doc
+        if len(header) > HEADER_BYTES:
+            raise ValueError("The edge cache header is too long.")
+        self._f.seek(0)
+        self._f.write(header)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self.tmp_fpath, self.cache_fpath)
+
+    def abort(self):
+        """Drops the partially written cache."""
+        self._f.close()
+        if os.path.exists(self.tmp_fpath):
+            os.remove(self.tmp_fpath)
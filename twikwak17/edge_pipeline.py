@@ -0,0 +1,383 @@
+"""A multi-process pipeline filtering an edge list through shared memory.
+
+Inflating a compressed edge list is inherently sequential, but parsing and
+filtering its blocks is not. The pipeline has three stages:
+
+* A reader - the calling thread - inflates the edge list into blocks of
+  whole lines, copying each into a free slot of a ring of shared memory
+  input buffers and queuing only the slot number.
+* Worker processes parse blocks in place, in their slots, filter edges by
+  looking their users up in a uid bitmap or node index memory-mapped from
+  disk - so all workers share the same pages - and format the kept edges
+  into a free shared memory output buffer, queuing only its layout.
+* A writer thread compresses the kept edges of each block, in block order,
+  straight out of its output buffer.
+
+Both inflating and compressing release the GIL, so the reader and writer run
+side by side. Bounded slot and in-flight block counts keep memory use
+constant. Shared memory requires Python 3.8 or later.
+"""
+
+import queue
+import threading
+import traceback
+import multiprocessing as mp
+
+import numpy as np
+
+from twikwak17.edges import (
+    EDGE_BLOCK_BYTES,
+    parse_int_pairs,
+    format_int_pairs,
+)
+from twikwak17.node_index import NodeIndex
+from twikwak17.uid_bitmap import UidBitmap
+
+
+UID_BITMAP = 'uid_bitmap'
+NODE_INDEX = 'node_index'
+SLOTS_PER_WORKER = 2
+IN_FLIGHT_BLOCKS_PER_WORKER = 4
+POLL_SECONDS = 1
+
+
+def _shared_memory():
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise RuntimeError((
+            "Filtering edges in parallel requires Python 3.8 or later, for "
+            "multiprocessing.shared_memory."))
+    return shared_memory
+
+
+def _result_parts(kept_edges, kept_indices, with_dense, with_binary):
+    """Returns the uint8 arrays making up the result of a block: the text of
+    the kept edges, followed by their dense text and their raw pairs, if
+    requested."""
+    parts = [format_int_pairs(kept_edges)]
+    if with_dense:
+        parts.append(format_int_pairs(kept_indices))
+    if with_binary:
+        parts.append(kept_edges)
+        if kept_indices is not None:
+            parts.append(kept_indices)
+    return [
+        np.frombuffer(part, dtype=np.uint8) if isinstance(part, bytes)
+        else np.ascontiguousarray(part, dtype=np.int64).reshape(-1).view(
+            np.uint8)
+        for part in parts
+    ]
+
+
+def filter_edges(edges, uid_bitmap=None, node_index=None):
+    """Keeps the edges whose two users are both found in a uid bitmap or a
+    node index.
+
+    Parameters
+    ----------
+    edges : numpy.ndarray
+        An (n, 2) int64 array of uid pairs.
+    uid_bitmap : twikwak17.uid_bitmap.UidBitmap, optional
+        The users to keep.
+    node_index : twikwak17.node_index.NodeIndex, optional
+        The users to keep, used instead of a uid bitmap if given.
+
+    Returns
+    -------
+    kept_edges : numpy.ndarray
+        The kept uid pairs.
+    kept_indices : numpy.ndarray or None
+        The node index pairs of the kept edges, if a node index was given.
+    """
+    if node_index is not None:
+        indices = node_index.lookup(edges.ravel()).reshape(-1, 2)
+        keep = (indices >= 0).all(axis=1)
+        return edges[keep], indices[keep]
+    return edges[uid_bitmap.contains(edges).all(axis=1)], None
+
+
+def _filter_worker(slot_names, out_slot_names, lookup_kind, lookup_dpath,
+                   with_dense, with_binary, task_queue, free_slots,
+                   free_out_slots, result_queue):
+    shared_memory = _shared_memory()
+    # workers share the resource tracker of the parent, which unlinks the
+    # slots, so attaching to them here registers nothing new
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    out_slots = [
+        shared_memory.SharedMemory(name=name) for name in out_slot_names]
+    data = None
+    out_view = None
+    try:
+        uid_bitmap = None
+        node_index = None
+        if lookup_kind == NODE_INDEX:
+            node_index = NodeIndex(lookup_dpath)
+        else:
+            uid_bitmap = UidBitmap.load(lookup_dpath)
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            seq, slot_ix, n_bytes = task
+            # the block is parsed in place; its slot is freed once parsed
+            data = np.frombuffer(
+                slots[slot_ix].buf, dtype=np.uint8, count=n_bytes)
+            edges, malformed = parse_int_pairs(data)
+            data = None
+            free_slots.put(slot_ix)
+            kept_edges, kept_indices = filter_edges(
+                edges, uid_bitmap, node_index)
+            parts = _result_parts(
+                kept_edges, kept_indices, with_dense, with_binary)
+            sizes = [len(part) for part in parts]
+            counts = (seq, len(edges), malformed, len(kept_edges))
+            if sum(sizes) > out_slots[0].size:
+                # raw pairs can outgrow an output buffer; such results are
+                # sent through the result queue instead
+                result_queue.put(counts + (None, parts))
+                continue
+            out_slot_ix = free_out_slots.get()
+            out_view = np.frombuffer(
+                out_slots[out_slot_ix].buf, dtype=np.uint8,
+                count=sum(sizes))
+            out_view[:] = np.concatenate(parts)
+            out_view = None
+            result_queue.put(counts + (out_slot_ix, sizes))
+    except Exception:
+        result_queue.put((None, traceback.format_exc()))
+    finally:
+        # views must be released before their slots are closed
+        data = None
+        out_view = None
+        result_queue.put(None)
+        for slot in slots + out_slots:
+            slot.close()
+
+
+class _OrderedWriter(threading.Thread):
+    """Writes the results of blocks to the output files in block order."""
+
+    def __init__(self, result_queue, n_workers, out_slots, free_out_slots,
+                 out_f, dense_out_f, binary_writer, in_flight,
+                 progress_callback=None):
+        super().__init__(daemon=True)
+        self.result_queue = result_queue
+        self.out_slots = out_slots
+        self.free_out_slots = free_out_slots
+        self.n_workers = n_workers
+        self.out_f = out_f
+        self.dense_out_f = dense_out_f
+        self.binary_writer = binary_writer
+        self.in_flight = in_flight
+        self.progress_callback = progress_callback
+        self.counts = {'edges_read': 0, 'edges_dumped': 0,
+                       'malformed_lines': 0}
+        self.error = None
+
+    def run(self):
+        pending = {}
+        next_seq = 0
+        workers_done = 0
+        try:
+            while workers_done < self.n_workers:
+                result = self.result_queue.get()
+                if result is None:
+                    workers_done += 1
+                    continue
+                if result[0] is None:
+                    raise RuntimeError(
+                        f"An edge filtering worker failed:\n{result[1]}")
+                pending[result[0]] = result
+                while next_seq in pending:
+                    self._write(pending.pop(next_seq))
+                    next_seq += 1
+                    self.in_flight.release()
+        except Exception as e:
+            self.error = e
+            # unblock the reader, which checks for errors
+            self.in_flight.release()
+
+    def _write(self, result):
+        _, n_edges, malformed, n_kept, out_slot_ix, layout = result
+        parts = layout
+        if out_slot_ix is not None:
+            view = np.frombuffer(
+                self.out_slots[out_slot_ix].buf, dtype=np.uint8,
+                count=sum(layout))
+            ends = np.cumsum(layout)
+            parts = [
+                view[end - size:end] for size, end in zip(layout, ends)]
+            view = None
+        try:
+            self.out_f.write(parts[0])
+            if self.dense_out_f is not None:
+                self.dense_out_f.write(parts[1])
+            if self.binary_writer is not None:
+                # the binary writer buffers its pairs, so they are copied
+                # out of the output buffer
+                pairs = [
+                    part.view(np.int64).reshape(-1, 2).copy()
+                    for part in parts[1 + (self.dense_out_f is not None):]]
+                self.binary_writer.add_pairs(*pairs)
+        finally:
+            parts = None
+        if out_slot_ix is not None:
+            self.free_out_slots.put(out_slot_ix)
+        self.counts['edges_read'] += n_edges
+        self.counts['edges_dumped'] += n_kept
+        self.counts['malformed_lines'] += malformed
+        if self.progress_callback is not None:
+            self.progress_callback(self.counts)
+
+
+def _wait_for(get, writer, workers):
+    """Blocks on get(timeout) until it stops raising queue.Empty, failing if
+    the writer or a worker did."""
+    while True:
+        if writer.error is not None:
+            raise writer.error
+        if not all(worker.is_alive() for worker in workers):
+            writer.join(POLL_SECONDS)
+            if writer.error is not None:
+                raise writer.error
+            raise RuntimeError("An edge filtering worker exited early.")
+        try:
+            return get(POLL_SECONDS)
+        except queue.Empty:
+            continue
+
+
+def filter_edge_list_in_parallel(
+        edge_f, out_f, n_workers, uid_bitmap_dpath=None,
+        node_index_dpath=None, dense_out_f=None, binary_writer=None,
+        block_bytes=None, progress_callback=None):
+    """Filters an edge list to edges between known users, in parallel.
+
+    Parameters
+    ----------
+    edge_f : file
+        The edge list, opened for binary reading.
+    out_f : file
+        The file kept edges are written to, opened for binary writing.
+    n_workers : int
+        The number of parsing and filtering worker processes.
+    uid_bitmap_dpath : str, optional
+        The path to a saved uid bitmap of the users to keep.
+    node_index_dpath : str, optional
+        The path to a node index of the users to keep, used instead of a uid
+        bitmap if given.
+    dense_out_f : file, optional
+        If given, kept edges are also written to it by node index. Requires a
+        node index.
+    binary_writer : twikwak17.binary_edges.BinaryEdgeListWriter, optional
+        If given, kept edges are also added to it, in block order.
+    block_bytes : int, optional
+        The size of each block, and of each shared memory slot. Defaults to
+        16 MiB.
+    progress_callback : callable, optional
+        Called with a dict of counts after each block is written.
+
+    Returns
+    -------
+    dict
+        The number of edges read and dumped and of malformed lines.
+    """
+    if block_bytes is None:
+        block_bytes = EDGE_BLOCK_BYTES
+    if node_index_dpath is not None:
+        lookup_kind, lookup_dpath = NODE_INDEX, node_index_dpath
+    elif uid_bitmap_dpath is not None:
+        lookup_kind, lookup_dpath = UID_BITMAP, uid_bitmap_dpath
+    else:
+        raise ValueError("Either a uid bitmap or a node index is required.")
+    if dense_out_f is not None and lookup_kind != NODE_INDEX:
+        raise ValueError(
+            "Writing a dense-index edge list requires a node index.")
+    shared_memory = _shared_memory()
+    n_slots = n_workers * SLOTS_PER_WORKER
+    # every block in flight can hold an output buffer, so workers never wait
+    # on one held by a block the writer cannot yet write
+    n_in_flight = n_workers * IN_FLIGHT_BLOCKS_PER_WORKER
+    slots = []
+    out_slots = []
+    workers = []
+    try:
+        for _ in range(n_slots):
+            slots.append(shared_memory.SharedMemory(
+                create=True, size=block_bytes))
+        # the text of kept edges is never longer than the block they were
+        # parsed out of, nor is their dense-index text
+        out_slot_bytes = block_bytes * (2 if dense_out_f is not None else 1)
+        for _ in range(n_in_flight):
+            out_slots.append(shared_memory.SharedMemory(
+                create=True, size=out_slot_bytes))
+        task_queue = mp.Queue()
+        free_slots = mp.Queue()
+        free_out_slots = mp.Queue()
+        result_queue = mp.Queue()
+        for slot_ix in range(n_slots):
+            free_slots.put(slot_ix)
+        for out_slot_ix in range(n_in_flight):
+            free_out_slots.put(out_slot_ix)
+        for _ in range(n_workers):
+            worker = mp.Process(target=_filter_worker, daemon=True, args=(
+                [slot.name for slot in slots],
+                [slot.name for slot in out_slots], lookup_kind, lookup_dpath,
+                dense_out_f is not None, binary_writer is not None,
+                task_queue, free_slots, free_out_slots, result_queue))
+            worker.start()
+            workers.append(worker)
+        in_flight = threading.Semaphore(n_in_flight)
+        writer = _OrderedWriter(
+            result_queue, n_workers, out_slots, free_out_slots, out_f,
+            dense_out_f, binary_writer, in_flight, progress_callback)
+        writer.start()
+
+        def _acquire_in_flight(timeout):
+            if not in_flight.acquire(timeout=timeout):
+                raise queue.Empty()
+
+        def _get_free_slot(timeout):
+            return free_slots.get(timeout=timeout)
+
+        seq = 0
+        remainder = b''
+        while True:
+            chunk = edge_f.read(block_bytes - len(remainder))
+            data = remainder + chunk
+            remainder = b''
+            if chunk:
+                cut = data.rfind(b'\n') + 1
+                if cut == 0:
+                    raise ValueError(
+                        f"A line is longer than the {block_bytes:,} byte "
+                        "block size.")
+                remainder = data[cut:]
+                data = data[:cut]
+            if data:
+                _wait_for(_acquire_in_flight, writer, workers)
+                slot_ix = _wait_for(_get_free_slot, writer, workers)
+                slots[slot_ix].buf[:len(data)] = data
+                task_queue.put((seq, slot_ix, len(data)))
+                seq += 1
+            if not chunk:
+                break
+        for _ in workers:
+            task_queue.put(None)
+        while writer.is_alive():
+            writer.join(POLL_SECONDS)
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                raise RuntimeError("An edge filtering worker exited early.")
+        if writer.error is not None:
+            raise writer.error
+        for worker in workers:
+            worker.join()
+        return writer.counts
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for slot in slots + out_slots:
+            slot.close()
+            slot.unlink()
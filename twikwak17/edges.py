@@ -0,0 +1,271 @@
+"""Vectorized parsing, filtering and formatting of uid-pair edge lists.
+
+Edge list files - like kwak10's ``twitter_rv.net`` - hold a pair of
+non-negative integers on each line, separated by whitespace. Rather than
+parsing them a line at a time, the functions here read large byte blocks and
+parse all numbers in a block at once with numpy, so per-edge work stays out
+of Python.
+"""
+
+import gzip
+
+import numpy as np
+
+
+EDGE_BLOCK_BYTES = 16 * 1024 * 1024
+MAX_DIGITS = 18
+_POW10 = 10 ** np.arange(MAX_DIGITS + 1, dtype=np.int64)
+_ZERO = ord('0')
+_NINE = ord('9')
+_NEWLINE = ord('\n')
+_SPACE = ord(' ')
+_TAB = ord('\t')
+
+
+def _parse_well_formed_int_pairs(buf):
+    """Parses the given uint8 array with numpy's C number parser if every
+    line is two numbers separated by a single tab or space. Returns None
+    otherwise."""
+    n_lines = int(np.count_nonzero(buf == _NEWLINE))
+    # with digits deleted, a well-formed block is one separator per line
+    skeleton = buf[(buf < _ZERO) | (buf > _NINE)]
+    if len(skeleton) != 2 * n_lines:
+        return None
+    separators = skeleton[0::2]
+    if not ((separators == _TAB) | (separators == _SPACE)).all() or not (
+            skeleton[1::2] == _NEWLINE).all():
+        return None
+    numbers = np.fromstring(buf, dtype=np.int64, sep=' ')
+    if len(numbers) != 2 * n_lines:
+        return None
+    if n_lines > 0 and numbers.max() >= _POW10[MAX_DIGITS]:
+        return None
+    return numbers.reshape(-1, 2)
+
+
+def parse_int_pairs(data):
+    """Parses the lines of two integers in the given bytes.
+
+    Numbers are maximal runs of digits, and anything else separates them.
+    Lines with no numbers are skipped, and lines holding any other number of
+    numbers than two, or a number of more than 18 digits, are malformed.
+
+    Blocks of only well-formed lines - the common case - are parsed by
+    numpy's C number parser. Other blocks are tokenized with numpy array
+    operations.
+
+    Parameters
+    ----------
+    data : bytes or numpy.ndarray
+        Whole lines of text, either as bytes or as a uint8 array - e.g. a
+        view of a shared memory buffer, which is parsed in place.
+
+    Returns
+    -------
+    pairs : numpy.ndarray
+        An (n, 2) int64 array of the pairs of all well-formed lines.
+    malformed : int
+        The number of malformed lines.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    pairs = _parse_well_formed_int_pairs(buf)
+    if pairs is not None:
+        return pairs, 0
+    is_digit = (buf >= _ZERO) & (buf <= _NINE)
+    digit_pos = np.flatnonzero(is_digit)
+    if len(digit_pos) == 0:
+        return np.empty((0, 2), dtype=np.int64), 0
+    # a digit starts a number unless the byte before it is a digit too
+    is_start = np.ones(len(digit_pos), dtype=bool)
+    is_start[1:] = digit_pos[1:] != digit_pos[:-1] + 1
+    first_digit_ix = np.flatnonzero(is_start)
+    number_len = np.diff(np.append(first_digit_ix, len(digit_pos)))
+    number_ix = np.cumsum(is_start) - 1
+    last_digit_pos = digit_pos[
+        np.append(first_digit_ix[1:], len(digit_pos)) - 1]
+    power = np.minimum(last_digit_pos[number_ix] - digit_pos, MAX_DIGITS)
+    digits = (buf[digit_pos] - _ZERO).astype(np.int64)
+    numbers = np.add.reduceat(digits * _POW10[power], first_digit_ix)
+
+    newline_pos = np.flatnonzero(buf == _NEWLINE)
+    line_of_number = np.searchsorted(newline_pos, digit_pos[first_digit_ix])
+    n_lines = len(newline_pos) + 1
+    numbers_per_line = np.bincount(line_of_number, minlength=n_lines)
+    bad_per_line = np.bincount(
+        line_of_number, weights=number_len > MAX_DIGITS, minlength=n_lines)
+    good_line = (numbers_per_line == 2) & (bad_per_line == 0)
+    malformed = int(((numbers_per_line > 0) & ~good_line).sum())
+    pairs = numbers[good_line[line_of_number]].reshape(-1, 2)
+    return pairs, malformed
+
+
+def iter_int_pair_blocks(f, block_bytes=None, counts=None):
+    """Yields the integer pairs of a file of lines of two integers, in blocks.
+
+    Parameters
+    ----------
+    f : file
+        A file opened for binary reading.
+    block_bytes : int, optional
+        The number of bytes read at a time. Defaults to 16 MiB.
+    counts : dict, optional
+        If given, the number of bytes read, pairs parsed and malformed lines
+        are kept in it.
+
+    Yields
+    ------
+    numpy.ndarray
+        An (n, 2) int64 array of the pairs of each block.
+    """
+    if block_bytes is None:
+        block_bytes = EDGE_BLOCK_BYTES
+    if counts is None:
+        counts = {}
+    counts['bytes_read'] = 0
+    counts['pairs'] = 0
+    counts['malformed_lines'] = 0
+    remainder = b''
+    while True:
+        block = f.read(block_bytes)
+        if not block:
+            data = remainder
+            remainder = b''
+        else:
+            counts['bytes_read'] += len(block)
+            block = remainder + block
+            cut = block.rfind(b'\n') + 1
+            data = block[:cut]
+            remainder = block[cut:]
+        if data:
+            pairs, malformed = parse_int_pairs(data)
+            counts['pairs'] += len(pairs)
+            counts['malformed_lines'] += malformed
+            yield pairs
+        if not block:
+            return
+
+
+def read_uid2gender_file(uid2gender_fpath):
+    """Reads a gzipped uid-to-gender file in blocks.
+
+    Of several lines with the same uid the last is kept; malformed lines are
+    skipped.
+
+    Parameters
+    ----------
+    uid2gender_fpath : str
+        The full qualified path to a gzipped uid-to-gender file.
+
+    Returns
+    -------
+    uids, genders : numpy.ndarray, numpy.ndarray
+        The sorted, distinct int64 uids of the file, and their int8 genders.
+    """
+    uids = []
+    genders = []
+    with gzip.open(uid2gender_fpath, 'rb') as f:
+        for pairs in iter_int_pair_blocks(f):
+            uids.append(pairs[:, 0])
+            genders.append(pairs[:, 1])
+    if len(uids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
+    uids = np.concatenate(uids)
+    genders = np.concatenate(genders).astype(np.int8)
+    order = np.argsort(uids, kind='stable')
+    uids = uids[order]
+    is_last = np.ones(len(uids), dtype=bool)
+    is_last[:-1] = uids[:-1] != uids[1:]
+    return uids[is_last], genders[order[is_last]]
+
+
+def lookup_sorted(sorted_values, values):
+    """Looks values up in a sorted array by binary search.
+
+    Unlike numpy.isin, the sorted array is not sorted again on each call.
+
+    Parameters
+    ----------
+    sorted_values : numpy.ndarray
+        A sorted int64 array.
+    values : array-like of int
+        The values to look up, of any shape.
+
+    Returns
+    -------
+    indices, found : numpy.ndarray, numpy.ndarray
+        The position of each value in the sorted array, valid only where it
+        was found, and a boolean mask of which values were found.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if len(sorted_values) == 0:
+        return (np.zeros(values.shape, dtype=np.int64),
+                np.zeros(values.shape, dtype=bool))
+    indices = np.searchsorted(sorted_values, values)
+    indices[indices == len(sorted_values)] = 0
+    return indices, sorted_values[indices] == values
+
+
+def is_in_sorted(sorted_values, values):
+    """Returns a boolean mask of which values are found in a sorted array.
+
+    Parameters
+    ----------
+    sorted_values : numpy.ndarray
+        A sorted int64 array.
+    values : array-like of int
+        The values to look up, of any shape.
+    """
+    return lookup_sorted(sorted_values, values)[1]
+
+
+def _digit_matrix(values, width):
+    digits = np.empty((len(values), width), dtype=np.uint8)
+    remaining = values.copy()
+    for col in range(width - 1, -1, -1):
+        digits[:, col] = remaining % 10 + _ZERO
+        remaining //= 10
+    n_digits = 1 + (values[:, None] >= _POW10[1:width][None, :]).sum(axis=1)
+    used = np.arange(width)[None, :] >= (width - n_digits)[:, None]
+    return digits, used
+
+
+def _constant_columns(n, text):
+    row = np.frombuffer(text, dtype=np.uint8)
+    return (np.broadcast_to(row, (n, len(row))),
+            np.ones((n, len(row)), dtype=bool))
+
+
+def format_int_pairs(pairs, prefix=b'', separator=b' ', suffix=b'\n'):
+    """Formats integer pairs as lines of text, with numpy array operations.
+
+    Parameters
+    ----------
+    pairs : numpy.ndarray
+        An (n, 2) array of non-negative integers.
+    prefix : bytes, default b''
+        The text each line starts with.
+    separator : bytes, default b' '
+        The text between the two numbers of each line.
+    suffix : bytes, default b'\\n'
+        The text each line ends with.
+
+    Returns
+    -------
+    bytes
+        The ASCII text of all lines.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64)
+    if len(pairs) == 0:
+        return b''
+    n = len(pairs)
+    width = len(str(int(pairs.max())))
+    parts = [
+        _constant_columns(n, prefix),
+        _digit_matrix(pairs[:, 0], width),
+        _constant_columns(n, separator),
+        _digit_matrix(pairs[:, 1], width),
+        _constant_columns(n, suffix),
+    ]
+    text = np.hstack([part[0] for part in parts])
+    used = np.hstack([part[1] for part in parts])
+    return text[used].tobytes()
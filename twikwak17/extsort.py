@@ -0,0 +1,177 @@
+"""An external sort of int64 keys with payloads, by sorted runs.
+
+Records are added in chunks, and buffered into runs of a bounded size. Each
+full run is sorted and written to disk by a pool of worker threads - numpy
+sorts release the GIL - so run generation overlaps whatever produces the
+records. Sorted runs are then merged, a block at a time, by memory mapping
+them.
+"""
+
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+DEF_RUN_SIZE = 16 * 1000000
+DEF_BLOCK_SIZE = 1000000
+RUN_FNAME_TEMPLATE = 'run_{:05d}_{}.npy'
+
+
+def _sort_and_write_run(keys, payloads, keys_fpath, payloads_fpath):
+    order = np.argsort(keys, kind='stable')
+    np.save(keys_fpath, keys[order])
+    np.save(payloads_fpath, payloads[order])
+
+
+class ExternalSorter(object):
+    """Sorts int64 keys, and their payloads, in bounded memory.
+
+    Parameters
+    ----------
+    tmp_dpath : str
+        The path to a folder for the sorted runs. Created if needed, and
+        removed when the sorter is closed.
+    payload_dtype : numpy.dtype, default numpy.int8
+        The dtype of the payload kept with each key.
+    run_size : int, optional
+        The number of records in each sorted run. Defaults to 16 million.
+    n_workers : int, optional
+        The number of threads sorting and writing runs. Defaults to the
+        number of CPUs. At most this many full runs are held in memory at
+        once.
+    """
+
+    def __init__(self, tmp_dpath, payload_dtype=np.int8, run_size=None,
+                 n_workers=None):
+        if run_size is None:
+            run_size = DEF_RUN_SIZE
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        os.makedirs(tmp_dpath, exist_ok=True)
+        self.tmp_dpath = tmp_dpath
+        self.payload_dtype = payload_dtype
+        self.run_size = run_size
+        self.n_workers = n_workers
+        self.record_count = 0
+        self._keys = []
+        self._payloads = []
+        self._buffered = 0
+        self._runs = []
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    def _run_fpaths(self, run_ix):
+        return tuple(
+            os.path.join(
+                self.tmp_dpath, RUN_FNAME_TEMPLATE.format(run_ix, name))
+            for name in ('keys', 'payloads')
+        )
+
+    def add(self, keys, payloads):
+        """Adds records to sort.
+
+        Parameters
+        ----------
+        keys : array-like of int
+            The int64 sort keys of the records.
+        payloads : array-like
+            The payloads of the records, one per key.
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        payloads = np.asarray(payloads, dtype=self.payload_dtype)
+        if len(keys) != len(payloads):
+            raise ValueError("Got a different number of keys and payloads.")
+        self._keys.append(keys)
+        self._payloads.append(payloads)
+        self._buffered += len(keys)
+        self.record_count += len(keys)
+        if self._buffered >= self.run_size:
+            self._submit_run()
+
+    def _submit_run(self):
+        if self._buffered < 1:
+            return
+        while len(self._pending) >= self.n_workers:
+            self._pending.popleft().result()
+        fpaths = self._run_fpaths(len(self._runs))
+        self._pending.append(self._executor.submit(
+            _sort_and_write_run, np.concatenate(self._keys),
+            np.concatenate(self._payloads), *fpaths))
+        self._runs.append(fpaths)
+        self._keys = []
+        self._payloads = []
+        self._buffered = 0
+
+    def _finish_runs(self):
+        self._submit_run()
+        while self._pending:
+            self._pending.popleft().result()
+
+    def iter_sorted(self, block_size=None):
+        """Yields all added records in key order, in blocks.
+
+        Parameters
+        ----------
+        block_size : int, optional
+            The number of records read from each run at a time. Defaults to
+            one million.
+
+        Yields
+        ------
+        keys, payloads : numpy.ndarray, numpy.ndarray
+            The keys and payloads of each block of records.
+        """
+        if block_size is None:
+            block_size = DEF_BLOCK_SIZE
+        self._finish_runs()
+        runs = [
+            (np.load(keys_fpath, mmap_mode='r'),
+             np.load(payloads_fpath, mmap_mode='r'))
+            for keys_fpath, payloads_fpath in self._runs
+        ]
+        positions = [0] * len(runs)
+        while True:
+            active = [
+                i for i, (keys, _) in enumerate(runs)
+                if positions[i] < len(keys)
+            ]
+            if not active:
+                return
+            ends = {
+                i: min(positions[i] + block_size, len(runs[i][0]))
+                for i in active
+            }
+            # every record not yet merged is at least this large, so all
+            # records up to it can be merged now
+            cutoff = min(runs[i][0][ends[i] - 1] for i in active)
+            block_keys = []
+            block_payloads = []
+            for i in active:
+                keys, payloads = runs[i]
+                window = np.asarray(keys[positions[i]:ends[i]])
+                count = int(np.searchsorted(window, cutoff, side='right'))
+                block_keys.append(window[:count])
+                block_payloads.append(np.asarray(
+                    payloads[positions[i]:positions[i] + count]))
+                positions[i] += count
+            block_keys = np.concatenate(block_keys)
+            block_payloads = np.concatenate(block_payloads)
+            if len(active) > 1:
+                order = np.argsort(block_keys, kind='stable')
+                block_keys = block_keys[order]
+                block_payloads = block_payloads[order]
+            yield block_keys, block_payloads
+
+    def close(self):
+        """Stops the worker threads and removes all sorted runs."""
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self.tmp_dpath, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
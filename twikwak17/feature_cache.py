@@ -0,0 +1,244 @@
+"""Sharded, memory-mapped caches of per-user SPEKS feature matrices.
+
+A feature cache is a folder holding a sparse users-by-vocabulary token count
+matrix, split into shards of consecutive rows. Each shard is a CSR matrix
+saved as .npy files - indptr, indices and counts - together with the total
+token count (lengths) and the username of each of its rows. Rows are kept in
+the order users were classified by phase 4, i.e. sorted by username.
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+
+from twikwak17.packed import (
+    PackedStrings,
+    PackedStringsBuilder,
+)
+
+
+META_FNAME = 'meta.json'
+SHARD_FNAME_TEMPLATE = 'shard_{:05d}_{}.npy'
+SHARD_ARRAYS = ('indptr', 'indices', 'counts', 'lengths')
+SHARD_DTYPES = {
+    'indptr': np.int64,
+    'indices': np.int32,
+    'counts': np.int32,
+    'lengths': np.int32,
+}
+DEF_SHARD_ROWS = 1000000
+DEF_CHUNK_ROWS = 100000
+
+
+def _shard_fpath(dpath, shard_ix, name):
+    return os.path.join(dpath, SHARD_FNAME_TEMPLATE.format(shard_ix, name))
+
+
+def feature_cache_exists(dpath):
+    return os.path.isfile(os.path.join(dpath, META_FNAME))
+
+
+class FeatureCacheWriter(object):
+    """Writes the feature matrices of users as a sharded feature cache.
+
+    The metadata file is only written by close(), so an interrupted cache is
+    never taken for a complete one; used as a context manager, the folder is
+    removed if an exception is raised.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to the designated cache folder. Created if needed.
+    vocab : list of str
+        The token vocabulary indexed by the feature columns.
+    shard_rows : int, optional
+        The number of users in each shard. Defaults to 1,000,000.
+    inputs : list, optional
+        A JSON-able signature of the inputs the features are computed from,
+        recorded in the cache metadata.
+    """
+
+    def __init__(self, dpath, vocab, shard_rows=None, inputs=None):
+        if shard_rows is None:
+            shard_rows = DEF_SHARD_ROWS
+        os.makedirs(dpath, exist_ok=True)
+        meta_fpath = os.path.join(dpath, META_FNAME)
+        if os.path.exists(meta_fpath):
+            os.remove(meta_fpath)
+        self.dpath = dpath
+        self.vocab = list(vocab)
+        self.shard_rows = shard_rows
+        self.inputs = inputs
+        self._shard_sizes = []
+        self._reset()
+
+    def _reset(self):
+        self._users = PackedStringsBuilder()
+        self._parts = {name: [] for name in SHARD_ARRAYS}
+        self._nnz = 0
+
+    def add(self, users, features):
+        """Adds the feature matrix rows of the given users.
+
+        Parameters
+        ----------
+        users : list of str
+            The usernames of the rows.
+        features : tuple of numpy.ndarray
+            The CSR matrix of the users, as returned by
+            twikwak17.gender.SpeksLexiconModel.features().
+        """
+        indptr, indices, counts, lengths = features
+        for user in users:
+            self._users.append(user.encode('utf-8', errors='surrogatepass'))
+        self._parts['indptr'].append(indptr[1:] + self._nnz)
+        self._parts['indices'].append(indices)
+        self._parts['counts'].append(counts)
+        self._parts['lengths'].append(lengths)
+        self._nnz += int(indptr[-1])
+        if len(self._users) >= self.shard_rows:
+            self._flush()
+
+    def _flush(self):
+        if len(self._users) < 1:
+            return
+        shard_ix = len(self._shard_sizes)
+        self._parts['indptr'].insert(0, np.zeros(1, dtype=np.int64))
+        for name in SHARD_ARRAYS:
+            np.save(
+                _shard_fpath(self.dpath, shard_ix, name),
+                np.concatenate(self._parts[name]).astype(SHARD_DTYPES[name]),
+            )
+        users = self._users.build()
+        np.save(_shard_fpath(self.dpath, shard_ix, 'users_blob'), users.arena)
+        np.save(
+            _shard_fpath(self.dpath, shard_ix, 'users_offsets'), users.offsets)
+        self._shard_sizes.append(len(users))
+        self._reset()
+
+    def close(self):
+        """Writes the last shard and the cache metadata."""
+        self._flush()
+        meta = {
+            'shard_sizes': self._shard_sizes,
+            'vocab': self.vocab,
+            'inputs': self.inputs,
+        }
+        with open(os.path.join(self.dpath, META_FNAME), 'wt+') as f:
+            json.dump(meta, f)
+
+    def abort(self):
+        """Drops the partially written cache."""
+        shutil.rmtree(self.dpath, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class FeatureCache(object):
+    """A read-only, memory-mapped feature cache.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to a cache folder written by FeatureCacheWriter.
+    """
+
+    def __init__(self, dpath):
+        self.dpath = dpath
+        with open(os.path.join(dpath, META_FNAME), 'rt') as f:
+            meta = json.load(f)
+        self.shard_sizes = meta['shard_sizes']
+        self.vocab = meta['vocab']
+        self.inputs = meta.get('inputs')
+
+    def __len__(self):
+        return sum(self.shard_sizes)
+
+    def shard(self, shard_ix):
+        """Memory maps the given shard.
+
+        Returns
+        -------
+        users, arrays : twikwak17.packed.PackedStrings, dict
+            The usernames of the shard rows, and its indptr, indices, counts
+            and lengths arrays.
+        """
+        users = PackedStrings(
+            arena=np.load(_shard_fpath(
+                self.dpath, shard_ix, 'users_blob'), mmap_mode='r'),
+            offsets=np.load(_shard_fpath(
+                self.dpath, shard_ix, 'users_offsets'), mmap_mode='r'),
+        )
+        arrays = {
+            name: np.load(
+                _shard_fpath(self.dpath, shard_ix, name), mmap_mode='r')
+            for name in SHARD_ARRAYS
+        }
+        return users, arrays
+
+    def iter_chunks(self, chunk_rows=None):
+        """Yields the cached matrix in chunks of consecutive rows.
+
+        Parameters
+        ----------
+        chunk_rows : int, optional
+            The maximal number of rows in each chunk. Defaults to 100,000.
+
+        Yields
+        ------
+        users, features : list of str, tuple of numpy.ndarray
+            The usernames of the chunk rows, and the CSR matrix of the chunk,
+            in the form returned by SpeksLexiconModel.features().
+        """
+        if chunk_rows is None:
+            chunk_rows = DEF_CHUNK_ROWS
+        for shard_ix in range(len(self.shard_sizes)):
+            users, arrays = self.shard(shard_ix)
+            for start in range(0, len(users), chunk_rows):
+                end = min(start + chunk_rows, len(users))
+                indptr = np.asarray(arrays['indptr'][start:end+1])
+                nnz_slice = slice(indptr[0], indptr[-1])
+                yield [
+                    users[i].decode('utf-8', errors='surrogatepass')
+                    for i in range(start, end)
+                ], (
+                    indptr - indptr[0],
+                    np.asarray(arrays['indices'][nnz_slice], dtype=np.int64),
+                    np.asarray(arrays['counts'][nnz_slice], dtype=np.float64),
+                    np.asarray(
+                        arrays['lengths'][start:end], dtype=np.float64),
+                )
+
+    def iter_predictions(self, model, chunk_rows=None):
+        """Applies a model to the cached features, a chunk at a time.
+
+        Predictions equal those of the model on the original texts, except
+        for rows scoring within twikwak17.gender.EXACT_MATCH_MARGIN of the
+        decision boundary, which cannot be re-checked against the text.
+
+        Parameters
+        ----------
+        model : twikwak17.gender.SpeksLexiconModel
+            A model all of whose weighted tokens are in the cache vocabulary.
+        chunk_rows : int, optional
+            The maximal number of rows scored at once. Defaults to 100,000.
+
+        Yields
+        ------
+        users, predictions : list of str, numpy.ndarray
+            The usernames of each chunk, and an int8 array of their predicted
+            genders.
+        """
+        weights = model.weights_for_vocab(self.vocab)
+        for users, features in self.iter_chunks(chunk_rows):
+            scores = model.score_features(*features, weights=weights)
+            yield users, model.predictions_by_scores(scores)
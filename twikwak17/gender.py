@@ -0,0 +1,368 @@
+"""Batched, vectorized scoring of the SPEKS lexicon-based gender predictor."""
+
+import re
+from math import sin
+from collections import Counter
+
+import numpy as np
+from speks.gender_lex import GENDER_LEXICON
+from speks.tokenization import tokenize_no_case_preserving
+
+
+# the intercept hard-coded into speks.predict_gender_by_tweets
+SPEKS_INTERCEPT = -0.06724152
+# scores this close to the decision boundary might flip sign on float
+# summation order alone, so they are decided by the per-text SPEKS path
+EXACT_MATCH_MARGIN = 1e-9
+DEF_BUCKET_SIZE = 256
+DEF_PREFIX_WORDS = (1000, 10000, 100000)
+FULL_TEXT = 'full'
+FEMALE = 1
+MALE = 0
+
+
+_PREFIX_REGEXES = {}
+_NON_SPACE_REGEX = re.compile(r'\S')
+
+
+def word_prefix(text, n_words):
+    """Returns the prefix of text holding its first n_words words, or None if
+    text does not have more than n_words words."""
+    if n_words not in _PREFIX_REGEXES:
+        # whitespace and non-whitespace runs alternate, so a failing match
+        # never backtracks into how earlier words were split
+        _PREFIX_REGEXES[n_words] = re.compile(
+            r'\s*(?:\S+\s+){%d}\S+' % (n_words - 1))
+    match = _PREFIX_REGEXES[n_words].match(text)
+    if match is None or not _NON_SPACE_REGEX.search(text, match.end()):
+        return None
+    return match.group(0)
+
+
+class SpeksLexiconModel(object):
+    """The SPEKS gender predictor, scoring many texts with one vectorized call.
+
+    For each text, the SPEKS score is the sine of the intercept plus the sum
+    of lexicon weights of its distinct tokens, each weighted by its relative
+    frequency in the text. A batch of texts is turned into a sparse
+    texts-by-vocabulary matrix of token counts, in CSR form, and all scores are
+    computed with a single weighted np.bincount() call.
+
+    Parameters
+    ----------
+    lexicon : dict of str to float, optional
+        Maps tokens to weights. Defaults to the SPEKS gender lexicon.
+    intercept : float, optional
+        The model intercept. Defaults to the SPEKS intercept.
+    threshold : float, default 0
+        Authors of texts scoring at least this are predicted to be female.
+    name : str, default 'speks'
+        The name of the model, used to label its outputs.
+    """
+
+    def __init__(self, lexicon=None, intercept=None, threshold=0,
+                 name='speks'):
+        if lexicon is None:
+            lexicon = GENDER_LEXICON
+        if intercept is None:
+            intercept = SPEKS_INTERCEPT
+        self.lexicon = lexicon
+        self.vocab = {token: i for i, token in enumerate(lexicon.keys())}
+        self.weights = np.array(list(lexicon.values()), dtype=np.float64)
+        self.intercept = intercept
+        self.threshold = threshold
+        self.name = name
+
+    def features(self, texts):
+        """Builds the sparse token count matrix of the given texts.
+
+        Parameters
+        ----------
+        texts : list of str
+            The texts to extract features from.
+
+        Returns
+        -------
+        indptr, indices, counts, lengths : numpy.ndarray
+            The CSR row pointers, column (vocabulary) indices and token counts
+            of the matrix, and the total number of tokens of each text.
+        """
+        indptr = [0]
+        indices = []
+        counts = []
+        lengths = []
+        vocab = self.vocab
+        for text in texts:
+            tokens = tokenize_no_case_preserving(text)
+            lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                token_ix = vocab.get(token)
+                if token_ix is not None:
+                    indices.append(token_ix)
+                    counts.append(count)
+            indptr.append(len(indices))
+        return (
+            np.array(indptr, dtype=np.int64),
+            np.array(indices, dtype=np.int64),
+            np.array(counts, dtype=np.float64),
+            np.array(lengths, dtype=np.float64),
+        )
+
+    def weights_for_vocab(self, vocab):
+        """Returns the weights of the model for the given token vocabulary.
+
+        Parameters
+        ----------
+        vocab : list of str
+            A token vocabulary, e.g. the one of saved feature matrices.
+
+        Returns
+        -------
+        numpy.ndarray
+            A float64 array with the weight of each vocabulary token.
+
+        Raises
+        ------
+        ValueError
+            If a token with non-zero weight in the model is not in vocab, so
+            features over vocab cannot be scored by the model.
+        """
+        vocab_ixs = {token: i for i, token in enumerate(vocab)}
+        missing = [
+            token for token, weight in self.lexicon.items()
+            if weight != 0 and token not in vocab_ixs
+        ]
+        if missing:
+            raise ValueError((
+                f"{len(missing):,} weighted tokens of the model are not in "
+                f"the given vocabulary; e.g. {missing[:5]}."))
+        return np.array(
+            [self.lexicon.get(token, 0) for token in vocab], dtype=np.float64)
+
+    def score_features(self, indptr, indices, counts, lengths, weights=None):
+        """Scores a sparse token count matrix, as returned by features().
+
+        Parameters
+        ----------
+        indptr, indices, counts, lengths : numpy.ndarray
+            The CSR row pointers, column indices and token counts of the
+            matrix, and the total number of tokens of each row.
+        weights : numpy.ndarray, optional
+            The weights of the matrix columns. Defaults to the weights of the
+            vocabulary of this model.
+
+        Returns
+        -------
+        numpy.ndarray
+            The float64 SPEKS scores of all rows.
+        """
+        if weights is None:
+            weights = self.weights
+        n_rows = len(indptr) - 1
+        rows = np.repeat(np.arange(n_rows), np.diff(indptr))
+        # same operation order as speks.gender_predictor.weigh()
+        contributions = weights[indices] * counts / lengths[rows]
+        sums = np.bincount(rows, weights=contributions, minlength=n_rows)
+        return np.sin(self.intercept + sums)
+
+    def scores(self, texts):
+        """Returns the SPEKS scores of the given texts as a float64 array."""
+        return self.score_features(*self.features(texts))
+
+    def predict_with_features(self, texts):
+        """Predicts author gender, also returning the features of all texts.
+
+        Returns
+        -------
+        predictions, features : numpy.ndarray, tuple of numpy.ndarray
+            The int8 predictions, as returned by predict(), and the features
+            of the texts, as returned by features(), in input order.
+        """
+        features = self.features(texts)
+        scores = self.score_features(*features)
+        return self.predictions_by_scores(scores, texts), features
+
+    def predictions_by_scores(self, scores, texts=None):
+        """Thresholds the given scores into int8 gender predictions.
+
+        If the scored texts are given, those scoring within
+        EXACT_MATCH_MARGIN of the threshold are decided by predict_one().
+        """
+        predictions = np.where(
+            scores >= self.threshold, FEMALE, MALE).astype(np.int8)
+        if texts is not None:
+            near = np.abs(scores - self.threshold) < EXACT_MATCH_MARGIN
+            for i in np.flatnonzero(near).tolist():
+                predictions[i] = self.predict_one(texts[i])
+        return predictions
+
+    def predict_one(self, text):
+        """Predicts the gender of the author of a single text, computing its
+        score exactly the way speks.predict_gender_by_tweets() does."""
+        tokens = tokenize_no_case_preserving(text)
+        weights = sum([
+            self.lexicon.get(token, 0) * tokens.count(token) / len(tokens)
+            for token in set(tokens)
+        ])
+        if sin(self.intercept + weights) >= self.threshold:
+            return FEMALE
+        return MALE
+
+    def predict(self, texts, bucket_size=None):
+        """Predicts the gender of the authors of the given texts.
+
+        Texts are scored in buckets of texts of similar length, so that the
+        feature matrix of each bucket is of similar size, and predictions are
+        returned in input order. Predictions are identical to those of
+        speks.predict_gender_by_tweets().
+
+        Parameters
+        ----------
+        texts : list of str
+            The texts to predict author gender for.
+        bucket_size : int, optional
+            The number of texts scored in each vectorized call. Larger buckets
+            are faster, but take more memory. Defaults to 256.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int8 array with 1 for each predicted female author and 0 for
+            each predicted male one.
+        """
+        if bucket_size is None:
+            bucket_size = DEF_BUCKET_SIZE
+        by_length = np.argsort(
+            np.fromiter((len(text) for text in texts), dtype=np.int64,
+                        count=len(texts)),
+            kind='stable',
+        )
+        predictions = np.empty(len(texts), dtype=np.int8)
+        for start in range(0, len(texts), bucket_size):
+            bucket = by_length[start:start+bucket_size]
+            bucket_texts = [texts[i] for i in bucket]
+            predictions[bucket] = self.predictions_by_scores(
+                self.scores(bucket_texts), bucket_texts)
+        return predictions
+
+    def predict_adaptive(self, texts, margin, prefix_words=None,
+                         validation_every=None, stats=None):
+        """Predicts author gender on growing word prefixes of the given texts.
+
+        Each text is first scored on its first prefix_words[0] words; texts
+        scoring at least margin away from the decision boundary exit early,
+        and the rest are scored again on the next, longer prefix, and finally
+        on the whole text. Texts shorter than a prefix are scored whole.
+
+        Parameters
+        ----------
+        texts : list of str
+            The texts to predict author gender for.
+        margin : float
+            The minimal absolute score, in [0, 1], of a prefix prediction for
+            the text to exit early.
+        prefix_words : sequence of int, optional
+            Increasing prefix lengths, in words. Defaults to 1K, 10K and 100K.
+        validation_every : int, optional
+            If given, every text at a position divisible by this number that
+            exits early is also classified on its whole text, to measure the
+            agreement of early and full predictions.
+        stats : collections.Counter, optional
+            If given, the number of texts exiting at each prefix length
+            ('exit_<n>' keys, and 'exit_full'), and the number of validated
+            texts and of those whose early and full predictions agree
+            ('validated' and 'validated_agree' keys) are accumulated in it.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int8 array with 1 for each predicted female author and 0 for
+            each predicted male one.
+        """
+        if prefix_words is None:
+            prefix_words = DEF_PREFIX_WORDS
+        if stats is None:
+            stats = Counter()
+        predictions = np.empty(len(texts), dtype=np.int8)
+        active = list(range(len(texts)))
+        for n_words in prefix_words:
+            prefixes = [word_prefix(texts[i], n_words) for i in active]
+            whole = [
+                i for i, prefix in zip(active, prefixes) if prefix is None]
+            active = [
+                i for i, prefix in zip(active, prefixes) if prefix is not None]
+            prefixes = [prefix for prefix in prefixes if prefix is not None]
+            if whole:
+                predictions[whole] = self.predict([texts[i] for i in whole])
+                stats[f'exit_{FULL_TEXT}'] += len(whole)
+            if not active:
+                break
+            scores = self.scores(prefixes)
+            confident = np.abs(scores - self.threshold) >= margin
+            exiting = np.array(active)[confident]
+            predictions[exiting] = self.predictions_by_scores(
+                scores[confident])
+            stats[f'exit_{n_words}'] += len(exiting)
+            if validation_every is not None:
+                validated = exiting[exiting % validation_every == 0]
+                full = self.predict([texts[i] for i in validated.tolist()])
+                stats['validated'] += len(validated)
+                stats['validated_agree'] += int(
+                    (full == predictions[validated]).sum())
+            active = np.array(active)[~confident].tolist()
+        if active:
+            predictions[active] = self.predict([texts[i] for i in active])
+            stats[f'exit_{FULL_TEXT}'] += len(active)
+        return predictions
+
+
+class MultiModelScorer(object):
+    """Scores texts with several SPEKS-like models in a single pass.
+
+    Texts are tokenized and featurized once, over the union of the
+    vocabularies of all models, and each model is applied to the shared
+    features.
+
+    Parameters
+    ----------
+    models : list of SpeksLexiconModel
+        The models to apply, with distinct names. The first is the primary
+        one.
+    """
+
+    def __init__(self, models):
+        names = [model.name for model in models]
+        if len(set(names)) < len(names):
+            raise ValueError(f"Model names must be distinct; got {names}.")
+        self.models = list(models)
+        vocab = {}
+        for model in self.models:
+            for token in model.lexicon:
+                vocab.setdefault(token, 0)
+        self.featurizer = SpeksLexiconModel(lexicon=vocab)
+        self._weights = [
+            model.weights_for_vocab(vocab.keys()) for model in self.models]
+
+    @property
+    def names(self):
+        return [model.name for model in self.models]
+
+    def predict(self, texts):
+        """Predicts author gender by all models.
+
+        Returns
+        -------
+        predictions, scores : numpy.ndarray, numpy.ndarray
+            An int8 and a float64 array, each of shape (len(models),
+            len(texts)), of the predictions and scores of each model.
+        """
+        features = self.featurizer.features(texts)
+        scores = np.vstack([
+            model.score_features(*features, weights=weights)
+            for model, weights in zip(self.models, self._weights)
+        ]) if texts else np.empty((len(self.models), 0))
+        predictions = np.vstack([
+            model.predictions_by_scores(model_scores, texts)
+            for model, model_scores in zip(self.models, scores)
+        ]) if texts else np.empty((len(self.models), 0), dtype=np.int8)
+        return predictions, scores
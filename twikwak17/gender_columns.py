@@ -0,0 +1,129 @@
+"""Columnar, binary outputs of several gender models over the same users.
+
+A gender columns folder holds, for each model, an int8 gender_<name>.npy
+array of its predictions and, optionally, a float32 score_<name>.npy array of
+its scores; row i of every column is the user on line i of the username to
+gender text map written alongside it. A models.json file lists the models.
+"""
+
+import os
+import json
+import shutil
+
+import numpy as np
+
+
+MODELS_FNAME = 'models.json'
+GENDER_FNAME_TEMPLATE = 'gender_{}.npy'
+SCORE_FNAME_TEMPLATE = 'score_{}.npy'
+
+
+class GenderColumnsWriter(object):
+    """Accumulates the predictions of several models and saves them as
+    columns.
+
+    The models.json file is only written by close(), so interrupted columns
+    are never taken for complete ones; used as a context manager, the folder
+    is removed if an exception is raised.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to the designated output folder. Created if needed.
+    models : list of twikwak17.gender.SpeksLexiconModel
+        The models whose outputs are written, in column order.
+    with_scores : bool, default False
+        If True, model scores are also written.
+    """
+
+    def __init__(self, dpath, models, with_scores=False):
+        os.makedirs(dpath, exist_ok=True)
+        models_fpath = os.path.join(dpath, MODELS_FNAME)
+        if os.path.exists(models_fpath):
+            os.remove(models_fpath)
+        self.dpath = dpath
+        self.models = list(models)
+        self.with_scores = with_scores
+        self._genders = []
+        self._scores = []
+
+    def add(self, predictions, scores):
+        """Adds the outputs of all models for a batch of users.
+
+        Parameters
+        ----------
+        predictions : numpy.ndarray
+            An int8 array of shape (len(models), batch size).
+        scores : numpy.ndarray
+            A float array of the same shape.
+        """
+        self._genders.append(np.asarray(predictions, dtype=np.int8))
+        if self.with_scores:
+            self._scores.append(np.asarray(scores, dtype=np.float32))
+
+    def close(self):
+        n_models = len(self.models)
+        genders = np.concatenate(
+            [np.empty((n_models, 0), dtype=np.int8)] + self._genders, axis=1)
+        for model, column in zip(self.models, genders):
+            np.save(os.path.join(
+                self.dpath, GENDER_FNAME_TEMPLATE.format(model.name)), column)
+        if self.with_scores:
+            scores = np.concatenate(
+                [np.empty((n_models, 0), dtype=np.float32)] + self._scores,
+                axis=1)
+            for model, column in zip(self.models, scores):
+                np.save(os.path.join(
+                    self.dpath, SCORE_FNAME_TEMPLATE.format(model.name)),
+                    column)
+        meta = {
+            'user_count': int(genders.shape[1]),
+            'with_scores': self.with_scores,
+            'models': [
+                {
+                    'name': model.name,
+                    'intercept': model.intercept,
+                    'threshold': model.threshold,
+                    'lexicon_size': len(model.lexicon),
+                }
+                for model in self.models
+            ],
+        }
+        with open(os.path.join(self.dpath, MODELS_FNAME), 'wt+') as f:
+            json.dump(meta, f, indent=2)
+
+    def abort(self):
+        """Drops the partially written columns."""
+        shutil.rmtree(self.dpath, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def load_gender_columns(dpath, mmap_mode='r'):
+    """Loads a gender columns folder.
+
+    Returns
+    -------
+    meta, genders, scores : dict, dict, dict
+        The contents of models.json, and dicts mapping model names to their
+        gender and, if written, score columns.
+    """
+    with open(os.path.join(dpath, MODELS_FNAME), 'rt') as f:
+        meta = json.load(f)
+    genders = {}
+    scores = {}
+    for model in meta['models']:
+        name = model['name']
+        genders[name] = np.load(os.path.join(
+            dpath, GENDER_FNAME_TEMPLATE.format(name)), mmap_mode=mmap_mode)
+        if meta['with_scores']:
+            scores[name] = np.load(os.path.join(
+                dpath, SCORE_FNAME_TEMPLATE.format(name)), mmap_mode=mmap_mode)
+    return meta, genders, scores
@@ -0,0 +1,67 @@
+"""Vectorized, block-wise intersection of sorted username lists."""
+
+import numpy as np
+
+
+EMPTY_KEYS = np.empty(0, dtype='S1')
+
+
+def _next_keys(blocks):
+    """Returns the next non-empty block of keys as an 'S' array, or None."""
+    for keys in blocks:
+        if len(keys) > 0:
+            return np.array(keys, dtype=bytes)
+    return None
+
+
+def iter_sorted_intersection(left_blocks, right_blocks, counts=None):
+    """Yields the intersection of two sorted key streams, window by window.
+
+    Both streams are read in blocks of keys, held as fixed-width 'S' arrays.
+    In each step the window of both buffers up to the smaller of their last
+    keys is intersected with a single vectorized call; keys past that bound
+    are carried over to the next window, so matches are never lost at block
+    boundaries.
+
+    Parameters
+    ----------
+    left_blocks : iterable of list of bytes
+        Blocks of keys of the first stream, sorted in native byte order.
+    right_blocks : iterable of list of bytes
+        Blocks of keys of the second stream, sorted in native byte order.
+    counts : dict, optional
+        If given, the number of keys read from each stream is accumulated in
+        its 'left' and 'right' entries.
+
+    Yields
+    ------
+    numpy.ndarray
+        Sorted 'S' arrays of the unique keys common to both streams.
+    """
+    if counts is None:
+        counts = {}
+    counts.setdefault('left', 0)
+    counts.setdefault('right', 0)
+    left_blocks = iter(left_blocks)
+    right_blocks = iter(right_blocks)
+    left = EMPTY_KEYS
+    right = EMPTY_KEYS
+    while True:
+        if len(left) < 1:
+            left = _next_keys(left_blocks)
+            if left is None:
+                return
+            counts['left'] += len(left)
+        if len(right) < 1:
+            right = _next_keys(right_blocks)
+            if right is None:
+                return
+            counts['right'] += len(right)
+        bound = min(left[-1], right[-1])
+        left_end = np.searchsorted(left, bound, side='right')
+        right_end = np.searchsorted(right, bound, side='right')
+        common = np.intersect1d(left[:left_end], right[:right_end])
+        if len(common) > 0:
+            yield common
+        left = left[left_end:]
+        right = right[right_end:]
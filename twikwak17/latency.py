@@ -0,0 +1,276 @@
+"""Latency histograms and throughput profiles of gender classification.
+
+Latencies are kept in HDR-style log-linear histograms: values, in
+microseconds, are counted in buckets whose width doubles with every power of
+two, with 2^(SUB_BUCKET_BITS - 1) buckets per power of two, so every recorded
+value is known to within about 3%, at a small and fixed memory cost, whatever
+its magnitude.
+"""
+
+import time
+import json
+import heapq
+
+from twikwak17.shared import qprint
+
+
+SUB_BUCKET_BITS = 6
+US_IN_SECOND = 1000000
+PERCENTILES = (50, 90, 99, 99.9)
+LENGTH_BUCKETS = (1000, 10000, 100000, 1000000)
+TIMELINE_INTERVAL_SECONDS = 60
+SLOWEST_USERS = 20
+
+
+def _bucket_index(value):
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+
+def _bucket_bounds(index):
+    if index < (1 << SUB_BUCKET_BITS):
+        return index, index + 1
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    top = index - (shift << (SUB_BUCKET_BITS - 1))
+    return top << shift, (top + 1) << shift
+
+
+class LatencyHistogram(object):
+    """An HDR-style histogram of latencies."""
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def record(self, seconds, count=1):
+        """Records count occurrences of the given latency, in seconds."""
+        value = max(int(round(seconds * US_IN_SECOND)), 0)
+        index = _bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total_us += value * count
+        if self.min_us is None or value < self.min_us:
+            self.min_us = value
+        if value > self.max_us:
+            self.max_us = value
+
+    def percentile(self, percent):
+        """Returns the given percentile of recorded latencies, in
+        microseconds, as the highest value of its bucket."""
+        if self.count == 0:
+            return 0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_bounds(index)[1] - 1, self.max_us)
+        return self.max_us
+
+    def to_dict(self):
+        summary = {
+            'count': self.count,
+            'total_seconds': self.total_us / US_IN_SECOND,
+            'min_us': self.min_us or 0,
+            'mean_us': self.total_us / self.count if self.count else 0,
+            'max_us': self.max_us,
+        }
+        for percent in PERCENTILES:
+            summary[f'p{percent:g}_us'] = self.percentile(percent)
+        summary['buckets'] = [
+            [_bucket_bounds(index)[0], self.counts[index]]
+            for index in sorted(self.counts)
+        ]
+        return summary
+
+
+def length_bucket_name(n_chars):
+    """Returns the name of the tweet length bucket of the given length."""
+    for bound in LENGTH_BUCKETS:
+        if n_chars < bound:
+            return f'<{bound:,}'
+    return f'>={LENGTH_BUCKETS[-1]:,}'
+
+
+LENGTH_BUCKET_NAMES = [
+    length_bucket_name(bound - 1) for bound in LENGTH_BUCKETS
+] + [length_bucket_name(LENGTH_BUCKETS[-1])]
+
+
+class TimedReader(object):
+    """Wraps a file opened for text reading, timing its readline() calls.
+
+    Parameters
+    ----------
+    f : file
+        The file to wrap; if it is a gzip file opened by gzip.open(), the
+        compressed bytes read so far are also tracked.
+    profile : ClassificationProfile
+        The profile recording the read stage.
+    """
+
+    def __init__(self, f, profile):
+        self._f = f
+        self._profile = profile
+        self.chars_read = 0
+        self._compressed_bytes_read = 0
+        profile.readers.append(self)
+
+    def readline(self):
+        start = time.perf_counter()
+        line = self._f.readline()
+        elapsed = time.perf_counter() - start
+        self._profile.read_seconds += elapsed
+        self._profile.stages['read'].record(elapsed)
+        self.chars_read += len(line)
+        if not line:
+            self.compressed_bytes_read()
+        return line
+
+    def compressed_bytes_read(self):
+        """Returns the compressed bytes read so far, or, once the file is
+        closed, up to the last call."""
+        try:
+            self._compressed_bytes_read = self._f.buffer.fileobj.tell()
+        except (AttributeError, ValueError):
+            pass
+        return self._compressed_bytes_read
+
+
+class ClassificationProfile(object):
+    """Records per-stage latencies and throughput of gender classification.
+
+    Stages are:
+
+    * read - reading, and decompressing, a line of either input file.
+    * merge_join - matching a user of the intersection to its tweets, not
+      including reading.
+    * score - classifying a batch of users, as measured where it ran.
+    * dump - writing the results of a batch.
+
+    Classification latencies are also recorded per user, in buckets of tweet
+    length. As users are scored in batches, the scoring time of a batch is
+    attributed to its users in proportion to the length of their tweets, so
+    per-user latencies are estimates, exact only for users scored in a batch
+    of their own.
+    """
+
+    def __init__(self):
+        self.stages = {
+            name: LatencyHistogram()
+            for name in ('read', 'merge_join', 'score', 'dump')
+        }
+        self.user_latency_by_length = {}
+        self.readers = []
+        self.read_seconds = 0
+        self.users = 0
+        self.timeline = []
+        self._slowest = []
+        self._start = time.time()
+        self._last_sample = self._start
+
+    def iter_timed_pairs(self, users_and_tweets):
+        """Yields the given (user, tweets) pairs, timing the merge-join."""
+        iterator = iter(users_and_tweets)
+        while True:
+            start = time.perf_counter()
+            read_before = self.read_seconds
+            try:
+                pair = next(iterator)
+            except StopIteration:
+                return
+            elapsed = time.perf_counter() - start
+            self.stages['merge_join'].record(
+                elapsed - (self.read_seconds - read_before))
+            yield pair
+
+    def record_batch(self, users, lengths, seconds):
+        """Records the scoring time of a batch of users, given by name, or
+        None if unknown, and the lengths of their tweets."""
+        self.stages['score'].record(seconds)
+        total_chars = sum(lengths)
+        for i, n_chars in enumerate(lengths):
+            if total_chars > 0:
+                user_seconds = seconds * n_chars / total_chars
+            else:
+                user_seconds = seconds / len(lengths)
+            bucket = length_bucket_name(n_chars)
+            if bucket not in self.user_latency_by_length:
+                self.user_latency_by_length[bucket] = LatencyHistogram()
+            self.user_latency_by_length[bucket].record(user_seconds)
+            if users is None:
+                continue
+            entry = (user_seconds, users[i], n_chars)
+            if len(self._slowest) < SLOWEST_USERS:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def record_dump(self, n_users, seconds):
+        """Records the time taken to write the results of n_users users."""
+        self.stages['dump'].record(seconds)
+        self.users += n_users
+        now = time.time()
+        if now - self._last_sample >= TIMELINE_INTERVAL_SECONDS:
+            self._sample(now)
+
+    def _sample(self, now):
+        previous = self.timeline[-1] if self.timeline else {
+            'elapsed_seconds': 0, 'users': 0, 'chars_read': 0,
+            'compressed_bytes_read': 0,
+        }
+        sample = {
+            'elapsed_seconds': now - self._start,
+            'users': self.users,
+            'chars_read': sum(reader.chars_read for reader in self.readers),
+            'compressed_bytes_read': sum(
+                reader.compressed_bytes_read() for reader in self.readers),
+        }
+        interval = (sample['elapsed_seconds'] - previous['elapsed_seconds'])
+        interval = interval or 1e-9
+        sample['users_per_second'] = (
+            sample['users'] - previous['users']) / interval
+        sample['chars_per_second'] = (
+            sample['chars_read'] - previous['chars_read']) / interval
+        sample['compressed_bytes_per_second'] = (
+            sample['compressed_bytes_read']
+            - previous['compressed_bytes_read']) / interval
+        self.timeline.append(sample)
+        self._last_sample = now
+
+    def slowest_users(self):
+        """Returns the slowest users to classify, slowest first."""
+        return [
+            {'user': user, 'seconds': seconds, 'tweet_chars': n_chars}
+            for seconds, user, n_chars in sorted(self._slowest, reverse=True)
+        ]
+
+    def to_dict(self):
+        self._sample(time.time())
+        return {
+            'stages': {
+                name: hist.to_dict() for name, hist in self.stages.items()},
+            'user_latency_by_tweet_chars': {
+                bucket: self.user_latency_by_length[bucket].to_dict()
+                for bucket in LENGTH_BUCKET_NAMES
+                if bucket in self.user_latency_by_length
+            },
+            'throughput': self.timeline,
+            'slowest_users': self.slowest_users(),
+        }
+
+    def report(self):
+        """Writes a summary, and the full profile as JSON, by qprint."""
+        profile = self.to_dict()
+        for name, stage in profile['stages'].items():
+            qprint((f"{name}: {stage['count']:,} calls, "
+                    f"{stage['total_seconds']:,.2f} seconds total, "
+                    f"p50 {stage['p50_us']:,} us, "
+                    f"p99 {stage['p99_us']:,} us"))
+        qprint("Classification profile:")
+        qprint(json.dumps(profile, indent=2))
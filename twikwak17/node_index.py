@@ -0,0 +1,118 @@
+"""A dense node index of the users of the twikwak17 graph.
+
+Users are assigned contiguous node indices 0..N-1, in increasing uid order.
+The index is a folder holding:
+
+* uid_by_index.npy - a sorted int64 array; the uid of node i is its i-th
+  entry.
+* gender_by_index.npy - an int8 array; the predicted gender of node i.
+* meta.json - the node count.
+
+Node indices index both arrays directly, and uids are mapped to node indices
+by a binary search over the sorted uid array.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from twikwak17.edges import (
+    lookup_sorted,
+    read_uid2gender_file,
+)
+
+
+UID_BY_INDEX_FNAME = 'uid_by_index.npy'
+GENDER_BY_INDEX_FNAME = 'gender_by_index.npy'
+META_FNAME = 'meta.json'
+NOT_FOUND = -1
+
+
+def build_node_index(uid2gender_fpath, dpath):
+    """Builds a dense node index from a uid-to-gender map file.
+
+    Of several lines with the same uid only the last is kept, like loading
+    the file into a dict would.
+
+    Parameters
+    ----------
+    uid2gender_fpath : str
+        The full qualified path to a gzipped uid-to-gender file.
+    dpath : str
+        The path to the index folder. Created if needed.
+
+    Returns
+    -------
+    int
+        The number of nodes in the index.
+    """
+    uids, genders = read_uid2gender_file(uid2gender_fpath)
+    return write_node_index(uids, genders, dpath)
+
+
+def write_node_index(uids, genders, dpath):
+    """Writes a dense node index of the given users.
+
+    Parameters
+    ----------
+    uids : numpy.ndarray
+        A sorted int64 array of distinct uids.
+    genders : numpy.ndarray
+        The gender, 0 or 1, of each uid.
+    dpath : str
+        The path to the index folder. Created if needed.
+
+    Returns
+    -------
+    int
+        The number of nodes in the index.
+    """
+    os.makedirs(dpath, exist_ok=True)
+    np.save(os.path.join(dpath, UID_BY_INDEX_FNAME),
+            np.asarray(uids, dtype=np.int64))
+    np.save(os.path.join(dpath, GENDER_BY_INDEX_FNAME),
+            np.asarray(genders, dtype=np.int8))
+    with open(os.path.join(dpath, META_FNAME), 'wt+') as f:
+        json.dump({'count': len(uids)}, f)
+    return len(uids)
+
+
+def node_index_exists(dpath):
+    return os.path.isfile(os.path.join(dpath, META_FNAME))
+
+
+class NodeIndex(object):
+    """A read-only, memory-mapped dense node index.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to an index folder written by build_node_index().
+    """
+
+    def __init__(self, dpath):
+        self.uid_by_index = np.load(
+            os.path.join(dpath, UID_BY_INDEX_FNAME), mmap_mode='r')
+        self.gender_by_index = np.load(
+            os.path.join(dpath, GENDER_BY_INDEX_FNAME), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.uid_by_index)
+
+    def lookup(self, uids):
+        """Maps the given uids to node indices.
+
+        Parameters
+        ----------
+        uids : array-like of int
+            The uids to look up.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int64 array of the node index of each uid, or NOT_FOUND (-1)
+            for uids not in the index.
+        """
+        indices, found = lookup_sorted(self.uid_by_index, uids)
+        return np.where(found, indices, NOT_FOUND).astype(np.int64)
@@ -0,0 +1,181 @@
+"""Compact, numpy-backed arrays of many short byte strings."""
+
+from array import array
+
+import numpy as np
+
+
+class PackedStrings(object):
+    """An array of byte strings packed into a single contiguous byte arena.
+
+    String i is arena[offsets[i]:offsets[i+1]]. Both arrays can be memory
+    mapped, so a PackedStrings object costs nothing to load.
+
+    Parameters
+    ----------
+    arena : numpy.ndarray
+        A one dimensional uint8 array holding all strings back to back.
+    offsets : numpy.ndarray
+        A one dimensional int64 array of length len(strings) + 1.
+    """
+
+    def __init__(self, arena, offsets):
+        self.arena = arena
+        self.offsets = offsets
+
+    @staticmethod
+    def from_list(strings):
+        """Packs the given list of bytes objects."""
+        builder = PackedStringsBuilder()
+        for string in strings:
+            builder.append(string)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.arena[self.offsets[i]:self.offsets[i+1]].tobytes()
+
+    def lengths(self):
+        """Returns an int64 array of the lengths of all strings."""
+        return np.diff(self.offsets)
+
+    def max_len(self):
+        """Returns the length of the longest string; 0 if there are none."""
+        if len(self) < 1:
+            return 0
+        return int(self.lengths().max())
+
+    def padded(self, ixs=None, width=None):
+        """Returns the strings as a fixed-width, null-padded numpy array.
+
+        Fixed-width 'S' arrays compare, sort and search in native byte order,
+        which is the order GNU sort uses with LC_ALL=C.
+
+        Parameters
+        ----------
+        ixs : numpy.ndarray, optional
+            If given, only the strings at these indices are returned.
+        width : int, optional
+            The width of the returned array. Longer strings are truncated.
+            Defaults to the length of the longest string returned.
+
+        Returns
+        -------
+        numpy.ndarray
+            An array of dtype 'S<width>'.
+        """
+        starts = self.offsets[:-1]
+        ends = self.offsets[1:]
+        if ixs is not None:
+            starts = starts[ixs]
+            ends = ends[ixs]
+        lengths = ends - starts
+        if width is None:
+            width = int(lengths.max()) if len(lengths) > 0 else 0
+        width = max(width, 1)
+        mat = np.zeros((len(starts), width), dtype=np.uint8)
+        # one pass per character position keeps temporaries at O(n)
+        for c in range(width):
+            has_char = lengths > c
+            mat[has_char, c] = self.arena[starts[has_char] + c]
+        return mat.view(f'S{width}').ravel()
+
+    def take(self, ixs):
+        """Returns a new PackedStrings made of the strings at given indices."""
+        starts = self.offsets[:-1][ixs]
+        lengths = self.offsets[1:][ixs] - starts
+        offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        arena = np.empty(offsets[-1], dtype=np.uint8)
+        for c in range(int(lengths.max()) if len(lengths) > 0 else 0):
+            has_char = lengths > c
+            arena[offsets[:-1][has_char] + c] = self.arena[
+                starts[has_char] + c]
+        return PackedStrings(arena, offsets)
+
+    def search(self, queries, width=None):
+        """Finds given strings in these strings, assumed sorted in byte order.
+
+        Runs a binary search for all queries at once, in O(log n) vectorized
+        steps, so it also works well over memory-mapped arrays.
+
+        Parameters
+        ----------
+        queries : list of str or bytes
+            The strings to look up. str objects are UTF-8 encoded.
+        width : int, optional
+            The length of the longest string in this object. Computed if not
+            given.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int64 array with the position of each query string, or -1 for
+            strings not found.
+        """
+        if width is None:
+            width = self.max_len()
+        width = max(width, 1)
+        encoded = [
+            q.encode('utf-8') if isinstance(q, str) else q for q in queries]
+        too_long = np.array([len(q) > width for q in encoded], dtype=bool)
+        queries = np.array(encoded, dtype=f'S{width}')
+        lo = np.zeros(len(queries), dtype=np.int64)
+        hi = np.full(len(queries), len(self), dtype=np.int64)
+        active = lo < hi
+        while active.any():
+            ixs = np.nonzero(active)[0]
+            mid = (lo[ixs] + hi[ixs]) // 2
+            is_less = self.padded(ixs=mid, width=width) < queries[ixs]
+            lo[ixs[is_less]] = mid[is_less] + 1
+            hi[ixs[~is_less]] = mid[~is_less]
+            active = lo < hi
+        found = np.zeros(len(queries), dtype=bool)
+        candidates = np.nonzero(lo < len(self))[0]
+        found[candidates] = self.padded(
+            ixs=lo[candidates], width=width) == queries[candidates]
+        found &= ~too_long
+        return np.where(found, lo, -1)
+
+    def iter_chunks(self, chunk_size):
+        """Yields the strings as lists of bytes objects of given length."""
+        blob = self.arena.tobytes()
+        for start in range(0, len(self), chunk_size):
+            offsets = self.offsets[start:start+chunk_size+1].tolist()
+            yield [
+                blob[offsets[i]:offsets[i+1]]
+                for i in range(len(offsets) - 1)
+            ]
+
+    def tolist(self):
+        """Returns all strings as a list of bytes objects."""
+        return [s for chunk in self.iter_chunks(len(self) or 1) for s in chunk]
+
+
+class PackedStringsBuilder(object):
+    """Incrementally builds a PackedStrings object with minimal overhead."""
+
+    def __init__(self):
+        self._arena = bytearray()
+        self._offsets = array('q', [0])
+
+    def append(self, string):
+        """Appends the given bytes object."""
+        self._arena += string
+        self._offsets.append(len(self._arena))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self):
+        """The number of bytes currently held by the builder."""
+        return len(self._arena) + 8 * len(self._offsets)
+
+    def build(self):
+        """Returns a PackedStrings object of all strings appended so far."""
+        arena = np.frombuffer(self._arena, dtype=np.uint8).copy()
+        offsets = np.frombuffer(self._offsets, dtype=np.int64).copy()
+        return PackedStrings(arena, offsets)
@@ -10,6 +10,7 @@ from contextlib import ExitStack
 
 from ezenum import StringEnum
 from sortedcontainers import SortedDict
+from speks.tokenization import tokenize_no_case_preserving
 
 from twikwak17.shared import (
     DONE_MARKER,
@@ -18,12 +19,15 @@ from twikwak17.shared import (
     twitter7_dpath,
     t7_user_list_fpath_by_dpath,
     twitter7_tweet_list_fpath_by_dpath,
+    token_corpus_dpath_by_dpath,
     seconds_to_duration_str,
     sort_username_file,
     phase_output_report_fpath,
     set_output_report_file_handle,
     create_timestamped_report_file_copy,
 )
+from twikwak17.block_index import index_sorted_username_file
+from twikwak17.token_corpus import TokenCorpusWriter
 
 
 LINETYPE = StringEnum(['Time', 'User', 'Content', 'Other'])
@@ -227,6 +231,9 @@ def merge_user_files(dpath):
     sort_username_file(
         input_fpath=output_fpath, output_fpath=sorted_output_fpath)
     qprint("User file sorted!")
+    qprint("Rewriting sorted user file with a sparse block index...")
+    block_index = index_sorted_username_file(sorted_output_fpath)
+    qprint(f"{len(block_index):,} blocks indexed.")
     qprint((f"{user_count:,} twitter7 users dumped into {output_fpath}"
             f" and {sorted_output_fpath}"))
 
@@ -303,6 +310,44 @@ def merge_dump_files(dpath):
     #         " and {sorted_output_fpath}"))
 
 
+def build_token_corpus(dpath):
+    """Tokenizes the merged twitter7 tweets file into a token corpus.
+
+    The tweets of each user are tokenized with the SPEKS tokenizer, and
+    written as a vocabulary-encoded, memory-mappable int32 token array; see
+    twikwak17.token_corpus.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to the output folder of phase 1.
+
+    Returns
+    -------
+    int
+        The number of users in the corpus.
+    """
+    tweets_fpath = twitter7_tweet_list_fpath_by_dpath(dpath)
+    corpus_dpath = token_corpus_dpath_by_dpath(dpath)
+    qprint(f"\nTokenizing {tweets_fpath} into {corpus_dpath}...")
+    user_count = 0
+    with gzip.open(tweets_fpath, 'rt') as tweets_f, \
+            TokenCorpusWriter(corpus_dpath) as writer:
+        for line in tweets_f:
+            user, tweets = _uname_and_tweets_from_line(line.rstrip('\n'))
+            if len(user) < 1:
+                continue
+            writer.add(user, tokenize_no_case_preserving(tweets))
+            user_count += 1
+            if user_count % MIL == 0:
+                qprint((f"{user_count:,} users tokenized; vocabulary size "
+                        f"{len(writer.vocab):,}."))
+        vocab_size = len(writer.vocab)
+    qprint((f"{user_count:,} users tokenized into {corpus_dpath}; vocabulary "
+            f"size {vocab_size:,}."))
+    return user_count
+
+
 def phase1(output_dpath, tpath=None, subphases=None):
     """Splits a raw twitter7 tweets file into user-merged subset files.
 
@@ -315,6 +360,7 @@ def phase1(output_dpath, tpath=None, subphases=None):
         to 'twitter7_dpath' is looked up in the twikwak17 configuration file.
     subphases : list of str, optional
         If given, only subphases matching given strings are ran. E.g. '2.1'.
+        The optional subphase 1.4 is only ran if given here.
     """
     start = time.time()
     if tpath is None:
@@ -348,6 +394,11 @@ def phase1(output_dpath, tpath=None, subphases=None):
             qprint("\n\n---- 1.3 ----\nMerging tweet files...")
             merge_dump_files(output_dpath)
 
+        # optional; only ran when explicitly requested
+        if (subphases is not None) and ('1.4' in subphases):
+            qprint("\n\n---- 1.4 ----\nBuilding token corpus...")
+            build_token_corpus(output_dpath)
+
         qprint("\n\n====== END-OF PHASE 1 ======")
         end = time.time()
         print((
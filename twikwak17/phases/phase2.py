@@ -5,16 +5,19 @@ import re
 import gc
 import time
 import gzip
+from array import array
+from shutil import copyfile
 from psutil import virtual_memory
 from contextlib import ExitStack
 
-from sortedcontainers import SortedDict
+import numpy as np
 
 from twikwak17.shared import (
     qprint,
     kwak10_dpath,
     uname2id_fpath_by_dpath,
     kwak10_unames_fpath_by_dpath,
+    uname_index_dpath_by_dpath,
     seconds_to_duration_str,
     DONE_MARKER,
     phase_output_report_fpath,
@@ -22,52 +25,203 @@ from twikwak17.shared import (
     create_timestamped_report_file_copy,
     sort_username_file,
 )
+from twikwak17.packed import PackedStringsBuilder
+from twikwak17.block_index import index_sorted_username_file
+from twikwak17.uname_index import (
+    write_uname_index,
+    build_uname_index_from_file,
+)
+from twikwak17.readers import (
+    PrefetchingReader,
+    open_member_or_file,
+)
 
 
 ULIST_FNAME = 'numeric2screen'
+ULIST_ARCHIVE_FNAME = 'numeric2screen.tar.gz'
 LINE_REGEX = '([0-9]+) (.+)'
 BYTES_IN_MB = 1000000
 MIN_AVAIL_MEM_MB_DEF = 500
 USR_FNAME_MARKER = 'p2usr'
-LINE_DUMP_FREQ = 5000000
 UNAME2ID_REGEX = '(.+) ([0-9]+)'
+USR_FNAME_RGX = '{}_[\d]+.txt.gz'.format(USR_FNAME_MARKER)
+
+
+IN_MEMORY_BYTES_PER_ENTRY = 8 + 8 + 8 + 1  # offset, uid, argsort, mask
+WRITE_CHUNK_SIZE = 100000
+
+
+def _uname_and_uid_from_line(line):
+    match_groups = re.match(LINE_REGEX, line).groups()
+    return match_groups[1].lower(), int(match_groups[0])
+
+
+def _estimated_sort_bytes(unames, max_len):
+    """Estimates the peak memory needed to sort and dump the given entries.
+
+    Sorting needs, on top of the packed usernames and uids, two null-padded
+    fixed-width copies of all usernames (keys and sorted keys), the argsort
+    permutation and a deduplication mask.
+    """
+    return unames.nbytes + len(unames) * (
+        IN_MEMORY_BYTES_PER_ENTRY + 2 * max_len)
+
+
+def _sorted_unique_uname2id(unames, uids):
+    """Sorts packed usernames and their uids by username byte order.
+
+    Of several entries with the same username only the last one read is kept,
+    like an in-order insertion into a dict would.
+
+    Parameters
+    ----------
+    unames : twikwak17.packed.PackedStrings
+        The packed usernames, in read order.
+    uids : numpy.ndarray
+        An int64 array of the corresponding user ids.
+
+    Returns
+    -------
+    unames, uids : twikwak17.packed.PackedStrings, numpy.ndarray
+        The sorted and deduplicated usernames and uids.
+    """
+    keys = unames.padded()
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    is_last = np.ones(len(keys), dtype=bool)
+    is_last[:-1] = keys[:-1] != keys[1:]
+    del keys
+    order = order[is_last]
+    return unames.take(order), uids[order]
+
+
+def _write_uname2id(unames, uids, uname2id_fpath, uname_fpath=None):
+    with ExitStack() as stack:
+        uname2id_f = stack.enter_context(gzip.open(uname2id_fpath, 'wb+'))
+        if uname_fpath is not None:
+            uname_f = stack.enter_context(gzip.open(uname_fpath, 'wb+'))
+        start = 0
+        for names in unames.iter_chunks(WRITE_CHUNK_SIZE):
+            chunk_uids = uids[start:start+len(names)].tolist()
+            start += len(names)
+            uname2id_f.write(b''.join([
+                b'%s %d\n' % (name, uid)
+                for name, uid in zip(names, chunk_uids)
+            ]))
+            if uname_fpath is not None:
+                uname_f.write(b'\n'.join(names) + b'\n')
+
+
+def _dump_uname2id(unames, uids, files_written, output_dpath):
+    dump_fpath = '{}/{}_{}.txt.gz'.format(
+        output_dpath, USR_FNAME_MARKER, files_written)
+    unames, uids = _sorted_unique_uname2id(unames, uids)
+    _write_uname2id(unames, uids, dump_fpath)
 
 
-def _dump_uname2id(uname_2_id, files_written, output_dpath):
-        dump_fpath = '{}/{}_{}.txt.gz'.format(
-            output_dpath, USR_FNAME_MARKER, files_written)
-        with gzip.open(dump_fpath, 'wt+') as f:
-            for uname, uid in uname_2_id.items():
-                f.write(f'{uname} {uid}\n')
+def _remove_run_files(dpath):
+    for fname in os.listdir(dpath):
+        if re.match(pattern=USR_FNAME_RGX, string=fname):
+            os.remove(os.path.join(dpath, fname))
 
 
-def inverse_numeric2screen_into_multiple_files(output_dpath, kpath):
+def inverse_numeric2screen_into_multiple_files(
+        output_dpath, kpath, mem_budget_mb=None):
+    """Inverts numeric2screen into a username-sorted username-to-id mapping.
+
+    Usernames are packed into a compact byte arena and uids into an int64
+    array. If all of numeric2screen fits into the memory budget it is sorted
+    in memory and the final phase 2 output files are written in a single
+    pass. Otherwise, a sorted run file is dumped whenever the budget is
+    exceeded, to be merged in subphase 2.2.
+
+    Parameters
+    ----------
+    output_dpath : str
+        The path to the designated output folder.
+    kpath : str
+        The path to the kwak10www dataset folder.
+    mem_budget_mb : int, optional
+        The memory budget, in megabytes, for holding and sorting entries. If
+        not given, all available memory but MIN_AVAIL_MEM_MB_DEF megabytes is
+        used.
+
+    Returns
+    -------
+    int
+        The number of run files written; 0 if everything was sorted in memory
+        and the final output files were written.
+    """
     min_mem_bytes = MIN_AVAIL_MEM_MB_DEF * BYTES_IN_MB
+    if mem_budget_mb is None:
+        mem_budget_bytes = virtual_memory().available - min_mem_bytes
+    else:
+        mem_budget_bytes = mem_budget_mb * BYTES_IN_MB
+    qprint((
+        "Memory budget for sorting (in MB): "
+        f"{mem_budget_bytes / BYTES_IN_MB:,}"))
+    _remove_run_files(output_dpath)
     files_written = 0
-    ulist_fpath = os.path.join(kpath, ULIST_FNAME)
-    uname_to_id = SortedDict()
+    unames = PackedStringsBuilder()
+    uids = array('q')
+    max_len = 0
     i = 0
-    with open(ulist_fpath, 'rt') as f:
-        for line in f:
-            match_groups = re.match(LINE_REGEX, line).groups()
-            uid = match_groups[0]
-            uname = match_groups[1]
-            uname = uname.lower()
-            uname_to_id[uname] = uid
+
+    def _dump():
+        nonlocal unames, uids, max_len, files_written
+        _dump_uname2id(
+            unames.build(), np.frombuffer(uids, dtype=np.int64),
+            files_written, output_dpath)
+        files_written += 1
+        unames = PackedStringsBuilder()
+        uids = array('q')
+        max_len = 0
+        gc.collect()
+        qprint("\bFile dumped.                                \n")
+
+    with ExitStack() as stack:
+        ulist_f = stack.enter_context(open_member_or_file(
+            kpath, ULIST_FNAME, ULIST_ARCHIVE_FNAME))
+        reader = stack.enter_context(PrefetchingReader(ulist_f))
+        for line in reader.iter_lines():
+            uname, uid = _uname_and_uid_from_line(line.decode('utf-8'))
+            uname_bytes = uname.encode('utf-8')
+            unames.append(uname_bytes)
+            uids.append(uid)
+            max_len = max(max_len, len(uname_bytes))
             i += 1
             if i % 10000 == 0:
                 print(f"{i:,} lines read |{uid}|{uname}|          ", end="\r")
+                needed_bytes = _estimated_sort_bytes(unames, max_len)
                 av_mem = virtual_memory().available
-                if av_mem < min_mem_bytes or (i % LINE_DUMP_FREQ == 0):
-                    _dump_uname2id(uname_to_id, files_written, output_dpath)
-                    files_written += 1
-                    uname_to_id = SortedDict()
-                    gc.collect()
-                    qprint("\bFile dumped.                                \n")
-    qprint("{} files written.".format(files_written))
+                if av_mem < min_mem_bytes or needed_bytes > mem_budget_bytes:
+                    _dump()
+        if files_written > 0:
+            if len(unames) > 0:
+                _dump()
+            qprint("{} files written.".format(files_written))
+            return files_written
 
+    qprint(f"\nAll {i:,} lines fit in memory; sorting in memory...")
+    sorted_unames, sorted_uids = _sorted_unique_uname2id(
+        unames.build(), np.frombuffer(uids, dtype=np.int64))
+    del unames, uids
+    gc.collect()
+    uname_fpath = kwak10_unames_fpath_by_dpath(output_dpath)
+    uname2id_fpath = uname2id_fpath_by_dpath(output_dpath)
+    _write_uname2id(sorted_unames, sorted_uids, uname2id_fpath, uname_fpath)
+    # usernames are unique and sorted, so no external sort is needed
+    sorted_uname_fpath = kwak10_unames_fpath_by_dpath(
+        output_dpath, sorted=True)
+    copyfile(uname_fpath, sorted_uname_fpath)
+    index_sorted_username_file(sorted_uname_fpath)
+    qprint((f"{len(sorted_uids):,} kwak10 users dumped into {uname_fpath}, "
+            f"{sorted_uname_fpath} and {uname2id_fpath}."))
+    index_dpath = uname_index_dpath_by_dpath(output_dpath)
+    write_uname_index(sorted_unames, sorted_uids, index_dpath)
+    qprint(f"Memory-mappable username-to-uid index written to {index_dpath}.")
+    return files_written
 
-USR_FNAME_RGX = '{}_[\d]+.txt.gz'.format(USR_FNAME_MARKER)
 
 
 def merge_user_files(input_dpath, uname_fpath, uname2id_fpath, output_dpath):
@@ -77,6 +231,9 @@ def merge_user_files(input_dpath, uname_fpath, uname2id_fpath, output_dpath):
         os.path.join(input_dpath, fname) for fname in os.listdir(input_dpath)
         if re.match(pattern=USR_FNAME_RGX, string=fname)
     ]
+    # in run order, so of several runs holding a username the last one read
+    # can be told apart
+    filepaths.sort(key=_run_number)
     qprint("Found {} files to merge.".format(len(filepaths)))
     user_count = 0
     with ExitStack() as stack:
@@ -85,6 +242,7 @@ def merge_user_files(input_dpath, uname_fpath, uname2id_fpath, output_dpath):
         uname2id_f = stack.enter_context(gzip.open(uname2id_fpath, 'wt'))
         current_lines = [f.readline() for f in files]
         min_user = None
+        pending = None
 
         def _get_min_user_params():
             min_line = min(current_lines)
@@ -112,14 +270,27 @@ def merge_user_files(input_dpath, uname_fpath, uname2id_fpath, output_dpath):
                 return
             current_lines[i] = line
 
+        def _write_user(user, uid):
+            uname_f.write('{}\n'.format(user))
+            uname2id_f.write('{} {}\n'.format(user, uid))
+
         while any(current_lines):
             ix, min_user, min_id = _get_min_user_params()
             if min_user == DONE_MARKER:
                 break
-            # no need for a linebreak here; already here
-            uname_f.write('{}\n'.format(min_user))
-            uname2id_f.write('{} {}\n'.format(min_user, min_id))
             _increment_pointer(ix)
+            # runs are deduplicated, but a username may be in several runs;
+            # like the in-memory sort, the one of the latest run is kept
+            if pending is not None and pending[0] == min_user:
+                if ix > pending[2]:
+                    pending = (min_user, min_id, ix)
+                continue
+            if pending is not None:
+                _write_user(*pending[:2])
+                user_count += 1
+            pending = (min_user, min_id, ix)
+        if pending is not None:
+            _write_user(*pending[:2])
             user_count += 1
         qprint((f"{user_count:,} kwak10 users dumped into {uname_fpath} "
                 f"and {uname2id_fpath}."))
@@ -129,11 +300,29 @@ def merge_user_files(input_dpath, uname_fpath, uname2id_fpath, output_dpath):
     sort_username_file(
         input_fpath=uname_fpath, output_fpath=sorted_output_fpath)
     qprint("User file sorted!")
+    qprint("Rewriting sorted user file with a sparse block index...")
+    block_index = index_sorted_username_file(sorted_output_fpath)
+    qprint(f"{len(block_index):,} blocks indexed.")
     qprint((f"{user_count:,} kwak10 users dumped into {uname_fpath}"
             " and {sorted_output_fpath}"))
+    qprint("Building memory-mappable username-to-uid index...")
+    index_dpath = uname_index_dpath_by_dpath(output_dpath)
+    index_count = build_uname_index_from_file(uname2id_fpath, index_dpath)
+    qprint(f"{index_count:,} usernames indexed in {index_dpath}.")
+
+
+def _run_number(fpath):
+    return int(os.path.basename(fpath).split('_')[-1].split('.')[0])
+
+
+def _run_files_exist(dpath):
+    return any(
+        re.match(pattern=USR_FNAME_RGX, string=fname)
+        for fname in os.listdir(dpath)
+    )
 
 
-def phase2(output_dpath, kpath=None, subphases=None):
+def phase2(output_dpath, kpath=None, subphases=None, mem_budget_mb=None):
     """Lexicographically sorts the numerically sorted numeric2screen user list.
 
     Parameters
@@ -145,6 +334,10 @@ def phase2(output_dpath, kpath=None, subphases=None):
         to 'kwak10_dpath' is looked up in the twikwak17 configuration file.
     subphases : list of str, optional
         If given, only subphases matching given strings are ran. E.g. '2.1'.
+    mem_budget_mb : int, optional
+        The memory budget, in megabytes, for sorting the user list in memory.
+        Defaults to all available memory but a small reserve. If exceeded,
+        sorted runs are dumped to disk and merged in subphase 2.2.
     """
     start = time.time()
     if kpath is None:
@@ -162,15 +355,20 @@ def phase2(output_dpath, kpath=None, subphases=None):
             qprint((
                 "\n\n---- 2.1 ----\n"
                 "Inverting numeric2screen into several files..."))
-            inverse_numeric2screen_into_multiple_files(output_dpath, kpath)
+            inverse_numeric2screen_into_multiple_files(
+                output_dpath, kpath, mem_budget_mb=mem_budget_mb)
 
         uname_fpath = kwak10_unames_fpath_by_dpath(output_dpath)
         uname2id_fpath = uname2id_fpath_by_dpath(output_dpath)
         if (subphases is None) or ('2.2' in subphases):
-            qprint("\n\n---- 2.2 ----\nDumping user name list to {}...".format(
-                uname_fpath))
-            merge_user_files(
-                output_dpath, uname_fpath, uname2id_fpath, output_dpath)
+            if not _run_files_exist(output_dpath):
+                qprint("\n\n---- 2.2 ----\nNo run files to merge; skipping.")
+            else:
+                qprint((
+                    "\n\n---- 2.2 ----\nDumping user name list to {}..."
+                ).format(uname_fpath))
+                merge_user_files(
+                    output_dpath, uname_fpath, uname2id_fpath, output_dpath)
 
         print("\n\n====== END-OF PHASE 2 ======")
         end = time.time()
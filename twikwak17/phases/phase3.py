@@ -1,9 +1,12 @@
 """Phase 3 of the twikwak17 dataset generation pipeline."""
 
-import re
+import os
 import time
 import gzip
-from contextlib import ExitStack
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from twikwak17.shared import (
     qprint,
@@ -12,13 +15,192 @@ from twikwak17.shared import (
     kwak10_unames_fpath_by_dpath,
     uname_intersection_fpath_by_dpath,
     phase_output_report_fpath,
-    DONE_MARKER,
     set_output_report_file_handle,
     create_timestamped_report_file_copy,
 )
+from twikwak17.intersect import iter_sorted_intersection
+from twikwak17.block_index import (
+    GALLOP_MAX_SIZE_RATIO,
+    BlockIndex,
+    block_index_exists,
+    iter_galloping_intersection,
+)
+from twikwak17.readers import iter_uname_keys
+
+
+SKIPPED_T7_UNAMES = [b'_']
+RANGES_PER_WORKER = 4
+PART_FNAME_TEMPLATE = '{}.part{:04d}'
+
+
+def _galloping_order(t7_unames_fpath, k10_unames_fpath):
+    """Returns (small_fpath, large_fpath) if galloping over the block index
+    of the larger username file pays off, and None otherwise."""
+    if not (block_index_exists(t7_unames_fpath)
+            and block_index_exists(k10_unames_fpath)):
+        return None
+    small_fpath, large_fpath = sorted(
+        [t7_unames_fpath, k10_unames_fpath],
+        key=lambda fpath: BlockIndex(fpath).line_count,
+    )
+    small_count = BlockIndex(small_fpath).line_count
+    large_count = BlockIndex(large_fpath).line_count
+    if small_count > GALLOP_MAX_SIZE_RATIO * large_count:
+        return None
+    return small_fpath, large_fpath
+
+
+def intersect_sorted_username_files(
+        t7_unames_fpath, k10_unames_fpath, uname_out_fpath):
+    """Intersects two sorted username files, a block of usernames at a time.
+
+    If both files are block-indexed and one is much smaller than the other,
+    only the blocks of the larger file that can hold usernames of the smaller
+    one are decompressed.
+
+    Parameters
+    ----------
+    t7_unames_fpath : str
+        The full qualified path to the sorted twitter7 username list.
+    k10_unames_fpath : str
+        The full qualified path to the sorted kwak10 username list.
+    uname_out_fpath : str
+        The path to the designated intersection output file.
+
+    Returns
+    -------
+    int
+        The number of users in the intersection.
+    """
+    user_count = 0
+    counts = {}
+    galloping = _galloping_order(t7_unames_fpath, k10_unames_fpath)
+    with gzip.open(uname_out_fpath, 'wb+') as out_f:
+        if galloping is None:
+            common_blocks = iter_sorted_intersection(
+                left_blocks=iter_uname_keys(t7_unames_fpath),
+                right_blocks=iter_uname_keys(k10_unames_fpath),
+                counts=counts,
+            )
+        else:
+            small_fpath, large_fpath = galloping
+            qprint((f"Galloping over the block index of {large_fpath} with "
+                    f"the usernames of {small_fpath}..."))
+            common_blocks = iter_galloping_intersection(
+                small_blocks=iter_uname_keys(small_fpath),
+                large_fpath=large_fpath,
+                counts=counts,
+            )
+        for common in common_blocks:
+            common = common[~np.isin(common, SKIPPED_T7_UNAMES)]
+            if len(common) < 1:
+                continue
+            out_f.write(b'\n'.join(common.tolist()) + b'\n')
+            user_count += len(common)
+            if galloping is None:
+                print((f" {counts['left']:,} twitter7 and {counts['right']:,} "
+                       f"kwak10 usernames read, {user_count:,} users dumped."),
+                      end="\r")
+            else:
+                print((f" {counts['left']:,} usernames read, "
+                       f"{counts['blocks_read']:,} blocks inflated, "
+                       f"{user_count:,} users dumped."), end="\r")
+    if galloping is not None:
+        qprint((f"\n{counts['blocks_read']:,} of "
+                f"{len(BlockIndex(galloping[1])):,} blocks inflated."))
+    return user_count
 
 
-def phase3(phase1_output_dpath, phase2_output_dpath, phase3_output_dpath):
+def _intersect_key_range(t7_unames_fpath, k10_unames_fpath, lo_key, hi_key,
+                         part_fpath):
+    """Intersects the [lo_key, hi_key) range of two block-indexed username
+    files into a gzipped part file. Returns the user count and read counts.
+    """
+    user_count = 0
+    counts = {}
+    t7_index = BlockIndex(t7_unames_fpath)
+    k10_index = BlockIndex(k10_unames_fpath)
+    with open(t7_unames_fpath, 'rb') as t7_f, \
+            open(k10_unames_fpath, 'rb') as k10_f, \
+            gzip.open(part_fpath, 'wb+') as out_f:
+        common_blocks = iter_sorted_intersection(
+            left_blocks=t7_index.iter_range_keys(t7_f, lo_key, hi_key),
+            right_blocks=k10_index.iter_range_keys(k10_f, lo_key, hi_key),
+            counts=counts,
+        )
+        for common in common_blocks:
+            common = common[~np.isin(common, SKIPPED_T7_UNAMES)]
+            if len(common) < 1:
+                continue
+            out_f.write(b'\n'.join(common.tolist()) + b'\n')
+            user_count += len(common)
+    return user_count, counts
+
+
+def intersect_sorted_username_files_in_parallel(
+        t7_unames_fpath, k10_unames_fpath, uname_out_fpath, n_workers):
+    """Intersects two block-indexed username files over disjoint key ranges.
+
+    Splitter keys are picked from the block index of the larger file; each
+    worker process seeks both files to the blocks of its key range, and the
+    gzipped outputs of all ranges are concatenated, in order, into the output
+    file.
+
+    Parameters
+    ----------
+    t7_unames_fpath : str
+        The full qualified path to the sorted twitter7 username list.
+    k10_unames_fpath : str
+        The full qualified path to the sorted kwak10 username list.
+    uname_out_fpath : str
+        The path to the designated intersection output file.
+    n_workers : int
+        The number of worker processes to use.
+
+    Returns
+    -------
+    int
+        The number of users in the intersection.
+    """
+    large_index = max(
+        [BlockIndex(t7_unames_fpath), BlockIndex(k10_unames_fpath)],
+        key=lambda index: index.line_count,
+    )
+    splitters = large_index.splitter_keys(n_workers * RANGES_PER_WORKER)
+    bounds = list(zip([None] + splitters, splitters + [None]))
+    part_fpaths = [
+        PART_FNAME_TEMPLATE.format(uname_out_fpath, i)
+        for i in range(len(bounds))
+    ]
+    qprint((f"Intersecting {len(bounds):,} username ranges with "
+            f"{n_workers} worker processes..."))
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(
+            _intersect_key_range,
+            [t7_unames_fpath] * len(bounds),
+            [k10_unames_fpath] * len(bounds),
+            [lo_key for lo_key, _ in bounds],
+            [hi_key for _, hi_key in bounds],
+            part_fpaths,
+        ))
+    # gzip members can simply be concatenated
+    with open(uname_out_fpath, 'wb+') as out_f:
+        for part_fpath in part_fpaths:
+            with open(part_fpath, 'rb') as part_f:
+                shutil.copyfileobj(part_f, out_f)
+            os.remove(part_fpath)
+    user_count = sum(range_count for range_count, _ in results)
+    t7_count = sum(counts['left'] for _, counts in results)
+    k10_count = sum(counts['right'] for _, counts in results)
+    qprint((f"{t7_count:,} twitter7 and {k10_count:,} kwak10 usernames read "
+            f"over {len(bounds):,} ranges."))
+    qprint("Intersection users per range: {}".format(
+        ", ".join(f"{range_count:,}" for range_count, _ in results)))
+    return user_count
+
+
+def phase3(phase1_output_dpath, phase2_output_dpath, phase3_output_dpath,
+           n_workers=None):
     """Build a sorted username list of the intersection of twitter7 and kwak10.
 
     Parameters
@@ -29,6 +211,10 @@ def phase3(phase1_output_dpath, phase2_output_dpath, phase3_output_dpath):
         The path to the output directory of phase 2.
     phase3_output_dpath : str
         The path to the output directory of this phase, phase 3.
+    n_workers : int, optional
+        If given and larger than 1, the username lists are intersected over
+        disjoint username ranges by this many worker processes. Requires
+        block-indexed username lists.
     """
     start = time.time()
     t7_unames_fpath = t7_user_list_fpath_by_dpath(
@@ -38,8 +224,7 @@ def phase3(phase1_output_dpath, phase2_output_dpath, phase3_output_dpath):
     uname_out_fpath = uname_intersection_fpath_by_dpath(phase3_output_dpath)
     output_report_fpath = phase_output_report_fpath(3, phase3_output_dpath)
 
-    with ExitStack() as stack:
-        output_report_f = stack.enter_context(open(output_report_fpath, 'wt+'))
+    with open(output_report_fpath, 'wt+') as output_report_f:
         set_output_report_file_handle(output_report_f)
 
         qprint("\n\n====== PHASE 3 =====")
@@ -48,53 +233,20 @@ def phase3(phase1_output_dpath, phase2_output_dpath, phase3_output_dpath):
             f"\n{phase2_output_dpath} \ninput directoris to the "
             f"{phase3_output_dpath} output dir."))
 
-        t7_f = stack.enter_context(gzip.open(t7_unames_fpath, 'rt'))
-        k10_f = stack.enter_context(gzip.open(k10_unames_fpath, 'rt'))
-        files = [t7_f, k10_f]
-        out_f = stack.enter_context(gzip.open(uname_out_fpath, 'wt+'))
-        current_lines = [None, None]
-        user_count = 0
-        line_count = 0
-        uname_regex = '\s*\S+'
-
-        def _increment_pointer(i):
-            nonlocal line_count
-            line = files[i].readline()
-            line_count += 1
-            if len(line) < 1:
-                current_lines[i] = DONE_MARKER
-            elif line == "\n" or line == "\r":
-                _increment_pointer(i)
-            else:
-                current_lines[i] = line
-
-        _increment_pointer(0)
-        _increment_pointer(1)
-        while any(current_lines):
-            # print("|{}|{}|".format(current_lines[0], current_lines[1]))
-            if any([line == DONE_MARKER for line in current_lines]):
-                break
-            users = [
-                re.findall(uname_regex, line)[0]
-                for line in current_lines
-            ]
-            # print("||{}||{}||".format(users[0], users[1]))
-            if users[0] == "_":
-                _increment_pointer(0)
-            elif users[0] == users[1]:
-                out_f.write('{}\n'.format(users[0]))
-                _increment_pointer(0)
-                _increment_pointer(1)
-                user_count += 1
-            else:
-                if users[0] < users[1]:
-                    _increment_pointer(0)
-                else:
-                    _increment_pointer(1)
-            if line_count % 10000 == 0:
-                print((f" {line_count:,} lines read, {user_count:,} "
-                       f"users dumped.[{users[0]}][{users[1]}]"), end="\r")
-
+        qprint("Intersecting username lists...")
+        parallel = n_workers is not None and n_workers > 1
+        if parallel and not (block_index_exists(t7_unames_fpath)
+                             and block_index_exists(k10_unames_fpath)):
+            qprint((
+                "Username lists are not block-indexed; intersecting them in "
+                "a single process."))
+            parallel = False
+        if parallel:
+            user_count = intersect_sorted_username_files_in_parallel(
+                t7_unames_fpath, k10_unames_fpath, uname_out_fpath, n_workers)
+        else:
+            user_count = intersect_sorted_username_files(
+                t7_unames_fpath, k10_unames_fpath, uname_out_fpath)
         qprint((f"{user_count:,} intersection users dumped into "
                 f"{uname_out_fpath}."))
 
@@ -103,5 +255,5 @@ def phase3(phase1_output_dpath, phase2_output_dpath, phase3_output_dpath):
             "Finished running phase 3 of the twikwak17 pipeline.\n"
             "Run duration: {}".format(seconds_to_duration_str(end - start))
         ))
-        set_output_report_file_handle(None)
-        create_timestamped_report_file_copy(output_report_fpath)
+    set_output_report_file_handle(None)
+    create_timestamped_report_file_copy(output_report_fpath)
@@ -4,15 +4,51 @@ import re
 import gc
 import time
 import gzip
-from contextlib import ExitStack
+import multiprocessing
+from collections import deque, Counter
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
 
 from speks import predict_gender_by_tweets
 
+from twikwak17.gender import (
+    DEF_PREFIX_WORDS,
+    FULL_TEXT,
+    MultiModelScorer,
+    SpeksLexiconModel,
+)
+from twikwak17.gender_columns import GenderColumnsWriter
+from twikwak17.latency import (
+    ClassificationProfile,
+    TimedReader,
+)
+from twikwak17.checkpoint import (
+    CheckpointedGzipOutput,
+    input_signature,
+    skip_lines,
+)
+from twikwak17.feature_cache import (
+    FeatureCache,
+    FeatureCacheWriter,
+    feature_cache_exists,
+)
+from twikwak17.prediction_cache import (
+    speks_model_version,
+    tweets_digest,
+    PredictionCacheReader,
+    PredictionCacheWriter,
+)
+
 from twikwak17.shared import (
     qprint,
     twitter7_tweet_list_fpath_by_dpath,
     uname_intersection_fpath_by_dpath,
     uname_to_gender_map_fpath_by_dpath,
+    gender_prediction_cache_fpath_by_dpath,
+    feature_cache_dpath_by_dpath,
+    gender_columns_dpath_by_dpath,
     seconds_to_duration_str,
     phase_output_report_fpath,
     set_output_report_file_handle,
@@ -21,6 +57,12 @@ from twikwak17.shared import (
 
 
 UNAME_REGEX = '\s*\S+'
+DUMP_CHUNK_SIZE = 100000
+BATCH_MAX_USERS = 1000
+BATCH_MAX_CHARS = 8 * 1000000
+IN_FLIGHT_BATCHES_PER_WORKER = 2
+EARLY_EXIT_VALIDATION_EVERY = 100
+SCORE_SECONDS_KEY = 'score_seconds'
 
 
 def uname_and_tweets_from_line(line):
@@ -43,8 +85,484 @@ def uname_and_tweets_from_line(line):
     return user, line[len(user)+1:]
 
 
+def iter_intersection_users_and_tweets(tweets_f, intrsct_f, counts=None):
+    """Merge-joins the twitter7 tweets-by-user file with the user intersection.
+
+    Parameters
+    ----------
+    tweets_f : file
+        The twitter7 tweets-by-user file, opened for text reading.
+    intrsct_f : file
+        The user intersection file, opened for text reading.
+    counts : dict, optional
+        If given, the number of lines read from each file and the number of
+        users read and matched are kept in it.
+
+    Yields
+    ------
+    user, tweets : str, str
+        The username and tweets of each twitter7 user in the intersection.
+    """
+    if counts is None:
+        counts = {}
+    counts['t7_lines_read'] = 0
+    counts['intersection_lines_read'] = 0
+    counts['users_read'] = 0
+    counts['users_matched'] = 0
+
+    t7_line = tweets_f.readline()
+    counts['t7_lines_read'] += 1
+    intrsct_line = intrsct_f.readline()
+    counts['intersection_lines_read'] += 1
+
+    while t7_line and intrsct_line:
+        t7_user, tweets = uname_and_tweets_from_line(t7_line)
+        list_user = re.findall(UNAME_REGEX, intrsct_line)[0]
+        list_user = list_user.lower()
+        if t7_user == list_user:
+            counts['users_matched'] += 1
+            yield t7_user, tweets
+            t7_line = tweets_f.readline()
+            counts['t7_lines_read'] += 1
+            intrsct_line = intrsct_f.readline()
+            counts['intersection_lines_read'] += 1
+        elif t7_user < list_user:
+            t7_line = tweets_f.readline()
+            counts['t7_lines_read'] += 1
+        else:
+            intrsct_line = intrsct_f.readline()
+            counts['intersection_lines_read'] += 1
+        counts['users_read'] += 1
+        if counts['users_read'] % 5000 == 0:
+            qprint((
+                f"{counts['t7_lines_read']:,} t7 lines read|"
+                f"{counts['intersection_lines_read']:,} ∩ lines read|"
+                f"{counts['users_read']:,} users read; "
+                f"{counts['users_matched']:,} matched|"
+                f"{t7_user} ~ {list_user}"))
+
+
+def iter_user_batches(users_and_tweets, max_users=None, max_chars=None):
+    """Groups (user, tweets) pairs into batches of bounded size.
+
+    A batch is closed once it holds max_users users or max_chars characters
+    of tweets, so a single very active user makes a batch of its own.
+
+    Yields
+    ------
+    users, tweets : list of str, list of str
+        The usernames and tweets of each batch.
+    """
+    if max_users is None:
+        max_users = BATCH_MAX_USERS
+    if max_chars is None:
+        max_chars = BATCH_MAX_CHARS
+    users = []
+    tweets_list = []
+    chars = 0
+    for user, tweets in users_and_tweets:
+        users.append(user)
+        tweets_list.append(tweets)
+        chars += len(tweets)
+        if len(users) >= max_users or chars >= max_chars:
+            yield users, tweets_list
+            users = []
+            tweets_list = []
+            chars = 0
+    if len(users) > 0:
+        yield users, tweets_list
+
+
+_MODEL = None
+FORK_START_METHOD = 'fork'
+MB = 1024 * 1024
+
+
+def _init_classification_worker(models=None):
+    """Loads the SPEKS model, or the given models, once in each worker."""
+    global _MODEL
+    if models:
+        _MODEL = MultiModelScorer(models)
+    else:
+        _MODEL = SpeksLexiconModel()
+
+
+def _load_classification_model(models=None):
+    """Loads the classification model in this process, reporting the time
+    it took."""
+    start = time.time()
+    _init_classification_worker(models)
+    qprint(f"Classification model loaded in {time.time() - start:.3f} "
+           "seconds.")
+
+
+def _report_worker_memory():
+    """Reports the resident and unique memory of all child processes."""
+    rss = []
+    uss = []
+    for child in psutil.Process().children():
+        try:
+            rss.append(child.memory_info().rss)
+            uss.append(child.memory_full_info().uss)
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    if not rss:
+        return
+    qprint((f"Worker memory over {len(rss)} workers: "
+            f"RSS mean {sum(rss) / len(rss) / MB:,.1f} MB, "
+            f"max {max(rss) / MB:,.1f} MB"))
+    if uss:
+        qprint((f"Worker unique (non-shared) memory: "
+                f"USS mean {sum(uss) / len(uss) / MB:,.1f} MB, "
+                f"max {max(uss) / MB:,.1f} MB"))
+
+
+@contextmanager
+def _classification_pool(n_workers, models=None):
+    """Creates a pool of classification worker processes.
+
+    Where the fork start method is available, the model is loaded once in
+    this process and frozen out of the garbage collector's view, and workers
+    are forked from it, sharing the model's memory pages copy-on-write.
+    Otherwise, each worker loads the model itself. The memory use of workers
+    is reported once the pool is done.
+    """
+    if FORK_START_METHOD not in multiprocessing.get_all_start_methods():
+        qprint("Fork unavailable; loading the model in each worker...")
+        with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_classification_worker,
+                initargs=(models,)) as executor:
+            yield executor
+            _report_worker_memory()
+        return
+    _load_classification_model(models)
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    try:
+        with ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=multiprocessing.get_context(
+                    FORK_START_METHOD)) as executor:
+            yield executor
+            _report_worker_memory()
+    finally:
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+
+
+def _classify_batch(tweets_list, early_exit_margin=None, with_features=False):
+    """Returns the predicted genders of a batch, early exit statistics and
+    any extra outputs: the features of the batch, if requested, or the
+    predictions and scores of all models, when classifying by several. The
+    time taken to classify the batch is kept in the statistics."""
+    start = time.perf_counter()
+    stats = Counter()
+    extras = None
+    if isinstance(_MODEL, MultiModelScorer):
+        predictions, scores = _MODEL.predict(tweets_list)
+        genders = predictions[0]
+        extras = (predictions, scores)
+    elif with_features:
+        genders, extras = _MODEL.predict_with_features(tweets_list)
+    elif early_exit_margin is None:
+        genders = _MODEL.predict(tweets_list)
+    else:
+        genders = _MODEL.predict_adaptive(
+            tweets_list, early_exit_margin,
+            validation_every=EARLY_EXIT_VALIDATION_EVERY, stats=stats)
+    stats[SCORE_SECONDS_KEY] = time.perf_counter() - start
+    return genders.tolist(), stats, extras
+
+
+def _dump_users_and_genders(out_f, users, genders):
+    out_f.write("".join(
+        f"{user} {gender}\n" for user, gender in zip(users, genders)))
+
+
+def _iter_classified(jobs, n_workers=None, early_exit_margin=None,
+                     stats=None, with_features=False, models=None,
+                     profile=None, job_users=None):
+    """Gender classifies batches of tweets, yielding results in input order.
+
+    Parameters
+    ----------
+    jobs : iterable of (object, list of str)
+        Pairs of a context object and a list of tweets to classify.
+    n_workers : int, optional
+        If given and larger than 1, batches are classified by this many worker
+        processes, forked from this one after it loads the model, with a
+        bounded number of batches in flight.
+    early_exit_margin : float, optional
+        If given, tweets are classified on growing word prefixes, exiting
+        early once a prediction is at least this far from the decision
+        boundary.
+    stats : collections.Counter, optional
+        If given, early exit statistics are accumulated in it.
+    with_features : bool, default False
+        If True, the SPEKS features of each batch are also returned.
+    models : list of twikwak17.gender.SpeksLexiconModel, optional
+        If given, tweets are classified by all of these models, the first of
+        which gives the returned genders.
+    profile : twikwak17.latency.ClassificationProfile, optional
+        If given, the scoring time of each batch, and the time taken to
+        consume its results, are recorded in it.
+    job_users : callable, optional
+        If given along with a profile, maps the context of a job to the
+        usernames of its tweets, so the slowest users can be named.
+
+    Yields
+    ------
+    context, genders, extras : object, list of int, tuple
+        The context of each job, the predicted genders of its tweets and
+        either their features, if requested, the predictions and scores of
+        all models, if several are given, or None.
+    """
+    if stats is None:
+        stats = Counter()
+
+    def _collected(context, lengths, result):
+        genders, batch_stats, extras = result
+        score_seconds = batch_stats.pop(SCORE_SECONDS_KEY, 0)
+        stats.update(batch_stats)
+        if profile is None:
+            yield context, genders, extras
+            return
+        profile.record_batch(
+            job_users(context) if job_users is not None else None,
+            lengths, score_seconds)
+        start = time.perf_counter()
+        yield context, genders, extras
+        profile.record_dump(len(lengths), time.perf_counter() - start)
+
+    def _lengths(tweets_list):
+        if profile is None:
+            return None
+        return [len(tweets) for tweets in tweets_list]
+
+    if n_workers is None or n_workers < 2:
+        _load_classification_model(models)
+        for context, tweets_list in jobs:
+            yield from _collected(context, _lengths(tweets_list), (
+                _classify_batch(tweets_list, early_exit_margin, with_features)
+            ))
+        return
+    max_in_flight = n_workers * IN_FLIGHT_BATCHES_PER_WORKER
+    in_flight = deque()
+    with _classification_pool(n_workers, models) as executor:
+        for context, tweets_list in jobs:
+            if len(in_flight) >= max_in_flight:
+                done_context, lengths, future = in_flight.popleft()
+                yield from _collected(done_context, lengths, future.result())
+            in_flight.append((context, _lengths(tweets_list), executor.submit(
+                _classify_batch, tweets_list, early_exit_margin,
+                with_features)))
+        while in_flight:
+            done_context, lengths, future = in_flight.popleft()
+            yield from _collected(done_context, lengths, future.result())
+
+
+def _classify_batches(batches, out_f, n_workers=None, early_exit_margin=None,
+                      stats=None, feature_writer=None, columns_writer=None,
+                      profile=None):
+    """Classifies and dumps batches of users, saving their features to the
+    given feature cache writer, or the outputs of all of its models to the
+    given gender columns writer, if any. Returns the number dumped."""
+    users_dumped = 0
+    models = None
+    if columns_writer is not None:
+        models = columns_writer.models
+    for users, genders, extras in _iter_classified(
+            batches, n_workers, early_exit_margin, stats,
+            with_features=feature_writer is not None, models=models,
+            profile=profile, job_users=_batch_users):
+        _dump_users_and_genders(out_f, users, genders)
+        if feature_writer is not None:
+            feature_writer.add(users, extras)
+        if columns_writer is not None:
+            columns_writer.add(*extras)
+        users_dumped += len(users)
+    return users_dumped
+
+
+def _batch_users(users):
+    return users
+
+
+def _cache_missing_users(context):
+    users, _, genders = context
+    return [user for user, gender in zip(users, genders) if gender is None]
+
+
+def _iter_cache_missing_jobs(batches, cache_reader, model_version):
+    """Looks up batches of users in the prediction cache, yielding jobs of
+    the tweets of cache misses only."""
+    for users, tweets_list in batches:
+        digests = [
+            tweets_digest(tweets, model_version) for tweets in tweets_list]
+        genders = [
+            cache_reader.get(user, digest)
+            for user, digest in zip(users, digests)
+        ]
+        missing_tweets = [
+            tweets
+            for tweets, gender in zip(tweets_list, genders)
+            if gender is None
+        ]
+        yield (users, digests, genders), missing_tweets
+
+
+def _classify_batches_with_cache(batches, out_f, cache_fpath, n_workers=None,
+                                 early_exit_margin=None, stats=None,
+                                 profile=None):
+    """Classifies and dumps batches of users, classifying only those with no
+    valid cached prediction, and rewrites the cache. Returns the number of
+    users dumped."""
+    users_dumped = 0
+    model_version = speks_model_version()
+    if early_exit_margin is not None:
+        model_version += f"-early-exit-{early_exit_margin}"
+    with PredictionCacheReader(cache_fpath) as cache_reader, \
+            PredictionCacheWriter(cache_fpath) as cache_writer:
+        jobs = _iter_cache_missing_jobs(batches, cache_reader, model_version)
+        for context, new_genders, _ in _iter_classified(
+                jobs, n_workers, early_exit_margin, stats, profile=profile,
+                job_users=_cache_missing_users):
+            users, digests, genders = context
+            new_genders = iter(new_genders)
+            genders = [
+                next(new_genders) if gender is None else gender
+                for gender in genders
+            ]
+            _dump_users_and_genders(out_f, users, genders)
+            cache_writer.write(users, digests, genders)
+            users_dumped += len(users)
+        qprint((f"{cache_reader.hits:,} cached predictions used; "
+                f"{cache_reader.misses:,} users classified."))
+    return users_dumped
+
+
+def _report_early_exit_stats(stats):
+    exits = [(key, count) for key, count in stats.items()
+             if key.startswith('exit_')]
+    if not exits:
+        return
+    total = sum(count for _, count in exits)
+    for n_words in DEF_PREFIX_WORDS:
+        count = stats[f'exit_{n_words}']
+        qprint((f"Early exit at {n_words:,} words: {count:,} users "
+                f"({100 * count / total:.2f}%)"))
+    count = stats[f'exit_{FULL_TEXT}']
+    qprint((f"Classified on all tweets: {count:,} users "
+            f"({100 * count / total:.2f}%)"))
+    if stats['validated'] > 0:
+        qprint((
+            f"Early and full predictions agree for "
+            f"{stats['validated_agree']:,} of {stats['validated']:,} "
+            "validated users "
+            f"({100 * stats['validated_agree'] / stats['validated']:.2f}%)"))
+
+
+def _checkpointed_batch_users(context):
+    return context[0]
+
+
+def _classify_with_checkpoints(
+        twitter7_tweets_by_user_fpath, user_intersection_fpath, output_fpath,
+        checkpoint_every, n_workers=None, batch_size=None,
+        early_exit_margin=None, profile=None):
+    """Classifies and dumps users, committing the output in segments of at
+    least checkpoint_every users, and resuming from the last commit of an
+    interrupted run with the same inputs and parameters, if any.
+
+    Returns the number of users dumped, and the early exit statistics.
+    """
+    config = {
+        'inputs': [
+            input_signature(twitter7_tweets_by_user_fpath),
+            input_signature(user_intersection_fpath),
+        ],
+        'model_version': speks_model_version(),
+        'checkpoint_every': checkpoint_every,
+        'batch_size': batch_size or BATCH_MAX_USERS,
+        'batch_max_chars': BATCH_MAX_CHARS,
+        'early_exit_margin': early_exit_margin,
+    }
+    output = CheckpointedGzipOutput(output_fpath, config)
+    progress = output.progress
+    if progress is None:
+        progress = {
+            't7_lines_read': 0,
+            'intersection_lines_read': 0,
+            'users_dumped': 0,
+            'last_user': None,
+            'stats': {},
+        }
+    stats = Counter(progress['stats'])
+    users_dumped = progress['users_dumped']
+    with ExitStack() as stack:
+        tweets_f = stack.enter_context(
+            gzip.open(twitter7_tweets_by_user_fpath, 'rt'))
+        intrsct_f = stack.enter_context(
+            gzip.open(user_intersection_fpath, 'rt'))
+        stack.callback(output.abort)
+        if output.resumed:
+            qprint((f"Resuming from a checkpoint after user "
+                    f"{progress['last_user']}; {users_dumped:,} users "
+                    "already classified..."))
+            last_t7_line = skip_lines(tweets_f, progress['t7_lines_read'])
+            skip_lines(intrsct_f, progress['intersection_lines_read'])
+            last_t7_user, _ = uname_and_tweets_from_line(last_t7_line)
+            if last_t7_user is None or last_t7_user < progress['last_user']:
+                raise ValueError(
+                    f"The checkpoint of {output_fpath} does not match the "
+                    f"input file {twitter7_tweets_by_user_fpath}.")
+        counts = {}
+        if profile is not None:
+            tweets_f = TimedReader(tweets_f, profile)
+            intrsct_f = TimedReader(intrsct_f, profile)
+        users_and_tweets = iter_intersection_users_and_tweets(
+            tweets_f, intrsct_f, counts)
+        if profile is not None:
+            users_and_tweets = profile.iter_timed_pairs(users_and_tweets)
+        # the counts are copied when each batch is closed, as the merge-join
+        # is then paused right after the last user of the batch
+        jobs = (
+            ((users, dict(counts)), tweets_list)
+            for users, tweets_list in iter_user_batches(
+                users_and_tweets, max_users=batch_size)
+        )
+        segment_users = 0
+        for (users, batch_counts), genders, _ in _iter_classified(
+                jobs, n_workers, early_exit_margin, stats, profile=profile,
+                job_users=_checkpointed_batch_users):
+            _dump_users_and_genders(output, users, genders)
+            segment_users += len(users)
+            users_dumped += len(users)
+            if segment_users >= checkpoint_every:
+                output.commit({
+                    't7_lines_read': progress['t7_lines_read'] + (
+                        batch_counts['t7_lines_read']),
+                    'intersection_lines_read': (
+                        progress['intersection_lines_read']
+                        + batch_counts['intersection_lines_read']),
+                    'users_dumped': users_dumped,
+                    'last_user': users[-1],
+                    'stats': dict(stats),
+                })
+                qprint(f"Checkpoint committed after {users_dumped:,} users.")
+                segment_users = 0
+        output.finish()
+    return users_dumped, stats
+
+
 def gender_classify_users_in_intersection_by_twitter7(
-        twitter7_tweets_by_user_fpath, user_intersection_fpath, output_fpath):
+        twitter7_tweets_by_user_fpath, user_intersection_fpath, output_fpath,
+        n_workers=None, batch_size=None, cache_fpath=None,
+        early_exit_margin=None, features_dpath=None, models=None,
+        columns_dpath=None, with_scores=False, checkpoint_every=None,
+        profile=None):
     """Gender classifies twitter users by the content of their tweets.
 
     Only users in the intersection of the twitter7 and kwak10www datasets are
@@ -59,7 +577,68 @@ def gender_classify_users_in_intersection_by_twitter7(
         The full qualified path to the user list file.
     output_fpath : str
         The path to the designated output file.
+    n_workers : int, optional
+        If given and larger than 1, batches of users are classified by this
+        many worker processes, with a bounded number of batches in flight.
+        Results are dumped in input order either way.
+    batch_size : int, optional
+        If given, users are gender classified in batches of up to this many
+        users, each scored with a single vectorized call. Larger batches are
+        faster, but take more memory. Defaults to 1000 when n_workers is given.
+        Predictions are identical to per-user ones either way.
+    cache_fpath : str, optional
+        If given, users whose tweets and model version match those of a
+        prediction in the cache file at this path are not classified again,
+        and the cache file is rewritten with the predictions of all users.
+    early_exit_margin : float, optional
+        If given, users are classified on growing prefixes of their tweets -
+        1K, 10K and 100K words, then all of them - exiting early once the
+        absolute SPEKS score of a prefix reaches this margin. Early exit
+        rates, and the agreement of early and full predictions on a sample of
+        early exits, are reported.
+    features_dpath : str, optional
+        If given, the SPEKS feature vectors of all users are saved as a
+        sharded feature cache in this folder, to be rescored later with
+        rescore_users_by_feature_cache(). Featurizing all users, this
+        bypasses the prediction cache, and cannot be combined with early
+        exit.
+    models : list of twikwak17.gender.SpeksLexiconModel, optional
+        If given, users are classified by all of these models in a single
+        pass; the first model's predictions are dumped into the output file,
+        and those of all models are written as columns into columns_dpath.
+        Bypasses the prediction cache, and cannot be combined with early exit
+        or with saving features.
+    columns_dpath : str, optional
+        The path to the designated gender columns folder. Required if models
+        are given.
+    with_scores : bool, default False
+        If True, the scores of all models are also written as columns.
+    checkpoint_every : int, optional
+        If given, the output is committed in segments of at least this many
+        users, each along with a checkpoint of the progress made through the
+        input files, and a run interrupted after a commit is resumed from it
+        by a rerun with the same inputs and parameters; the final output is
+        bit-identical to that of an uninterrupted run. Bypasses the
+        prediction cache, and cannot be combined with saving features or
+        with classifying by several models.
+    profile : twikwak17.latency.ClassificationProfile, optional
+        If given, per-stage and per-user latencies and throughput are
+        recorded in it.
     """
+    if features_dpath is not None and early_exit_margin is not None:
+        raise ValueError(
+            "Saving features requires classifying users on all tweets, "
+            "so it cannot be combined with early exit.")
+    if models and (early_exit_margin is not None or (
+            features_dpath is not None) or columns_dpath is None):
+        raise ValueError(
+            "Classifying by several models requires a columns folder, and "
+            "cannot be combined with early exit or with saving features.")
+    if checkpoint_every is not None and (
+            features_dpath is not None or models):
+        raise ValueError(
+            "Checkpointing cannot be combined with saving features or with "
+            "classifying by several models.")
     qprint((
         "\nStarting to classify gender of users in {} by tweets in {}; "
         "Dumping into {}."
@@ -67,59 +646,86 @@ def gender_classify_users_in_intersection_by_twitter7(
         user_intersection_fpath, twitter7_tweets_by_user_fpath,
         output_fpath,
     ))
+    if checkpoint_every is not None:
+        qprint(f"Committing a checkpoint every {checkpoint_every:,} users...")
+        users_dumped, stats = _classify_with_checkpoints(
+            twitter7_tweets_by_user_fpath, user_intersection_fpath,
+            output_fpath, checkpoint_every, n_workers, batch_size,
+            early_exit_margin, profile)
+        _report_early_exit_stats(stats)
+        return users_dumped
     with ExitStack() as stack:
         tweets_f = stack.enter_context(
             gzip.open(twitter7_tweets_by_user_fpath, 'rt'))
         intrsct_f = stack.enter_context(
             gzip.open(user_intersection_fpath, 'rt'))
         out_f = stack.enter_context(gzip.open(output_fpath, 'wt+'))
-        t7_lines_read = 0
-        intersection_lines_read = 0
-        users_read = 0
-        users_matched = 0
+        if profile is not None:
+            tweets_f = TimedReader(tweets_f, profile)
+            intrsct_f = TimedReader(intrsct_f, profile)
+        users_and_tweets = iter_intersection_users_and_tweets(
+            tweets_f, intrsct_f)
+        if profile is not None:
+            users_and_tweets = profile.iter_timed_pairs(users_and_tweets)
+        if n_workers is not None and n_workers > 1:
+            qprint(f"Classifying users with {n_workers} worker processes...")
+        elif batch_size is not None:
+            qprint(f"Classifying users in batches of {batch_size:,}...")
+        stats = Counter()
+        if early_exit_margin is not None:
+            qprint((f"Classifying users on tweet prefixes, exiting early at a"
+                    f" margin of {early_exit_margin}..."))
+        if models:
+            qprint((f"Classifying users by {len(models)} models: "
+                    f"{', '.join(model.name for model in models)}; writing "
+                    f"their outputs into {columns_dpath}..."))
+            with GenderColumnsWriter(
+                    columns_dpath, models, with_scores) as writer:
+                return _classify_batches(
+                    iter_user_batches(users_and_tweets, max_users=batch_size),
+                    out_f, n_workers, columns_writer=writer,
+                    profile=profile)
+        if features_dpath is not None:
+            qprint(f"Saving user features into {features_dpath}...")
+            with FeatureCacheWriter(
+                    features_dpath,
+                    vocab=SpeksLexiconModel().vocab.keys(),
+                    inputs=feature_cache_inputs(
+                        twitter7_tweets_by_user_fpath,
+                        user_intersection_fpath)) as writer:
+                return _classify_batches(
+                    iter_user_batches(users_and_tweets, max_users=batch_size),
+                    out_f, n_workers, feature_writer=writer,
+                    profile=profile)
+        if cache_fpath is not None:
+            qprint(f"Using the gender prediction cache at {cache_fpath}...")
+            users_dumped = _classify_batches_with_cache(
+                iter_user_batches(users_and_tweets, max_users=batch_size),
+                out_f, cache_fpath, n_workers, early_exit_margin, stats,
+                profile)
+            _report_early_exit_stats(stats)
+            return users_dumped
+        if (n_workers is not None and n_workers > 1) or (
+                batch_size is not None) or (early_exit_margin is not None) or (
+                profile is not None):
+            users_dumped = _classify_batches(
+                iter_user_batches(users_and_tweets, max_users=batch_size),
+                out_f, n_workers, early_exit_margin, stats, profile=profile)
+            _report_early_exit_stats(stats)
+            return users_dumped
         users_dumped = 0
         users_and_genders_to_dump = []
-
-        t7_line = tweets_f.readline()
-        t7_lines_read += 1
-        intrsct_line = intrsct_f.readline()
-        intersection_lines_read += 1
-
-        while t7_line and intrsct_line:
-            t7_user, tweets = uname_and_tweets_from_line(t7_line)
-            list_user = re.findall(UNAME_REGEX, intrsct_line)[0]
-            list_user = list_user.lower()
-            if t7_user == list_user:
-                gender = predict_gender_by_tweets(tweets)
-                users_and_genders_to_dump.append(f"{t7_user} {gender}")
-                users_matched += 1
-                if users_matched % 100000 == 0:
-                    lines = "\n".join(users_and_genders_to_dump) + "\n"
-                    out_f.write(lines)
-                    users_dumped += 100000
-                    users_and_genders_to_dump = None
-                    del users_and_genders_to_dump
-                    gc.collect()
-                    users_and_genders_to_dump = []
-                t7_line = tweets_f.readline()
-                t7_lines_read += 1
-                intrsct_line = intrsct_f.readline()
-                intersection_lines_read += 1
-            elif t7_user < list_user:
-                t7_line = tweets_f.readline()
-                t7_lines_read += 1
-            else:
-                intrsct_line = intrsct_f.readline()
-                intersection_lines_read += 1
-            users_read += 1
-            if users_read % 5000 == 0:
-                qprint((
-                    f"{t7_lines_read:,} t7 lines read|"
-                    f"{intersection_lines_read:,} ∩ lines read|"
-                    f"{users_read:,} users read; {users_matched:,} matched|"
-                    f"{t7_user} ~ {list_user}"))
-            # if users_read % 100000 == 0:
-            #     print(f"|{t7_user}|{list_user}")
+        for t7_user, tweets in users_and_tweets:
+            gender = predict_gender_by_tweets(tweets)
+            users_and_genders_to_dump.append(f"{t7_user} {gender}")
+            if len(users_and_genders_to_dump) == DUMP_CHUNK_SIZE:
+                lines = "\n".join(users_and_genders_to_dump) + "\n"
+                out_f.write(lines)
+                users_dumped += DUMP_CHUNK_SIZE
+                users_and_genders_to_dump = None
+                del users_and_genders_to_dump
+                gc.collect()
+                users_and_genders_to_dump = []
         if len(users_and_genders_to_dump) > 0:
             lines = "\n".join(users_and_genders_to_dump) + "\n"
             out_f.write(lines)
@@ -127,7 +733,56 @@ def gender_classify_users_in_intersection_by_twitter7(
     return int(users_dumped)
 
 
-def phase4(phase1_output_dpath, phase3_output_dpath, phase4_output_dpath):
+def feature_cache_inputs(twitter7_tweets_by_user_fpath,
+                         user_intersection_fpath):
+    """Returns the signatures of the inputs a feature cache is computed from;
+    a cache is only rescored if they did not change since it was saved."""
+    return [
+        input_signature(twitter7_tweets_by_user_fpath),
+        input_signature(user_intersection_fpath),
+    ]
+
+
+def rescore_users_by_feature_cache(features_dpath, output_fpath, model=None,
+                                   chunk_rows=None):
+    """Gender classifies users by their saved features, with no text read.
+
+    Parameters
+    ----------
+    features_dpath : str
+        The path to a feature cache saved by phase 4.
+    output_fpath : str
+        The path to the designated output file.
+    model : twikwak17.gender.SpeksLexiconModel, optional
+        The model to apply; any model all of whose weighted tokens are in the
+        SPEKS lexicon will do. Defaults to the SPEKS model.
+    chunk_rows : int, optional
+        The number of users scored at once.
+
+    Returns
+    -------
+    int
+        The number of users classified.
+    """
+    if model is None:
+        model = SpeksLexiconModel()
+    qprint(f"\nRescoring the users of {features_dpath} into {output_fpath}...")
+    users_dumped = 0
+    feature_cache = FeatureCache(features_dpath)
+    with gzip.open(output_fpath, 'wt+') as out_f:
+        for users, genders in feature_cache.iter_predictions(
+                model, chunk_rows):
+            _dump_users_and_genders(out_f, users, genders.tolist())
+            users_dumped += len(users)
+            print(f" {users_dumped:,} users rescored.", end="\r")
+    return users_dumped
+
+
+def phase4(phase1_output_dpath, phase3_output_dpath, phase4_output_dpath,
+           n_workers=None, batch_size=None, use_cache=False,
+           early_exit_margin=None, save_features=False, rescore=False,
+           models=None, with_scores=False, checkpoint_every=None,
+           profile=False):
     """Build a sorted username list of the intersection of twitter7 and kwak10.
 
     Parameters
@@ -138,14 +793,56 @@ def phase4(phase1_output_dpath, phase3_output_dpath, phase4_output_dpath):
         The path to the output directory of phase 3.
     phase4_output_dpath : str
         The path to the output directory of this phase, phase 4.
+    n_workers : int, optional
+        If given and larger than 1, users are gender classified by this many
+        worker processes.
+    batch_size : int, optional
+        If given, users are gender classified in vectorized batches of up to
+        this many users.
+    use_cache : bool, default False
+        If True, the gender predictions of users whose tweets did not change
+        since the last run are read from the prediction cache of this phase,
+        rather than computed again.
+    early_exit_margin : float, optional
+        If given, users are classified on growing prefixes of their tweets,
+        exiting early once a prediction is at least this far from the
+        decision boundary.
+    save_features : bool, default False
+        If True, the SPEKS feature vectors of all users are saved into a
+        sharded feature cache in the output folder of this phase.
+    rescore : bool, default False
+        If True and a feature cache was saved by an earlier run from the same
+        - unchanged - input files, users are classified by their saved
+        features alone, with no tweets read.
+    models : list of twikwak17.gender.SpeksLexiconModel, optional
+        If given, users are classified by all of these models in one pass
+        over the data, and the outputs of all models are written as columns
+        into a gender columns folder in the output folder of this phase. The
+        first model gives the username-to-gender text map.
+    with_scores : bool, default False
+        If True, model scores are written as columns too.
+    checkpoint_every : int, optional
+        If given, progress is checkpointed every this many users, and an
+        interrupted run is resumed from its last checkpoint when rerun. The
+        prediction cache is not used when checkpointing.
+    profile : bool, default False
+        If True, the latency of each classification stage, and per-user
+        latencies by tweet length, are recorded and written to the report of
+        this phase.
     """
     start = time.time()
+    profile = ClassificationProfile() if profile else None
     t7_tweets_by_user_fpath = twitter7_tweet_list_fpath_by_dpath(
         phase1_output_dpath, sorted=False)
     user_intersection_fpath = uname_intersection_fpath_by_dpath(
         phase3_output_dpath)
     output_fpath = uname_to_gender_map_fpath_by_dpath(phase4_output_dpath)
     output_report_fpath = phase_output_report_fpath(4, phase4_output_dpath)
+    cache_fpath = None
+    if use_cache and checkpoint_every is None:
+        cache_fpath = gender_prediction_cache_fpath_by_dpath(
+            phase4_output_dpath)
+    features_dpath = feature_cache_dpath_by_dpath(phase4_output_dpath)
 
     with open(output_report_fpath, 'wt+') as output_report_f:
         set_output_report_file_handle(output_report_f)
@@ -155,11 +852,39 @@ def phase4(phase1_output_dpath, phase3_output_dpath, phase4_output_dpath):
             f"\n{user_intersection_fpath} \ninput files to {output_fpath} "
             "output file."))
 
-        user_count = gender_classify_users_in_intersection_by_twitter7(
-            t7_tweets_by_user_fpath,
-            user_intersection_fpath,
-            output_fpath,
-        )
+        cache_is_current = False
+        if rescore and not feature_cache_exists(features_dpath):
+            qprint(f"No feature cache found in {features_dpath}.")
+        elif rescore:
+            cache_is_current = FeatureCache(features_dpath).inputs == (
+                feature_cache_inputs(
+                    t7_tweets_by_user_fpath, user_intersection_fpath))
+            if not cache_is_current:
+                qprint((
+                    f"The feature cache in {features_dpath} was saved from "
+                    "other input files; classifying users by their tweets."))
+        if cache_is_current:
+            user_count = rescore_users_by_feature_cache(
+                features_dpath, output_fpath)
+        else:
+            user_count = gender_classify_users_in_intersection_by_twitter7(
+                t7_tweets_by_user_fpath,
+                user_intersection_fpath,
+                output_fpath,
+                n_workers=n_workers,
+                batch_size=batch_size,
+                cache_fpath=cache_fpath,
+                early_exit_margin=early_exit_margin,
+                features_dpath=features_dpath if save_features else None,
+                models=models,
+                columns_dpath=gender_columns_dpath_by_dpath(
+                    phase4_output_dpath),
+                with_scores=with_scores,
+                checkpoint_every=checkpoint_every,
+                profile=profile,
+            )
+            if profile is not None:
+                profile.report()
 
         qprint((
             f"{user_count:,} users gender classified;"
@@ -1,49 +1,98 @@
 """Phase 5 of the twikwak17 dataset generation process."""
 
 import re
-import gc
 import time
 import gzip
+from itertools import islice
 from contextlib import ExitStack
 
 
 from twikwak17.shared import (
     qprint,
     uname2id_fpath_by_dpath,
+    uname_index_dpath_by_dpath,
     uname_to_gender_map_fpath_by_dpath,
     uid_to_gender_map_fpath_by_dpath,
     uid_list_fpath_by_dpath,
+    uid_sort_runs_dpath_by_dpath,
+    node_index_dpath_by_dpath,
+    uid_bitmap_dpath_by_dpath,
     seconds_to_duration_str,
     phase_output_report_fpath,
     set_output_report_file_handle,
     create_timestamped_report_file_copy,
 )
+from twikwak17.extsort import ExternalSorter
+from twikwak17.node_index import (
+    NodeIndex,
+    build_node_index,
+)
+from twikwak17.uid_bitmap import UidBitmap
+from twikwak17.uname_index import (
+    NOT_FOUND,
+    UnameIndex,
+    uname_index_exists,
+)
 
 
 UNAME_TO_ID_REGEX = '(\s*\S+) (\S+)'
 
 
-def get_uname2uid_map(uname2id_fpath):
-    qprint("\nLoading uname2uid map from file...")
-    lines_read = 0
-    matching_lines = 0
-    nonmatching_lines = 0
-    uname2id_map = {}
-    with gzip.open(uname2id_fpath, 'rt') as uname2id_f:
-        for line in uname2id_f:
-            lines_read += 1
-            try:
-                uname, uid = re.findall(UNAME_TO_ID_REGEX, line)[0]
-                uname2id_map[uname] = uid
-                matching_lines += 1
-            except IndexError:
-                nonmatching_lines += 1
-            if lines_read % 100000 == 0:
-                qprint((
-                    f"{lines_read:,} lines read; {matching_lines:,}"
-                    " lines matched."), end='\r')
-    qprint("uname2uid map loaded from file successfully.\n")
-    return uname2id_map
+def iter_uname2uid_pairs(uname2id_f, counts=None):
+    """Yields the username and uid string of each line of a uname2id file.
+
+    Lines not matching the expected format are skipped.
+
+    Parameters
+    ----------
+    uname2id_f : file
+        A username to user id mapping file, opened for text reading.
+    counts : dict, optional
+        If given, the number of lines read, matched and not matched are kept
+        in it.
+
+    Yields
+    ------
+    uname, uid : str, str
+        The username and the uid string of each matching line.
+    """
+    if counts is None:
+        counts = {}
+    counts['lines_read'] = 0
+    counts['matching_lines'] = 0
+    counts['nonmatching_lines'] = 0
+    for line in uname2id_f:
+        counts['lines_read'] += 1
+        try:
+            uname, uid = re.findall(UNAME_TO_ID_REGEX, line)[0]
+        except IndexError:
+            counts['nonmatching_lines'] += 1
+            continue
+        counts['matching_lines'] += 1
+        yield uname, uid
+
+
+def iter_last_of_each_uname(uname_and_uid_pairs):
+    """Collapses runs of pairs of the same username to the last of each run.
+
+    This is the pair a dict built from all pairs in order would keep.
+
+    Raises
+    ------
+    ValueError
+        If the given pairs are not sorted by username.
+    """
+    previous = None
+    for pair in uname_and_uid_pairs:
+        if previous is not None and pair[0] != previous[0]:
+            if pair[0] < previous[0]:
+                raise ValueError((
+                    "The uname2uid file is not sorted by username: "
+                    f"{pair[0]} follows {previous[0]}."))
+            yield previous
+        previous = pair
+    if previous is not None:
+        yield previous
 
 
 UNAME_TO_GENDER_REGEX = '(\s*\S+) ([01])'
@@ -70,10 +119,84 @@ def uname_and_gender_from_line(line):
     return user, gender
 
 
-def convert_uname2gender_map_to_uid2gender_map(
+LOOKUP_BATCH_SIZE = 100000
+DUMP_CHUNK_SIZE = 100000
+
+
+def convert_uname2gender_map_by_uname_index(
+        uname_to_gender_map_fpath, uname_index_dpath, uid2gender_fpath,
+        uid_list_fpath, sorter=None):
+    """Converts a username-to-gender map using a memory-mapped uid index.
+
+    Usernames are resolved in batches with binary searches over the
+    memory-mapped index written by phase 2, so nothing is loaded up front.
+
+    Parameters
+    ----------
+    uname_to_gender_map_fpath : str
+        The full qualified path to the username-to-gender file.
+    uname_index_dpath : str
+        The full qualified path to the username-to-uid index folder.
+    uid2gender_fpath : str
+        The path to the designated uid-to-gender map output file.
+    uid_list_fpath : str
+        The path to the designated uid list output file.
+    sorter : twikwak17.extsort.ExternalSorter, optional
+        If given, the uid and gender of each dumped user are also added to
+        it.
+    """
+    uname_index = UnameIndex(uname_index_dpath)
+    qprint(f"Memory-mapped index of {len(uname_index):,} usernames opened.")
+    with ExitStack() as stack:
+        uname2g_f = stack.enter_context(
+            gzip.open(uname_to_gender_map_fpath, 'rt'))
+        uid2gender_f = stack.enter_context(gzip.open(uid2gender_fpath, 'wt+'))
+        uid_list_f = stack.enter_context(gzip.open(uid_list_fpath, 'wt+'))
+        lines_read = 0
+        lines_dumped = 0
+        users_not_found = 0
+        while True:
+            lines = [
+                line for line in islice(uname2g_f, LOOKUP_BATCH_SIZE)
+                if len(line) > 0
+            ]
+            if len(lines) < 1:
+                break
+            lines_read += len(lines)
+            unames, genders = zip(*[
+                uname_and_gender_from_line(line) for line in lines])
+            uids = uname_index.lookup(unames).tolist()
+            found = [
+                (uid, gender)
+                for uid, gender in zip(uids, genders)
+                if uid != NOT_FOUND
+            ]
+            map_lines_to_dump = [f"{uid} {gender}" for uid, gender in found]
+            users_not_found += len(lines) - len(map_lines_to_dump)
+            if len(map_lines_to_dump) > 0:
+                uid2gender_f.write("\n".join(map_lines_to_dump) + "\n")
+                uid_list_f.write("\n".join([
+                    f"{uid}" for uid, _ in found]) + "\n")
+                if sorter is not None:
+                    found_uids, found_genders = zip(*found)
+                    sorter.add(found_uids, [int(g) for g in found_genders])
+            lines_dumped += len(map_lines_to_dump)
+            qprint((
+                f"{lines_read:,} lines read|"
+                f"{lines_dumped:,} lines dumped|"
+                f"{users_not_found:,} users not found."))
+        return int(lines_dumped)
+
+
+def convert_uname2gender_map_by_merge_join(
         uname_to_gender_map_fpath, uname2id_fpath, uid2gender_fpath,
-        uid_list_fpath):
-    """Converts a username-to-gender mapping file to a user-id-to-gender one.
+        uid_list_fpath, sorter=None):
+    """Converts a username-to-gender map by merge-joining it with the
+    username to user id mapping file.
+
+    Both inputs are sorted by username, so they are read side by side, in
+    constant memory. Of several uids mapped to the same username the last one
+    is used.
 
     Parameters
     ----------
@@ -85,19 +208,22 @@ def convert_uname2gender_map_to_uid2gender_map(
         The path to the designated uid-to-gender map output file.
     uid_list_fpath : str
         The path to the designated uid list output file.
+    sorter : twikwak17.extsort.ExternalSorter, optional
+        If given, the uid and gender of each dumped user are also added to
+        it.
     """
-    qprint((
-        "\nStarting to convert username-to-gender mapping in "
-        f"{uname_to_gender_map_fpath} to a user-id-to-gender mapping using "
-        f"uname-to-id map {uname2id_fpath}. Writing result to "
-        "{uid2gender_fpath} and {uid_list_fpath}."
-    ))
-    uname2id = get_uname2uid_map(uname2id_fpath)
+    qprint("\nMerge-joining the uname2uid map with the username-to-gender "
+           "map...")
+    uname2id_counts = {}
     with ExitStack() as stack:
+        uname2id_f = stack.enter_context(gzip.open(uname2id_fpath, 'rt'))
         uname2g_f = stack.enter_context(
             gzip.open(uname_to_gender_map_fpath, 'rt'))
         uid2gender_f = stack.enter_context(gzip.open(uid2gender_fpath, 'wt+'))
         uid_list_f = stack.enter_context(gzip.open(uid_list_fpath, 'wt+'))
+        uname_and_uid_pairs = iter_last_of_each_uname(
+            iter_uname2uid_pairs(uname2id_f, uname2id_counts))
+        current = next(uname_and_uid_pairs, None)
         uname = None
         uid = None
         lines_read = 0
@@ -106,35 +232,45 @@ def convert_uname2gender_map_to_uid2gender_map(
         mapping_to_non_int_val = 0
         map_lines_to_dump = []
         list_lines_to_dump = []
+        uids_to_dump = []
+        genders_to_dump = []
+
+        def _dump():
+            uid2gender_f.write("\n".join(map_lines_to_dump) + "\n")
+            uid_list_f.write("\n".join(list_lines_to_dump) + "\n")
+            if sorter is not None:
+                sorter.add(uids_to_dump, genders_to_dump)
 
         uname2gender_line = uname2g_f.readline()
         lines_read += 1
 
         while uname2gender_line:
+            previous_uname = uname
             uname, gender = uname_and_gender_from_line(uname2gender_line)
-            try:
-                uid = uname2id[uname]
-                uid = int(uid)
-                map_lines_to_dump.append(f"{uid} {gender}")
-                list_lines_to_dump.append(f"{uid}")
-                if len(map_lines_to_dump) >= 100000:
-                    lines = "\n".join(map_lines_to_dump) + "\n"
-                    uid2gender_f.write(lines)
-                    lines = "\n".join(list_lines_to_dump) + "\n"
-                    uid_list_f.write(lines)
-                    del lines
-                    lines_dumped += 100000
-                    map_lines_to_dump = None
-                    list_lines_to_dump = None
-                    del map_lines_to_dump
-                    del list_lines_to_dump
-                    gc.collect()
-                    map_lines_to_dump = []
-                    list_lines_to_dump = []
-            except KeyError:
+            if previous_uname is not None and uname < previous_uname:
+                raise ValueError((
+                    "The username-to-gender map is not sorted by username: "
+                    f"{uname} follows {previous_uname}."))
+            while current is not None and current[0] < uname:
+                current = next(uname_and_uid_pairs, None)
+            if current is None or current[0] != uname:
                 users_not_found += 1
-            except ValueError:
-                mapping_to_non_int_val += 1
+            else:
+                try:
+                    uid = int(current[1])
+                    map_lines_to_dump.append(f"{uid} {gender}")
+                    list_lines_to_dump.append(f"{uid}")
+                    uids_to_dump.append(uid)
+                    genders_to_dump.append(int(gender))
+                except ValueError:
+                    mapping_to_non_int_val += 1
+            if len(map_lines_to_dump) >= DUMP_CHUNK_SIZE:
+                _dump()
+                lines_dumped += len(map_lines_to_dump)
+                map_lines_to_dump = []
+                list_lines_to_dump = []
+                uids_to_dump = []
+                genders_to_dump = []
             uname2gender_line = uname2g_f.readline()
             lines_read += 1
             if lines_read % 10000 == 0:
@@ -144,15 +280,102 @@ def convert_uname2gender_map_to_uid2gender_map(
                     f"{mapping_to_non_int_val} bad mappings|"
                     f"{users_not_found:,} users not found. {uname} ~ {uid}"))
         if len(map_lines_to_dump) > 0:
-            lines = "\n".join(map_lines_to_dump) + "\n"
-            uid2gender_f.write(lines)
-            lines = "\n".join(list_lines_to_dump) + "\n"
-            uid_list_f.write(lines)
+            _dump()
             lines_dumped += len(map_lines_to_dump)
-        return int(lines_dumped)
+    qprint((
+        f"{uname2id_counts.get('lines_read', 0):,} uname2uid lines read; "
+        f"{uname2id_counts.get('matching_lines', 0):,} lines matched."))
+    qprint((
+        f"{lines_read:,} lines read|"
+        f"{lines_dumped:,} lines dumped|"
+        f"{mapping_to_non_int_val} bad mappings|"
+        f"{users_not_found:,} users not found."))
+    return int(lines_dumped)
 
 
-def phase5(phase2_output_dpath, phase4_output_dpath, phase5_output_dpath):
+def convert_uname2gender_map_to_uid2gender_map(
+        uname_to_gender_map_fpath, uname2id_fpath, uid2gender_fpath,
+        uid_list_fpath, uname_index_dpath=None, sorter=None):
+    """Converts a username-to-gender mapping file to a user-id-to-gender one.
+
+    Parameters
+    ----------
+    uname_to_gender_map_fpath : str
+        The full qualified path to the username-to-gender file.
+    uname2id_fpath : str
+        The full qualified path to the username to user id mapping file.
+    uid2gender_fpath : str
+        The path to the designated uid-to-gender map output file.
+    uid_list_fpath : str
+        The path to the designated uid list output file.
+    uname_index_dpath : str, optional
+        The full qualified path to a username-to-uid index folder, as written
+        by phase 2. If given and the index exists, it is used for lookups.
+        Otherwise - the default - the username to user id mapping file,
+        sorted by username as is the username-to-gender file, is merge-joined
+        with it.
+    sorter : twikwak17.extsort.ExternalSorter, optional
+        If given, the uid and gender of each dumped user are also added to
+        it, so that uid-sorted outputs can be written after the conversion.
+    """
+    qprint((
+        "\nStarting to convert username-to-gender mapping in "
+        f"{uname_to_gender_map_fpath} to a user-id-to-gender mapping using "
+        f"uname-to-id map {uname2id_fpath}. Writing result to "
+        "{uid2gender_fpath} and {uid_list_fpath}."
+    ))
+    if uname_index_dpath is not None and uname_index_exists(
+            uname_index_dpath):
+        return convert_uname2gender_map_by_uname_index(
+            uname_to_gender_map_fpath=uname_to_gender_map_fpath,
+            uname_index_dpath=uname_index_dpath,
+            uid2gender_fpath=uid2gender_fpath,
+            uid_list_fpath=uid_list_fpath,
+            sorter=sorter,
+        )
+    return convert_uname2gender_map_by_merge_join(
+        uname_to_gender_map_fpath=uname_to_gender_map_fpath,
+        uname2id_fpath=uname2id_fpath,
+        uid2gender_fpath=uid2gender_fpath,
+        uid_list_fpath=uid_list_fpath,
+        sorter=sorter,
+    )
+
+
+def dump_uid_sorted_maps(sorter, uid2gender_fpath, uid_list_fpath):
+    """Writes the records of a sorter as uid-sorted uid-to-gender and uid
+    list files.
+
+    Parameters
+    ----------
+    sorter : twikwak17.extsort.ExternalSorter
+        A sorter holding the uid and gender of all users.
+    uid2gender_fpath : str
+        The path to the designated uid-sorted uid-to-gender output file.
+    uid_list_fpath : str
+        The path to the designated uid-sorted uid list output file.
+
+    Returns
+    -------
+    int
+        The number of users written.
+    """
+    users_dumped = 0
+    with ExitStack() as stack:
+        uid2gender_f = stack.enter_context(gzip.open(uid2gender_fpath, 'wt+'))
+        uid_list_f = stack.enter_context(gzip.open(uid_list_fpath, 'wt+'))
+        for uids, genders in sorter.iter_sorted():
+            uids = uids.tolist()
+            uid2gender_f.write("".join(
+                f"{uid} {gender}\n"
+                for uid, gender in zip(uids, genders.tolist())))
+            uid_list_f.write("".join(f"{uid}\n" for uid in uids))
+            users_dumped += len(uids)
+    return users_dumped
+
+
+def phase5(phase2_output_dpath, phase4_output_dpath, phase5_output_dpath,
+           use_uname_index=False):
     """Build a sorted username list of the intersection of twitter7 and kwak10.
 
     Parameters
@@ -163,14 +386,29 @@ def phase5(phase2_output_dpath, phase4_output_dpath, phase5_output_dpath):
         The path to the output directory of phase 4.
     phase5_output_dpath : str
         The path to the output directory of this phase, phase 5.
+    use_uname_index : bool, default False
+        If True and phase 2 wrote a username-to-uid index, usernames are
+        looked up in it rather than merge-joined with the uname2id file.
+        The index holds integer uids only, so the bad mappings counted by
+        the merge-join are not counted on this path.
     """
     start = time.time()
     uname2id_fpath = uname2id_fpath_by_dpath(
         phase2_output_dpath)
+    uname_index_dpath = None
+    if use_uname_index:
+        uname_index_dpath = uname_index_dpath_by_dpath(phase2_output_dpath)
     uname_to_gender_map_fpath = uname_to_gender_map_fpath_by_dpath(
         phase4_output_dpath)
     uid2gender_fpath = uid_to_gender_map_fpath_by_dpath(phase5_output_dpath)
     uid_list_fpath = uid_list_fpath_by_dpath(phase5_output_dpath)
+    sorted_uid2gender_fpath = uid_to_gender_map_fpath_by_dpath(
+        phase5_output_dpath, sorted=True)
+    sorted_uid_list_fpath = uid_list_fpath_by_dpath(
+        phase5_output_dpath, sorted=True)
+    sort_runs_dpath = uid_sort_runs_dpath_by_dpath(phase5_output_dpath)
+    node_index_dpath = node_index_dpath_by_dpath(phase5_output_dpath)
+    uid_bitmap_dpath = uid_bitmap_dpath_by_dpath(phase5_output_dpath)
     output_report_fpath = phase_output_report_fpath(5, phase5_output_dpath)
 
     with open(output_report_fpath, 'wt+') as output_report_f:
@@ -181,18 +419,45 @@ def phase5(phase2_output_dpath, phase4_output_dpath, phase5_output_dpath):
             f"\n{uname_to_gender_map_fpath} \ninput files to "
             "{uid2gender_fpath} and {uid_list_fpath} output files."))
 
-        user_count = convert_uname2gender_map_to_uid2gender_map(
-            uname_to_gender_map_fpath=uname_to_gender_map_fpath,
-            uname2id_fpath=uname2id_fpath,
-            uid2gender_fpath=uid2gender_fpath,
-            uid_list_fpath=uid_list_fpath,
-        )
+        # users are sorted by uid, in runs, while the conversion goes on
+        with ExternalSorter(sort_runs_dpath) as sorter:
+            user_count = convert_uname2gender_map_to_uid2gender_map(
+                uname_to_gender_map_fpath=uname_to_gender_map_fpath,
+                uname2id_fpath=uname2id_fpath,
+                uid2gender_fpath=uid2gender_fpath,
+                uid_list_fpath=uid_list_fpath,
+                uname_index_dpath=uname_index_dpath,
+                sorter=sorter,
+            )
+
+            qprint((
+                f"Translated username to uid of {user_count:,} users in"
+                f" username-to-gender map; dumped to {uid2gender_fpath}."
+                f" User ID list dumped to {uid_list_fpath}."
+            ))
+
+            qprint("Merging uid-sorted runs...")
+            merge_start = time.time()
+            dump_uid_sorted_maps(
+                sorter, sorted_uid2gender_fpath, sorted_uid_list_fpath)
+            qprint((
+                f"Uid-sorted map and user ID list dumped to "
+                f"{sorted_uid2gender_fpath} and {sorted_uid_list_fpath} in "
+                f"{seconds_to_duration_str(time.time() - merge_start)}."))
 
+        qprint("Assigning dense node indices to users...")
+        node_count = build_node_index(uid2gender_fpath, node_index_dpath)
         qprint((
-            f"Translated username to uid of {user_count:,} users in"
-            f" username-to-gender map; dumped to {uid2gender_fpath}."
-            f" User ID list dumped to {uid_list_fpath}."
-        ))
+            f"{node_count:,} users assigned node indices 0..{node_count - 1:,}"
+            f"; uid and gender tables written to {node_index_dpath}."))
+
+        node_index = NodeIndex(node_index_dpath)
+        uid_bitmap = UidBitmap.from_uids(
+            node_index.uid_by_index, node_index.gender_by_index)
+        uid_bitmap.save(uid_bitmap_dpath)
+        qprint((
+            f"Uid {uid_bitmap.kind} of {len(uid_bitmap):,} users, with "
+            f"genders, written to {uid_bitmap_dpath}."))
 
         end = time.time()
         qprint((
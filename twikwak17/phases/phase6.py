@@ -1,13 +1,13 @@
 """Phase 6 of the twikwak17 dataset generation process."""
 
-import re
-import gc
+import os
 import time
 import gzip
+import shutil
 import zipfile
+import tempfile
 from contextlib import ExitStack
 
-
 from twikwak17.shared import (
     qprint,
     seconds_to_duration_str,
@@ -15,60 +15,128 @@ from twikwak17.shared import (
     set_output_report_file_handle,
     create_timestamped_report_file_copy,
     kwak10_twitter_rv_fpath,
+    kwak10_twitter_rv_edge_cache_fpath,
+    TWITTER_RV_MEMBER_FNAME,
     uid_to_gender_map_fpath_by_dpath,
     social_graph_fpath_by_dpath,
+    social_graph_edges_dpath_by_dpath,
+    node_index_dpath_by_dpath,
+    uid_bitmap_dpath_by_dpath,
+)
+from twikwak17.edges import (
+    format_int_pairs,
+    iter_int_pair_blocks,
+)
+from twikwak17.edge_pipeline import (
+    filter_edges,
+    filter_edge_list_in_parallel,
+)
+from twikwak17.binary_edges import (
+    BinaryEdgeListWriter,
+    INDEX_COLUMNS,
+    UID_COLUMNS,
+)
+from twikwak17.edge_cache import (
+    EdgeCacheWriter,
+    iter_edge_cache_chunks,
+    open_edge_cache,
+    source_signature,
+)
+from twikwak17.node_index import (
+    NodeIndex,
+    node_index_exists,
+)
+from twikwak17.uid_bitmap import (
+    UidBitmap,
+    uid_bitmap_exists,
 )
 
 
-UID_TO_GENDER_REGEX = '(\d+) ([01])'
-
+def _report_progress(counts):
+    qprint((
+        f"{counts['edges_read']:,} edges read|"
+        f"{counts['edges_dumped']:,} edges dumped|"
+        f"{counts['edges_read'] - counts['edges_dumped']:,} edges thrown|"
+        f"{counts['malformed_lines']:,} malformed lines."), end='\r')
 
-def get_uid_set(uid2gender_fpath):
-    qprint("\nLoading uid-to-gender map from file...")
-    lines_read = 0
-    matching_lines = 0
-    nonmatching_lines = 0
-    bad_uid_lines = 0
-    uid_set = set()
-    with gzip.open(uid2gender_fpath, 'rt') as uid2gender_f:
-        for line in uid2gender_f:
-            lines_read += 1
-            try:
-                uid, gender = re.findall(UID_TO_GENDER_REGEX, line)[0]
-            except IndexError:
-                nonmatching_lines += 1
-            try:
-                uid_set.add(int(uid))
-                matching_lines += 1
-            except ValueError:
-                bad_uid_lines += 1
-                print(uid)
-            if lines_read % 100000 == 0:
-                qprint((
-                    f"{lines_read:,} lines read; {matching_lines:,}"
-                    f" lines matched. {bad_uid_lines} bad UIDs."), end='\r')
 
-    qprint("User ID set loaded from file successfully.\n")
-    return uid_set
+def _filter_and_write(edges, counts, out_f, uid_bitmap, node_index,
+                      dense_out_f, binary_writer):
+    kept_edges, kept_indices = filter_edges(edges, uid_bitmap, node_index)
+    out_f.write(format_int_pairs(kept_edges))
+    if dense_out_f is not None:
+        dense_out_f.write(format_int_pairs(kept_indices))
+    if binary_writer is not None:
+        binary_writer.add_pairs(kept_edges, kept_indices)
+    counts['edges_read'] += len(edges)
+    counts['edges_dumped'] += len(kept_edges)
 
 
-UID_TO_UID_REGEX = '(\d+)[\t\s]+(\d+)'
+def _project_edge_blocks(
+        twitter_rv_f, out_f, uid_bitmap=None, node_index=None,
+        dense_out_f=None, cache_writer=None, binary_writer=None):
+    """Projects edges a block at a time, parsing, filtering and formatting
+    all edges of a block with array operations. Users are looked up either in
+    a uid bitmap or in a node index. If a cache writer is given, all parsed
+    edges are also written to it. Returns a dict of counts."""
+    block_counts = {}
+    counts = {'edges_read': 0, 'edges_dumped': 0, 'malformed_lines': 0}
+    try:
+        for edges in iter_int_pair_blocks(twitter_rv_f, counts=block_counts):
+            if cache_writer is not None:
+                try:
+                    cache_writer.add(edges, (
+                        block_counts['malformed_lines']
+                        - counts['malformed_lines']))
+                except ValueError as e:
+                    qprint(f"\nEdges will not be cached: {e}")
+                    cache_writer.abort()
+                    cache_writer = None
+            _filter_and_write(
+                edges, counts, out_f, uid_bitmap, node_index, dense_out_f,
+                binary_writer)
+            counts['malformed_lines'] = block_counts['malformed_lines']
+            _report_progress(counts)
+        if cache_writer is not None:
+            cache_writer.finish()
+            qprint((
+                f"\n{cache_writer.count:,} parsed edges cached to "
+                f"{cache_writer.cache_fpath}."))
+    except BaseException:
+        if cache_writer is not None:
+            cache_writer.abort()
+        raise
+    return counts
 
 
-def uids_from_edge_line(line):
-    if len(line) < 1:
-        return None, None
-    uid, uid = re.findall(UID_TO_UID_REGEX, line)[0]
-    return int(uid), int(uid)
+def _project_cached_edges(
+        cached_edges, malformed_lines, out_f, uid_bitmap=None,
+        node_index=None, dense_out_f=None, binary_writer=None):
+    """Projects memory-mapped cached edges, a chunk at a time. Returns a
+    dict of counts."""
+    counts = {
+        'edges_read': 0, 'edges_dumped': 0,
+        'malformed_lines': malformed_lines,
+    }
+    for edges in iter_edge_cache_chunks(cached_edges):
+        _filter_and_write(
+            edges, counts, out_f, uid_bitmap, node_index, dense_out_f,
+            binary_writer)
+        _report_progress(counts)
+    return counts
 
 
 def project_edge_list_to_user_intersection(
-        twitter_rv_fpath, uid2gender_fpath, output_fpath):
+        twitter_rv_fpath, uid2gender_fpath, output_fpath,
+        node_index_dpath=None, dense_output_fpath=None,
+        uid_bitmap_dpath=None, n_workers=None, edge_cache_fpath=None,
+        build_edge_cache=False, binary_output_dpath=None):
     """Projects a user-to-user edge list to a given user intersection list.
 
     All edges between one (or two) users who cannot be found in the given user
     intersection list are removed in the new version of the user-to-user edge
-    list file created.  d.
+    list file created. The edge list is read, filtered and written in large
+    blocks, with numpy array operations, rather than a line at a time.
 
     Parameters
     ----------
@@ -78,55 +146,150 @@ def project_edge_list_to_user_intersection(
         The full qualified path to the user-id-to-gender file.
     output_fpath : str
         The path to the designated output file.
+    node_index_dpath : str, optional
+        The full qualified path to a dense node index folder, as written by
+        phase 5. Users are looked up in it if a dense-index edge list is
+        written, or if no uid bitmap is found.
+    dense_output_fpath : str, optional
+        If given, the projected edge list is also written to this path with
+        each user given by its dense node index rather than its uid. Requires
+        a node index.
+    uid_bitmap_dpath : str, optional
+        The full qualified path to a uid bitmap folder, as written by phase 5.
+        If given and the bitmap exists, users are looked up in it, memory
+        mapped. If neither it nor a node index is found, a uid bitmap is
+        built from the user-id-to-gender file.
+    n_workers : int, optional
+        If given and larger than 1, edge blocks are parsed and filtered by
+        this many worker processes, fed through shared memory, while this
+        process inflates the social graph file and compresses the output.
+    edge_cache_fpath : str, optional
+        The full qualified path to a binary cache of the parsed social graph.
+        If the cache exists and matches the social graph file, its memory
+        mapped edges are scanned instead of the social graph file.
+    build_edge_cache : bool, default False
+        If True and no valid edge cache is found at edge_cache_fpath, one is
+        written there while the social graph file is parsed, in this process.
+    binary_output_dpath : str, optional
+        If given, the kept edges are also written to this folder as a binary,
+        columnar edge list of uid pairs - and of node index pairs, if a
+        dense-index edge list is written.
+
+    Returns
+    -------
+    edges_thrown, edges_dumped : int, int
+        The number of edges removed, counting malformed lines, and kept.
     """
     qprint("Starting to run through social graph file...")
-    uid_set = get_uid_set(uid2gender_fpath)
+    use_node_index = node_index_dpath is not None and node_index_exists(
+        node_index_dpath)
+    if dense_output_fpath is not None and not use_node_index:
+        raise ValueError(
+            "Writing a dense-index edge list requires a node index.")
+    use_uid_bitmap = uid_bitmap_dpath is not None and uid_bitmap_exists(
+        uid_bitmap_dpath)
+    use_node_index = use_node_index and (
+        dense_output_fpath is not None or not use_uid_bitmap)
+    cached_edges = None
+    if edge_cache_fpath is not None:
+        signature = source_signature(
+            twitter_rv_fpath, TWITTER_RV_MEMBER_FNAME)
+        cached_edges, cache_header = open_edge_cache(
+            edge_cache_fpath, signature)
+        if cached_edges is None:
+            qprint(f"No valid edge cache found at {edge_cache_fpath}.")
+    build_cache = (
+        build_edge_cache and edge_cache_fpath is not None
+        and cached_edges is None)
+    parallel = (
+        cached_edges is None and not build_cache
+        and n_workers is not None and n_workers > 1)
+    if build_cache and n_workers is not None and n_workers > 1:
+        qprint((
+            "Edges are cached while they are parsed, in a single process; "
+            f"n_workers={n_workers} is ignored."))
     with ExitStack() as stack:
+        node_index = None
+        uid_bitmap = None
+        if use_node_index:
+            node_index = NodeIndex(node_index_dpath)
+            qprint(f"Dense node index of {len(node_index):,} users opened.")
+        elif use_uid_bitmap:
+            uid_bitmap = UidBitmap.load(uid_bitmap_dpath)
+            qprint((
+                f"Uid {uid_bitmap.kind} of {len(uid_bitmap):,} users "
+                "opened."))
+        else:
+            qprint("\nBuilding a uid bitmap from the uid-to-gender map...")
+            uid_bitmap = UidBitmap.from_uid2gender_file(
+                uid2gender_fpath, with_genders=False)
+            qprint((
+                f"Uid {uid_bitmap.kind} of {len(uid_bitmap):,} users "
+                "built."))
+            if parallel:
+                # workers memory-map the bitmap from disk
+                uid_bitmap_dpath = stack.enter_context(
+                    tempfile.TemporaryDirectory(
+                        dir=os.path.dirname(os.path.abspath(output_fpath))))
+                uid_bitmap.save(uid_bitmap_dpath)
+        out_f = stack.enter_context(gzip.open(output_fpath, 'wb'))
+        dense_out_f = None
+        if dense_output_fpath is not None:
+            dense_out_f = stack.enter_context(
+                gzip.open(dense_output_fpath, 'wb'))
+        binary_writer = None
+        if binary_output_dpath is not None:
+            columns = UID_COLUMNS
+            if dense_output_fpath is not None:
+                columns = UID_COLUMNS + INDEX_COLUMNS
+            binary_writer = BinaryEdgeListWriter(binary_output_dpath, columns)
+        if cached_edges is not None:
+            qprint((
+                f"Scanning {len(cached_edges):,} cached edges in "
+                f"{edge_cache_fpath}..."))
+            counts = _project_cached_edges(
+                cached_edges, cache_header['malformed_lines'], out_f,
+                uid_bitmap=uid_bitmap, node_index=node_index,
+                dense_out_f=dense_out_f, binary_writer=binary_writer)
+            return _finish_projection(counts, binary_writer)
         twitter_rv_z = stack.enter_context(
             zipfile.ZipFile(twitter_rv_fpath, 'r'))
         twitter_rv_f = stack.enter_context(
-            twitter_rv_z.open('twitter_rv.net', 'r'))
-        out_f = stack.enter_context(gzip.open(output_fpath, 'wt+'))
-        uid1, uid2 = None, None
-        lines_read = 0
-        lines_dumped = 0
-        edges_thrown = 0
-        lines_to_dump = []
-
-        edge_line = twitter_rv_f.readline()
-        lines_read += 1
-
-        while edge_line:
-            edge_str = edge_line.decode("utf-8")
-            uid1, uid2 = uids_from_edge_line(edge_str)
-            if (uid1 in uid_set) and (uid2 in uid_set):
-                lines_to_dump.append(f"{uid1} {uid2}")
-            else:
-                edges_thrown += 1
-            if len(lines_to_dump) >= 100000:
-                lines = "\n".join(lines_to_dump) + "\n"
-                out_f.write(lines)
-                lines_dumped += 100000
-                lines_to_dump = None
-                del lines_to_dump
-                gc.collect()
-                lines_to_dump = []
-            edge_line = twitter_rv_f.readline()
-            lines_read += 1
-            if lines_read % 10000 == 0:
-                qprint((
-                    f"{lines_read:,} lines read|"
-                    f"{lines_dumped:,} lines dumped|"
-                    f"{edges_thrown:,} edges thrown. {uid1} ~ {uid2}"),
-                    end='\r')
-        if len(lines_to_dump) > 0:
-            lines = "\n".join(lines_to_dump) + "\n"
-            out_f.write(lines)
-            lines_dumped += len(lines_to_dump)
-        return int(edges_thrown), int(lines_dumped)
-
-
-def phase6(phase5_output_dpath, phase6_output_dpath):
+            twitter_rv_z.open(TWITTER_RV_MEMBER_FNAME, 'r'))
+        if parallel:
+            qprint(f"Filtering edges with {n_workers} worker processes...")
+            counts = filter_edge_list_in_parallel(
+                twitter_rv_f, out_f, n_workers,
+                uid_bitmap_dpath=None if use_node_index else uid_bitmap_dpath,
+                node_index_dpath=node_index_dpath if use_node_index else None,
+                dense_out_f=dense_out_f, binary_writer=binary_writer,
+                progress_callback=_report_progress)
+        else:
+            cache_writer = None
+            if build_cache:
+                qprint(f"Caching parsed edges to {edge_cache_fpath}...")
+                cache_writer = EdgeCacheWriter(edge_cache_fpath, signature)
+            counts = _project_edge_blocks(
+                twitter_rv_f, out_f, uid_bitmap=uid_bitmap,
+                node_index=node_index, dense_out_f=dense_out_f,
+                cache_writer=cache_writer, binary_writer=binary_writer)
+    return _finish_projection(counts, binary_writer)
+
+
+def _finish_projection(counts, binary_writer):
+    if binary_writer is not None:
+        binary_writer.finish()
+        qprint((
+            f"\n{binary_writer.count:,} kept edges written as a binary edge "
+            f"list to {binary_writer.dpath}."))
+    edges_dumped = counts['edges_dumped']
+    edges_thrown = (
+        counts['edges_read'] - edges_dumped + counts['malformed_lines'])
+    return int(edges_thrown), int(edges_dumped)
+
+
+def phase6(phase5_output_dpath, phase6_output_dpath, dense=False,
+           n_workers=None, build_edge_cache=False, binary=False):
     """Removes non-intersection edges from kwak10's social graph.
 
     Parameters
@@ -135,11 +298,38 @@ def phase6(phase5_output_dpath, phase6_output_dpath):
         The path to the output directory of phase 5.
     phase6_output_dpath : str
         The path to the output directory of this phase, phase 6.
+    dense : bool, default False
+        If True, the edge list is also written with users given by their
+        dense node indices, as assigned by phase 5.
+    n_workers : int, optional
+        If given and larger than 1, edges are parsed and filtered by this many
+        worker processes.
+    build_edge_cache : bool, default False
+        If True, a binary cache of the parsed social graph is written next to
+        it, unless a valid one exists. A valid cache is always used.
+    binary : bool, default False
+        If True, the kept edges are also written as a binary, columnar edge
+        list, which phase 7 then reads instead of the text edge list.
     """
     start = time.time()
     twitter_rv_fpath = kwak10_twitter_rv_fpath()
+    edge_cache_fpath = kwak10_twitter_rv_edge_cache_fpath()
     uid2gender_fpath = uid_to_gender_map_fpath_by_dpath(phase5_output_dpath)
     output_fpath = social_graph_fpath_by_dpath(phase6_output_dpath)
+    node_index_dpath = node_index_dpath_by_dpath(phase5_output_dpath)
+    uid_bitmap_dpath = uid_bitmap_dpath_by_dpath(phase5_output_dpath)
+    dense_output_fpath = None
+    if dense:
+        dense_output_fpath = social_graph_fpath_by_dpath(
+            phase6_output_dpath, dense=True)
+    binary_output_dpath = social_graph_edges_dpath_by_dpath(
+        phase6_output_dpath)
+    if not binary:
+        # phase 7 prefers a binary edge list, so one left by an earlier run
+        # must not outlive the text edge list it was written with
+        if os.path.exists(binary_output_dpath):
+            shutil.rmtree(binary_output_dpath)
+        binary_output_dpath = None
     output_report_fpath = phase_output_report_fpath(6, phase6_output_dpath)
 
     with open(output_report_fpath, 'wt+') as output_report_f:
@@ -154,6 +344,13 @@ def phase6(phase5_output_dpath, phase6_output_dpath):
             twitter_rv_fpath=twitter_rv_fpath,
             uid2gender_fpath=uid2gender_fpath,
             output_fpath=output_fpath,
+            node_index_dpath=node_index_dpath,
+            dense_output_fpath=dense_output_fpath,
+            uid_bitmap_dpath=uid_bitmap_dpath,
+            n_workers=n_workers,
+            edge_cache_fpath=edge_cache_fpath,
+            build_edge_cache=build_edge_cache,
+            binary_output_dpath=binary_output_dpath,
         )
 
         qprint((
@@ -7,6 +7,7 @@ import gzip
 # import zipfile
 from contextlib import ExitStack
 
+import numpy as np
 
 from twikwak17.shared import (
     qprint,
@@ -17,6 +18,19 @@ from twikwak17.shared import (
     uid_to_gender_map_fpath_by_dpath,
     social_graph_fpath_by_dpath,
     graphml_fpath_by_dpath,
+    node_index_dpath_by_dpath,
+    social_graph_edges_dpath_by_dpath,
+)
+from twikwak17.node_index import NodeIndex
+from twikwak17.edges import (
+    iter_int_pair_blocks,
+    format_int_pairs,
+)
+from twikwak17.binary_edges import (
+    UID_COLUMNS,
+    INDEX_COLUMNS,
+    BinaryEdgeList,
+    binary_edge_list_exists,
 )
 
 
@@ -48,16 +62,6 @@ def uid_and_gender_from_line(line):
     return uid, gender
 
 
-UID_TO_UID_REGEX = '(\d+)[\t\s]+(\d+)'
-
-
-def uids_from_edge_line(line):
-    if len(line) < 1:
-        return None, None
-    uid, uid = re.findall(UID_TO_UID_REGEX, line)[0]
-    return int(uid), int(uid)
-
-
 GRAPHML_HEADER = ((
     '<?xml version="1.0" encoding="UTF-8"?>\n'
     '<graphml xmlns="http://graphml.graphdrawing.org/xmlns"'
@@ -71,11 +75,75 @@ GRAPHML_FOOTER = ((
     '  </graph>\n'
     '</graphml>\n'
 ))
+GRAPHML_UID_KEY = (
+    '  <key id="uid" for="node" attr.name="uid" attr.type="long"/>\n')
+GRAPHML_GRAPH_OPENER = '  <graph id="twikwak17"'
+DENSE_GRAPHML_HEADER = GRAPHML_HEADER.replace(
+    GRAPHML_GRAPH_OPENER, GRAPHML_UID_KEY + GRAPHML_GRAPH_OPENER)
+NODE_CHUNK_SIZE = 100000
+SAMPLE_EDGES = 100000
+GRAPHML_EDGE_PREFIX = b'    <edge source="'
+GRAPHML_EDGE_SEPARATOR = b'" target="'
+GRAPHML_EDGE_SUFFIX = b'" />\n'
+
+
+def iter_edge_chunks(edge_list_fpath, binary_edges_dpath=None,
+                     columns=UID_COLUMNS):
+    """Yields the edges of a phase 6 edge list in chunks.
+
+    Parameters
+    ----------
+    edge_list_fpath : str
+        The full qualified path to a gzipped text edge list.
+    binary_edges_dpath : str, optional
+        The path to a binary edge list of the same edges. Read instead of
+        the text edge list if it is complete and holds the given columns.
+    columns : pair of str, default ('src', 'dst')
+        The source and destination columns read from the binary edge list.
+
+    Yields
+    ------
+    numpy.ndarray
+        An (n, 2) int64 array of each chunk of edges.
+    """
+    if binary_edges_dpath is not None and binary_edge_list_exists(
+            binary_edges_dpath):
+        binary_edges = BinaryEdgeList(binary_edges_dpath)
+        if binary_edges.has_columns(columns):
+            qprint(f"Reading edges from binary edge list {binary_edges_dpath}")
+            yield from binary_edges.iter_pairs(columns)
+            return
+    with gzip.open(edge_list_fpath, 'rb') as edges_f:
+        yield from iter_int_pair_blocks(edges_f)
+
+
+def dump_graphml_edges(edge_chunks, out_f, sample_f):
+    """Writes graphml edge elements for chunks of edges, formatting each chunk
+    at once. The first 100,000 edges are also written to the sample file.
+
+    Returns
+    -------
+    int
+        The number of edges dumped.
+    """
+    edges_dumped = 0
+    for edges in edge_chunks:
+        lines = format_int_pairs(
+            edges, GRAPHML_EDGE_PREFIX, GRAPHML_EDGE_SEPARATOR,
+            GRAPHML_EDGE_SUFFIX).decode('ascii')
+        out_f.write(lines)
+        if edges_dumped < SAMPLE_EDGES:
+            sample_f.write(format_int_pairs(
+                edges[:SAMPLE_EDGES - edges_dumped], GRAPHML_EDGE_PREFIX,
+                GRAPHML_EDGE_SEPARATOR, GRAPHML_EDGE_SUFFIX).decode('ascii'))
+        edges_dumped += len(edges)
+        qprint(f"{edges_dumped:,} edges dumped.", end='\r')
+    return edges_dumped
 
 
 def convert_twikwak17_to_graphml_format(
         uid2gender_fpath, social_graph_fpath, graphml_fpath,
-        graphml_sample_fpath):
+        graphml_sample_fpath, binary_edges_dpath=None):
     """Projects a user-to-user edge list to a given user intersection list.
 
     All edges between one (or two) users who cannot be found in the given user
@@ -92,6 +160,9 @@ def convert_twikwak17_to_graphml_format(
         The path to the designated output file.
     graphml_sample_fpath : str
         The path to the designated sample output file.
+    binary_edges_dpath : str, optional
+        The path to a binary edge list of the social graph, read instead of
+        the social graph file if complete.
     """
     qprint("Starting to convert twikwak17 to graphml format...")
     with ExitStack() as stack:
@@ -146,42 +217,77 @@ def convert_twikwak17_to_graphml_format(
         qprint("Node information dumped.")
 
         qprint("Starting to dump edge information...")
-        lines_read = 0
-        lines_dumped = 0
-        lines_to_dump = []
-        sample_edge_lines = False
-        edges_f = stack.enter_context(gzip.open(social_graph_fpath, 'rt'))
-        edge_line = edges_f.readline()
-        lines_read += 1
+        edges_dumped = dump_graphml_edges(
+            iter_edge_chunks(social_graph_fpath, binary_edges_dpath),
+            out_f, sample_f)
+        qprint("Edge information dumped.")
 
-        while edge_line:
-            uid1, uid2 = uids_from_edge_line(edge_line)
-            lines_to_dump.append(
-                f'    <edge source="{uid1}" target="{uid2}" />')
-            if len(lines_to_dump) >= 100000:
-                lines = "\n".join(lines_to_dump) + "\n"
-                out_f.write(lines)
-                if not sample_edge_lines:
-                    sample_f.write(lines)
-                    sample_edge_lines = True
-                lines_dumped += 100000
-                lines_to_dump = None
-                del lines_to_dump
-                gc.collect()
-                lines_to_dump = []
-            edge_line = edges_f.readline()
-            lines_read += 1
-            if lines_read % 10000 == 0:
-                qprint((
-                    f"{lines_read:,} lines read|"
-                    f"{lines_dumped:,} lines dumped. {uid1} ~ {uid2}"),
-                    end='\r')
-        if len(lines_to_dump) > 0:
-            lines = "\n".join(lines_to_dump) + "\n"
+        out_f.write(GRAPHML_FOOTER)
+        sample_f.write(GRAPHML_FOOTER)
+
+    qprint("Conversion to graphml format complete.")
+    return nodes_dumped, edges_dumped
+
+
+def convert_dense_twikwak17_to_graphml_format(
+        node_index_dpath, dense_social_graph_fpath, graphml_fpath,
+        graphml_sample_fpath, binary_edges_dpath=None):
+    """Converts the dense-index twikwak17 graph into the graphml format.
+
+    Nodes are identified by their dense node index, and carry their uid and
+    gender as data.
+
+    Parameters
+    ----------
+    node_index_dpath : str
+        The full qualified path to twikwak17's dense node index folder.
+    dense_social_graph_fpath : str
+        The full qualified path to twikwak17's dense-index social graph file.
+    graphml_fpath : str
+        The path to the designated output file.
+    graphml_sample_fpath : str
+        The path to the designated sample output file.
+    binary_edges_dpath : str, optional
+        The path to a binary edge list of the social graph, read instead of
+        the dense-index social graph file if complete and holding node
+        indices.
+    """
+    qprint("Starting to convert dense twikwak17 to graphml format...")
+    node_index = NodeIndex(node_index_dpath)
+    with ExitStack() as stack:
+        out_f = stack.enter_context(gzip.open(graphml_fpath, 'wt+'))
+        sample_f = stack.enter_context(open(graphml_sample_fpath, 'wt+'))
+        out_f.write(DENSE_GRAPHML_HEADER)
+        sample_f.write(DENSE_GRAPHML_HEADER)
+        qprint("graphml header dumped.")
+
+        qprint("Starting to dump node information...")
+        nodes_dumped = 0
+        for start in range(0, len(node_index), NODE_CHUNK_SIZE):
+            end = min(start + NODE_CHUNK_SIZE, len(node_index))
+            uids = np.asarray(node_index.uid_by_index[start:end]).tolist()
+            genders = np.asarray(
+                node_index.gender_by_index[start:end]).tolist()
+            lines = "".join(
+                f'    <node id="{start + i}">\n'
+                f'      <data key="uid">{uid}</data>\n'
+                f'      <data key="gender">{gender}</data>\n'
+                f'    </node>\n'
+                for i, (uid, gender) in enumerate(zip(uids, genders))
+            )
             out_f.write(lines)
-            lines_dumped += len(lines_to_dump)
+            if start == 0:
+                sample_f.write(lines)
+            nodes_dumped += end - start
+            qprint(f"{nodes_dumped:,} nodes dumped.", end="\r")
+        qprint("Node information dumped.")
+
+        qprint("Starting to dump edge information...")
+        edges_dumped = dump_graphml_edges(
+            iter_edge_chunks(
+                dense_social_graph_fpath, binary_edges_dpath, INDEX_COLUMNS),
+            out_f, sample_f)
         qprint("Edge information dumped.")
-        edges_dumped = lines_dumped
 
         out_f.write(GRAPHML_FOOTER)
         sample_f.write(GRAPHML_FOOTER)
@@ -190,7 +296,8 @@ def convert_twikwak17_to_graphml_format(
     return nodes_dumped, edges_dumped
 
 
-def phase7(phase5_output_dpath, phase6_output_dpath, phase7_output_dpath):
+def phase7(phase5_output_dpath, phase6_output_dpath, phase7_output_dpath,
+           dense=False):
     """Converts the twikwak17 dataset into the graphml format.
 
     Parameters
@@ -201,10 +308,21 @@ def phase7(phase5_output_dpath, phase6_output_dpath, phase7_output_dpath):
         The path to the output directory of phase 6.
     phase7_output_dpath : str
         The path to the output directory of this phase, phase 7.
+    dense : bool, default False
+        If True, nodes are identified by the dense node indices assigned by
+        phase 5, and edges are read from the dense-index edge list written by
+        phase 6; node uids are kept as node data.
+
+    If phase 6 wrote a binary edge list of the social graph, edges are read
+    from it rather than parsed out of the gzipped text edge list.
     """
     start = time.time()
     uid2gender_fpath = uid_to_gender_map_fpath_by_dpath(phase5_output_dpath)
-    social_graph_fpath = social_graph_fpath_by_dpath(phase6_output_dpath)
+    node_index_dpath = node_index_dpath_by_dpath(phase5_output_dpath)
+    social_graph_fpath = social_graph_fpath_by_dpath(
+        phase6_output_dpath, dense=dense)
+    binary_edges_dpath = social_graph_edges_dpath_by_dpath(
+        phase6_output_dpath)
     graphml_fpath = graphml_fpath_by_dpath(phase7_output_dpath)
     graphml_sample_fpath = graphml_fpath_by_dpath(phase7_output_dpath, True)
     output_report_fpath = phase_output_report_fpath(7, phase7_output_dpath)
@@ -217,12 +335,23 @@ def phase7(phase5_output_dpath, phase6_output_dpath, phase7_output_dpath):
             f"\n{social_graph_fpath} \ninput files to {graphml_fpath} "
             "output file."))
 
-        nodes_dumped, edges_dumped = convert_twikwak17_to_graphml_format(
-            uid2gender_fpath=uid2gender_fpath,
-            social_graph_fpath=social_graph_fpath,
-            graphml_fpath=graphml_fpath,
-            graphml_sample_fpath=graphml_sample_fpath,
-        )
+        if dense:
+            nodes_dumped, edges_dumped = (
+                convert_dense_twikwak17_to_graphml_format(
+                    node_index_dpath=node_index_dpath,
+                    dense_social_graph_fpath=social_graph_fpath,
+                    graphml_fpath=graphml_fpath,
+                    graphml_sample_fpath=graphml_sample_fpath,
+                    binary_edges_dpath=binary_edges_dpath,
+                ))
+        else:
+            nodes_dumped, edges_dumped = convert_twikwak17_to_graphml_format(
+                uid2gender_fpath=uid2gender_fpath,
+                social_graph_fpath=social_graph_fpath,
+                graphml_fpath=graphml_fpath,
+                graphml_sample_fpath=graphml_sample_fpath,
+                binary_edges_dpath=binary_edges_dpath,
+            )
 
         qprint((
             f"{nodes_dumped:,} nodes and {edges_dumped:,} edges dumped into "
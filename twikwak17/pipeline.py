@@ -53,7 +53,11 @@ def safe_copy(source_fpath, target_fpath, description):
 
 
 def run_pipeline(
-        tpath=None, kpath=None, output_dpath=None, session_fpath=None):
+        tpath=None, kpath=None, output_dpath=None, session_fpath=None,
+        n_workers=None, batch_size=None, use_cache=False,
+        early_exit_margin=None, save_features=False, rescore=False,
+        models=None, with_scores=False, checkpoint_every=None,
+        profile=False, dense=False, build_edge_cache=False, binary=False):
     """Runs the entire data generation pipeline.
 
     Parameters
@@ -70,16 +74,62 @@ def run_pipeline(
     session_fpath : str, optional
         The path to the save file of a previous session to continue. If not
         given, a new session is created.
+    n_workers : int, optional
+        The number of worker processes used by phases that support them:
+        phase 3's username range intersection, phase 4's classification and
+        phase 6's edge filtering. If not given, all phases run in a single
+        process.
+    batch_size : int, optional
+        If given, phase 4 classifies users in vectorized batches of up to
+        this many users.
+    use_cache : bool, default False
+        If True, phase 4 reads the gender predictions of users whose tweets
+        did not change since the last run from its prediction cache.
+    early_exit_margin : float, optional
+        If given, phase 4 classifies users on growing prefixes of their
+        tweets, exiting early at this margin from the decision boundary.
+    save_features : bool, default False
+        If True, phase 4 saves the SPEKS feature vectors of all users.
+    rescore : bool, default False
+        If True, phase 4 classifies users by the features saved by an earlier
+        run from the same inputs, if any.
+    models : list of twikwak17.gender.SpeksLexiconModel, optional
+        If given, phase 4 classifies users by all of these models in one pass.
+    with_scores : bool, default False
+        If True, phase 4 also writes model scores as columns.
+    checkpoint_every : int, optional
+        If given, phase 4 checkpoints its progress every this many users, and
+        an interrupted phase 4 is resumed from its last checkpoint on rerun.
+    profile : bool, default False
+        If True, phase 4 profiles classification into its report.
+    dense : bool, default False
+        If True, phase 6 also writes the edge list with users given by their
+        dense node indices, and phase 7 identifies graphml nodes by them.
+    build_edge_cache : bool, default False
+        If True, phase 6 writes a binary cache of the parsed social graph,
+        unless a valid one exists.
+    binary : bool, default False
+        If True, phase 6 also writes a binary, columnar edge list, which
+        phase 7 then reads.
     """
     phases = ['1', '2', '3', '4', '5']
     run_phases(
         phases=phases, tpath=tpath, kpath=kpath, output_dpath=output_dpath,
-        session_fpath=session_fpath)
+        session_fpath=session_fpath, n_workers=n_workers,
+        batch_size=batch_size, use_cache=use_cache,
+        early_exit_margin=early_exit_margin,
+        save_features=save_features, rescore=rescore, models=models,
+        with_scores=with_scores, checkpoint_every=checkpoint_every,
+        profile=profile, dense=dense, build_edge_cache=build_edge_cache,
+        binary=binary)
 
 
 def run_phases(
         phases, tpath=None, kpath=None, output_dpath=None,
-        session_fpath=None):
+        session_fpath=None, n_workers=None, batch_size=None,
+        use_cache=False, early_exit_margin=None, save_features=False,
+        rescore=False, models=None, with_scores=False, checkpoint_every=None,
+        profile=False, dense=False, build_edge_cache=False, binary=False):
     """Runs the entire data generation pipeline.
 
     Parameters
@@ -98,11 +148,58 @@ def run_phases(
     session_fpath : str, optional
         The path to the save file of a previous session to continue. If not
         given, a new session is created.
+    n_workers : int, optional
+        The number of worker processes used by phases that support them:
+        phase 3's username range intersection, phase 4's classification and
+        phase 6's edge filtering. If not given, all phases run in a single
+        process.
+    batch_size : int, optional
+        If given, phase 4 classifies users in vectorized batches of up to
+        this many users.
+    use_cache : bool, default False
+        If True, phase 4 reads the gender predictions of users whose tweets
+        did not change since the last run from its prediction cache.
+    early_exit_margin : float, optional
+        If given, phase 4 classifies users on growing prefixes of their
+        tweets, exiting early at this margin from the decision boundary.
+    save_features : bool, default False
+        If True, phase 4 saves the SPEKS feature vectors of all users.
+    rescore : bool, default False
+        If True, phase 4 classifies users by the features saved by an earlier
+        run from the same inputs, if any.
+    models : list of twikwak17.gender.SpeksLexiconModel, optional
+        If given, phase 4 classifies users by all of these models in one pass.
+    with_scores : bool, default False
+        If True, phase 4 also writes model scores as columns.
+    checkpoint_every : int, optional
+        If given, phase 4 checkpoints its progress every this many users, and
+        an interrupted phase 4 is resumed from its last checkpoint on rerun.
+    profile : bool, default False
+        If True, phase 4 profiles classification into its report.
+    dense : bool, default False
+        If True, phase 6 also writes the edge list with users given by their
+        dense node indices, and phase 7 identifies graphml nodes by them.
+    build_edge_cache : bool, default False
+        If True, phase 6 writes a binary cache of the parsed social graph,
+        unless a valid one exists.
+    binary : bool, default False
+        If True, phase 6 also writes a binary, columnar edge list, which
+        phase 7 then reads.
     """
     if session_fpath is None:
         print("\n\nStarting a new twikwak17 session.")
         start = time.time()
-        kwargs = {'tpath': tpath, 'kpath': kpath, 'output_dpath': output_dpath}
+        kwargs = {
+            'tpath': tpath, 'kpath': kpath, 'output_dpath': output_dpath,
+            'n_workers': n_workers, 'batch_size': batch_size,
+            'use_cache': use_cache,
+            'early_exit_margin': early_exit_margin,
+            'save_features': save_features, 'rescore': rescore,
+            'models': models, 'with_scores': with_scores,
+            'checkpoint_every': checkpoint_every, 'profile': profile,
+            'dense': dense, 'build_edge_cache': build_edge_cache,
+            'binary': binary,
+        }
         session = Session(
             start_time=start,
             kwargs=kwargs,
@@ -120,6 +217,19 @@ def run_phases(
         tpath = session.kwargs['tpath']
         kpath = session.kwargs['kpath']
         output_dpath = session.kwargs['output_dpath']
+        n_workers = session.kwargs.get('n_workers')
+        batch_size = session.kwargs.get('batch_size')
+        use_cache = session.kwargs.get('use_cache', False)
+        early_exit_margin = session.kwargs.get('early_exit_margin')
+        save_features = session.kwargs.get('save_features', False)
+        rescore = session.kwargs.get('rescore', False)
+        models = session.kwargs.get('models')
+        with_scores = session.kwargs.get('with_scores', False)
+        checkpoint_every = session.kwargs.get('checkpoint_every')
+        profile = session.kwargs.get('profile', False)
+        dense = session.kwargs.get('dense', False)
+        build_edge_cache = session.kwargs.get('build_edge_cache', False)
+        binary = session.kwargs.get('binary', False)
 
     tpath = error_raising_cfg_val_get(tpath, CfgKey.TWITTER7_DPATH)
     kpath = error_raising_cfg_val_get(kpath, CfgKey.KWAK10_DPATH)
@@ -160,6 +270,7 @@ def run_phases(
             phase1_output_dpath=phase1_out_dpath,
             phase2_output_dpath=phase2_out_dpath,
             phase3_output_dpath=phase3_out_dpath,
+            n_workers=n_workers,
         )
 
     phase4_out_dpath = phase_output_dpath(4, output_dpath)
@@ -168,6 +279,16 @@ def run_phases(
             phase1_output_dpath=phase1_out_dpath,
             phase3_output_dpath=phase3_out_dpath,
             phase4_output_dpath=phase4_out_dpath,
+            n_workers=n_workers,
+            batch_size=batch_size,
+            use_cache=use_cache,
+            early_exit_margin=early_exit_margin,
+            save_features=save_features,
+            rescore=rescore,
+            models=models,
+            with_scores=with_scores,
+            checkpoint_every=checkpoint_every,
+            profile=profile,
         )
 
     phase5_out_dpath = phase_output_dpath(5, output_dpath)
@@ -183,6 +304,10 @@ def run_phases(
         phase6(
             phase5_output_dpath=phase5_out_dpath,
             phase6_output_dpath=phase6_out_dpath,
+            dense=dense,
+            n_workers=n_workers,
+            build_edge_cache=build_edge_cache,
+            binary=binary,
         )
 
     phase7_out_dpath = phase_output_dpath(7, output_dpath)
@@ -191,6 +316,7 @@ def run_phases(
             phase5_output_dpath=phase5_out_dpath,
             phase6_output_dpath=phase6_out_dpath,
             phase7_output_dpath=phase7_out_dpath,
+            dense=dense,
         )
 
     qprint("Copying output files to final output folder...")
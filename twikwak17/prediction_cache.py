@@ -0,0 +1,131 @@
+"""A persistent, content-addressed cache of per-user gender predictions.
+
+The cache is a gzipped text file with a "username digest gender" line per
+user, in the order users are classified by phase 4 - that is, sorted by
+username - so it can be read sequentially alongside the tweet list. The digest
+hashes the model version together with the tweets of the user, so a cached
+prediction is only used if neither has changed since it was cached.
+"""
+
+import os
+import gzip
+import json
+from hashlib import blake2b
+
+import speks
+from speks.gender_lex import GENDER_LEXICON
+
+
+DIGEST_SIZE = 16
+CACHE_SEP = ' '
+
+
+def speks_model_version():
+    """Returns a string identifying the SPEKS version and lexicon in use."""
+    lexicon_digest = blake2b(
+        json.dumps(sorted(GENDER_LEXICON.items())).encode('utf-8'),
+        digest_size=8,
+    ).hexdigest()
+    return f"speks-{speks.__version__}-{lexicon_digest}"
+
+
+def tweets_digest(tweets, model_version):
+    """Hashes the given tweets together with the given model version.
+
+    Returns
+    -------
+    str
+        A hex digest of DIGEST_SIZE bytes.
+    """
+    hasher = blake2b(model_version.encode('utf-8'), digest_size=DIGEST_SIZE)
+    hasher.update(b'\0')
+    hasher.update(tweets.encode('utf-8', errors='surrogatepass'))
+    return hasher.hexdigest()
+
+
+class PredictionCacheReader(object):
+    """Reads a prediction cache sequentially, alongside a sorted user stream.
+
+    Usernames must be looked up in non-decreasing order, the order in which
+    the cache was written.
+
+    Parameters
+    ----------
+    fpath : str
+        The full qualified path to a prediction cache file. If no such file
+        exists, the cache is empty.
+    """
+
+    def __init__(self, fpath):
+        self._f = None
+        self._user = None
+        self._digest = None
+        self._gender = None
+        self.hits = 0
+        self.misses = 0
+        if os.path.isfile(fpath):
+            self._f = gzip.open(fpath, 'rt')
+            self._advance()
+
+    def _advance(self):
+        line = self._f.readline()
+        if not line:
+            self._user = None
+            return
+        self._user, self._digest, self._gender = line.rstrip('\n').rsplit(
+            CACHE_SEP, 2)
+
+    def get(self, user, digest):
+        """Returns the cached gender of the given user, or None on a miss."""
+        while self._user is not None and self._user < user:
+            self._advance()
+        if self._user == user and self._digest == digest:
+            self.hits += 1
+            return int(self._gender)
+        self.misses += 1
+        return None
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PredictionCacheWriter(object):
+    """Writes a new prediction cache, replacing the old one when closed.
+
+    Parameters
+    ----------
+    fpath : str
+        The full qualified path to the prediction cache file.
+    """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+        self._tmp_fpath = fpath + '.tmp'
+        self._f = gzip.open(self._tmp_fpath, 'wt+')
+
+    def write(self, users, digests, genders):
+        self._f.write("".join(
+            f"{user}{CACHE_SEP}{digest}{CACHE_SEP}{gender}\n"
+            for user, digest, gender in zip(users, digests, genders)
+        ))
+
+    def close(self):
+        self._f.close()
+        os.replace(self._tmp_fpath, self.fpath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+            os.remove(self._tmp_fpath)
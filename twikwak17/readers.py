@@ -0,0 +1,219 @@
+"""Buffered, prefetching readers for the large input files of twikwak17."""
+
+import os
+import re
+import gzip
+import queue
+import tarfile
+import threading
+from contextlib import contextmanager
+
+
+BYTES_IN_MB = 1000000
+DEF_BLOCK_SIZE = 16 * BYTES_IN_MB
+DEF_PREFETCH_BLOCKS = 4
+GZIP_MAGIC = b'\x1f\x8b'
+# the first token of each line, leading whitespace included; blank lines and
+# lines holding only a carriage return yield nothing
+UNAME_KEY_REGEX = re.compile(rb'^[^\S\n]*\S+', re.MULTILINE)
+
+
+class PrefetchingReader(object):
+    """Reads a binary stream in large blocks on a background thread.
+
+    Decompression (gzip, zip, tar.gz) releases the GIL, so reading ahead on a
+    separate thread overlaps inflating the input with processing it.
+
+    Parameters
+    ----------
+    raw_f : file
+        A binary file-like object opened for reading.
+    block_size : int, optional
+        The size, in bytes, of each block read from the stream. Defaults to
+        16MB.
+    prefetch : int, optional
+        The maximum number of blocks read ahead of the consumer. Defaults to 4.
+    """
+
+    def __init__(self, raw_f, block_size=None, prefetch=None):
+        if block_size is None:
+            block_size = DEF_BLOCK_SIZE
+        if prefetch is None:
+            prefetch = DEF_PREFETCH_BLOCKS
+        self.raw_f = raw_f
+        self.block_size = block_size
+        self.bytes_read = 0
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._error = None
+        self._done = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while not self._stop.is_set():
+                block = self.raw_f.read(self.block_size)
+                self._put(block)
+                if not block:
+                    return
+        except Exception as e:  # handed over to the consuming thread
+            self._error = e
+            self._put(b'')
+
+    def _put(self, block):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read_block(self):
+        """Returns the next block of the stream; an empty bytes object at EOF.
+        """
+        if self._done:
+            return b''
+        block = self._queue.get()
+        if self._error is not None:
+            raise self._error
+        if not block:
+            self._done = True
+        self.bytes_read += len(block)
+        return block
+
+    def __iter__(self):
+        while True:
+            block = self.read_block()
+            if not block:
+                return
+            yield block
+
+    def iter_line_blocks(self):
+        """Yields blocks of the stream, each cut right after a line break.
+
+        The last block yielded might not end with a line break, if the stream
+        does not.
+        """
+        tail = b''
+        for block in self:
+            cut = block.rfind(b'\n')
+            if cut < 0:
+                tail += block
+                continue
+            yield tail + block[:cut+1]
+            tail = block[cut+1:]
+        if tail:
+            yield tail
+
+    def iter_lines(self):
+        """Yields the lines of the stream, line breaks included."""
+        for block in self.iter_line_blocks():
+            for line in block.splitlines(keepends=True):
+                yield line
+
+    def close(self):
+        """Stops the prefetching thread. Does not close the underlying file."""
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _is_gzipped(fpath):
+    with open(fpath, 'rb') as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+@contextmanager
+def open_member_or_file(dpath, member_name, archive_fname=None):
+    """Opens a dataset file for binary reading, directly from its archive.
+
+    If a plain file named member_name is found in the given folder it is
+    opened. Otherwise, the member named member_name is streamed out of the
+    archive file in that folder (by default member_name + '.tar.gz'), with no
+    copy of it extracted to disk. Gzipped non-tar files are also supported.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to the dataset folder.
+    member_name : str
+        The name of the file, or of the archive member, to open.
+    archive_fname : str, optional
+        The name of the archive containing the member. Defaults to
+        member_name + '.tar.gz'.
+
+    Yields
+    ------
+    file
+        A binary file-like object positioned at the start of the member.
+    """
+    if archive_fname is None:
+        archive_fname = member_name + '.tar.gz'
+    plain_fpath = os.path.join(dpath, member_name)
+    if os.path.isfile(plain_fpath):
+        fpath = plain_fpath
+    else:
+        fpath = os.path.join(dpath, archive_fname)
+    if not _is_gzipped(fpath):
+        with open(fpath, 'rb') as f:
+            yield f
+        return
+    if not tarfile.is_tarfile(fpath):
+        with gzip.open(fpath, 'rb') as f:
+            yield f
+        return
+    # stream mode; the archive is never seeked, nor is the member extracted
+    with tarfile.open(fpath, mode='r|gz') as tar_f:
+        for member in tar_f:
+            if member.isfile() and os.path.basename(
+                    member.name) == member_name:
+                yield tar_f.extractfile(member)
+                return
+    raise FileNotFoundError(
+        f"No member named {member_name} found in {fpath}.")
+
+
+def uname_keys_from_block(block):
+    """Extracts the username keys of all lines in a block of a username file.
+
+    Equivalent to applying the username regex of phase 3 and 4, '\\s*\\S+',
+    to each non-blank line of the block.
+
+    Parameters
+    ----------
+    block : bytes
+        A block of whole lines of a username (or username-prefixed) file.
+
+    Returns
+    -------
+    list of bytes
+        The username keys found in the block, in order.
+    """
+    return UNAME_KEY_REGEX.findall(block)
+
+
+def iter_uname_keys(fpath, block_size=None):
+    """Yields the username keys of a gzipped username file, block by block.
+
+    Parameters
+    ----------
+    fpath : str
+        The full qualified path to a gzipped username file.
+    block_size : int, optional
+        The size, in bytes, of decompressed blocks to read. Defaults to 16MB.
+
+    Yields
+    ------
+    list of bytes
+        The username keys found in each block, in order.
+    """
+    with gzip.open(fpath, 'rb') as raw_f:
+        with PrefetchingReader(raw_f, block_size=block_size) as reader:
+            for block in reader.iter_line_blocks():
+                yield uname_keys_from_block(block)
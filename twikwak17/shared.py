@@ -138,6 +138,14 @@ def kwak10_twitter_rv_fpath():
     return os.path.join(kwak10_dpath(), TWITTER_RV_FNAME)
 
 
+TWITTER_RV_MEMBER_FNAME = 'twitter_rv.net'
+TWITTER_RV_EDGE_CACHE_FNAME = 'twitter_rv_edges.bin'
+
+
+def kwak10_twitter_rv_edge_cache_fpath():
+    return os.path.join(kwak10_dpath(), TWITTER_RV_EDGE_CACHE_FNAME)
+
+
 DEF_SAMPLE_DNAME_TEMPLATE = 'sample_files'
 
 
@@ -194,6 +202,13 @@ def twitter7_tweet_list_fpath_by_dpath(dpath, sorted=False):
     return os.path.join(dpath, P1_TWEET_LIST_FNAME)
 
 
+P1_TOKEN_CORPUS_DNAME = 'twitter7_token_corpus'
+
+
+def token_corpus_dpath_by_dpath(dpath):
+    return os.path.join(dpath, P1_TOKEN_CORPUS_DNAME)
+
+
 # --- phase 2 ----
 
 P2_UNAME_2_ID_FNAME = 'kwak10_uname_to_id.txt.gz'
@@ -214,6 +229,13 @@ def kwak10_unames_fpath_by_dpath(dpath, sorted=False):
     return os.path.join(dpath, P2_KWAK10_UNAMES_FNAME)
 
 
+P2_UNAME_INDEX_DNAME = 'kwak10_uname_index'
+
+
+def uname_index_dpath_by_dpath(dpath):
+    return os.path.join(dpath, P2_UNAME_INDEX_DNAME)
+
+
 # --- phase 3 ---
 
 UNAME_INTERSECTION_FNAME = 'uname_intersection.txt.gz'
@@ -232,31 +254,89 @@ def uname_to_gender_map_fpath_by_dpath(dpath):
     return os.path.join(dpath, GENDER_MAPPING_FNAME)
 
 
+GENDER_PREDICTION_CACHE_FNAME = 'gender_prediction_cache.txt.gz'
+
+
+def gender_prediction_cache_fpath_by_dpath(dpath):
+    return os.path.join(dpath, GENDER_PREDICTION_CACHE_FNAME)
+
+
+FEATURE_CACHE_DNAME = 'speks_feature_cache'
+
+
+def feature_cache_dpath_by_dpath(dpath):
+    return os.path.join(dpath, FEATURE_CACHE_DNAME)
+
+
+GENDER_COLUMNS_DNAME = 'gender_columns'
+
+
+def gender_columns_dpath_by_dpath(dpath):
+    return os.path.join(dpath, GENDER_COLUMNS_DNAME)
+
+
 # --- phase 5 ---
 
 UID_TO_GENDER_MAP_FNAME = 'uid_to_gender.txt.gz'
+UID_TO_GENDER_MAP_SORTED_FNAME = 'uid_to_gender_sorted.txt.gz'
 
 
-def uid_to_gender_map_fpath_by_dpath(dpath):
+def uid_to_gender_map_fpath_by_dpath(dpath, sorted=False):
+    if sorted:
+        return os.path.join(dpath, UID_TO_GENDER_MAP_SORTED_FNAME)
     return os.path.join(dpath, UID_TO_GENDER_MAP_FNAME)
 
 
 UID_LIST_FNAME = 'uid_list.txt.gz'
+UID_LIST_SORTED_FNAME = 'uid_list_sorted.txt.gz'
 
 
-def uid_list_fpath_by_dpath(dpath):
+def uid_list_fpath_by_dpath(dpath, sorted=False):
+    if sorted:
+        return os.path.join(dpath, UID_LIST_SORTED_FNAME)
     return os.path.join(dpath, UID_LIST_FNAME)
 
 
+UID_SORT_RUNS_DNAME = 'uid_sort_runs'
+
+
+def uid_sort_runs_dpath_by_dpath(dpath):
+    return os.path.join(dpath, UID_SORT_RUNS_DNAME)
+
+
+NODE_INDEX_DNAME = 'node_index'
+
+
+def node_index_dpath_by_dpath(dpath):
+    return os.path.join(dpath, NODE_INDEX_DNAME)
+
+
+UID_BITMAP_DNAME = 'uid_bitmap'
+
+
+def uid_bitmap_dpath_by_dpath(dpath):
+    return os.path.join(dpath, UID_BITMAP_DNAME)
+
+
 # --- phase 6 ---
 
 SOCIAL_GRAPH_FNAME = 'social_graph.txt.gz'
+DENSE_SOCIAL_GRAPH_FNAME = 'social_graph_dense.txt.gz'
 
 
-def social_graph_fpath_by_dpath(dpath):
+def social_graph_fpath_by_dpath(dpath, dense=False):
+    if dense:
+        return os.path.join(dpath, DENSE_SOCIAL_GRAPH_FNAME)
     return os.path.join(dpath, SOCIAL_GRAPH_FNAME)
 
 
+SOCIAL_GRAPH_EDGES_DNAME = 'social_graph_edges'
+
+
+def social_graph_edges_dpath_by_dpath(dpath):
+    return os.path.join(dpath, SOCIAL_GRAPH_EDGES_DNAME)
+
+
 # --- phase 7 ---
 
 GRAPHML_FNAME = 'twikwak17.graphml.gz'
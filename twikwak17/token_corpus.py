@@ -0,0 +1,265 @@
+"""A memory-mappable, vocabulary-encoded token corpus of user tweets.
+
+The corpus is a folder holding:
+
+* tokens.bin - the int32 token ids of the tweets of all users, back to back.
+* token_offsets.npy - an int64 array; the tokens of user i are
+  tokens[offsets[i]:offsets[i+1]].
+* vocab_blob.npy and vocab_offsets.npy - the UTF-8 encoded vocabulary, as
+  packed strings; token id i is the i-th vocabulary entry.
+* users_blob.npy and users_offsets.npy - the usernames, as packed strings, in
+  corpus order.
+* meta.json - the user, token and vocabulary counts, and the tokenizer used.
+"""
+
+import os
+import json
+import shutil
+from array import array
+
+import numpy as np
+
+from twikwak17.packed import (
+    PackedStrings,
+    PackedStringsBuilder,
+)
+
+
+TOKENS_FNAME = 'tokens.bin'
+TOKEN_OFFSETS_FNAME = 'token_offsets.npy'
+VOCAB_FNAMES = ('vocab_blob.npy', 'vocab_offsets.npy')
+USERS_FNAMES = ('users_blob.npy', 'users_offsets.npy')
+META_FNAME = 'meta.json'
+TOKEN_DTYPE = np.int32
+FLUSH_TOKENS = 4 * 1000000
+TOKENIZER_NAME = 'speks.tokenization.tokenize_no_case_preserving'
+
+
+def _encode(string):
+    return string.encode('utf-8', errors='surrogatepass')
+
+
+def _save_packed(packed, dpath, fnames):
+    np.save(os.path.join(dpath, fnames[0]), packed.arena)
+    np.save(os.path.join(dpath, fnames[1]), packed.offsets)
+
+
+def _load_packed(dpath, fnames):
+    return PackedStrings(
+        arena=np.load(os.path.join(dpath, fnames[0]), mmap_mode='r'),
+        offsets=np.load(os.path.join(dpath, fnames[1]), mmap_mode='r'),
+    )
+
+
+class TokenCorpusWriter(object):
+    """Writes a token corpus, one user at a time.
+
+    Token ids are assigned in order of first appearance. The metadata file is
+    only written by close(), so an interrupted corpus is never taken for a
+    complete one; used as a context manager, the folder is removed if an
+    exception is raised.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to the designated corpus folder. Created if needed.
+    """
+
+    def __init__(self, dpath):
+        os.makedirs(dpath, exist_ok=True)
+        meta_fpath = os.path.join(dpath, META_FNAME)
+        if os.path.exists(meta_fpath):
+            os.remove(meta_fpath)
+        self.dpath = dpath
+        self.vocab = {}
+        self._vocab_strings = PackedStringsBuilder()
+        self._users = PackedStringsBuilder()
+        self._offsets = array('q', [0])
+        self._tokens = array('i')
+        self._tokens_f = open(os.path.join(dpath, TOKENS_FNAME), 'wb+')
+
+    def add(self, user, tokens):
+        """Adds a user and the tokens of its tweets to the corpus.
+
+        Parameters
+        ----------
+        user : str
+            The username.
+        tokens : list of str
+            The tokens of the tweets of the user.
+        """
+        vocab = self.vocab
+        for token in tokens:
+            token_id = vocab.get(token)
+            if token_id is None:
+                token_id = len(vocab)
+                vocab[token] = token_id
+                self._vocab_strings.append(_encode(token))
+            self._tokens.append(token_id)
+        self._users.append(_encode(user))
+        self._offsets.append(self._offsets[-1] + len(tokens))
+        if len(self._tokens) >= FLUSH_TOKENS:
+            self._flush()
+
+    def _flush(self):
+        self._tokens.tofile(self._tokens_f)
+        self._tokens = array('i')
+
+    def close(self):
+        """Writes all remaining tokens, the offsets and the vocabulary."""
+        self._flush()
+        self._tokens_f.close()
+        np.save(
+            os.path.join(self.dpath, TOKEN_OFFSETS_FNAME),
+            np.frombuffer(self._offsets, dtype=np.int64),
+        )
+        _save_packed(self._vocab_strings.build(), self.dpath, VOCAB_FNAMES)
+        _save_packed(self._users.build(), self.dpath, USERS_FNAMES)
+        meta = {
+            'user_count': len(self._offsets) - 1,
+            'token_count': self._offsets[-1],
+            'vocab_size': len(self.vocab),
+            'tokenizer': TOKENIZER_NAME,
+        }
+        with open(os.path.join(self.dpath, META_FNAME), 'wt+') as f:
+            json.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """Drops the partially written corpus."""
+        self._tokens_f.close()
+        shutil.rmtree(self.dpath, ignore_errors=True)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def token_corpus_exists(dpath):
+    return os.path.isfile(os.path.join(dpath, META_FNAME))
+
+
+class TokenCorpus(object):
+    """A read-only, memory-mapped token corpus.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to a corpus folder written by TokenCorpusWriter.
+    """
+
+    def __init__(self, dpath):
+        self.dpath = dpath
+        with open(os.path.join(dpath, META_FNAME), 'rt') as f:
+            self.meta = json.load(f)
+        self.tokens = np.memmap(
+            os.path.join(dpath, TOKENS_FNAME), dtype=TOKEN_DTYPE, mode='r',
+            shape=(self.meta['token_count'],),
+        ) if self.meta['token_count'] > 0 else np.empty(0, TOKEN_DTYPE)
+        self.offsets = np.load(
+            os.path.join(dpath, TOKEN_OFFSETS_FNAME), mmap_mode='r')
+        self.users = _load_packed(dpath, USERS_FNAMES)
+        self.vocab = _load_packed(dpath, VOCAB_FNAMES)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def user(self, i):
+        """Returns the username of the i-th user of the corpus."""
+        return self.users[i].decode('utf-8', errors='surrogatepass')
+
+    def token_ids(self, i):
+        """Returns the int32 token ids of the i-th user of the corpus."""
+        return self.tokens[self.offsets[i]:self.offsets[i+1]]
+
+    def vocabulary(self):
+        """Returns the vocabulary of the corpus, as a list of str."""
+        return [
+            token.decode('utf-8', errors='surrogatepass')
+            for token in self.vocab.tolist()
+        ]
+
+    def decode(self, token_ids):
+        """Returns the tokens of the given token ids, as a list of str."""
+        return [
+            token.decode('utf-8', errors='surrogatepass')
+            for token in self.vocab.take(np.asarray(token_ids)).tolist()
+        ]
+
+    def vocab_columns(self, model):
+        """Maps the token ids of the corpus to the vocabulary of a model.
+
+        Parameters
+        ----------
+        model : twikwak17.gender.SpeksLexiconModel
+            The model whose feature columns to map token ids to.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int64 array with the feature column of each token id, or -1
+            for tokens not in the vocabulary of the model.
+        """
+        return np.array(
+            [model.vocab.get(token, -1) for token in self.vocabulary()],
+            dtype=np.int64,
+        )
+
+    def features(self, model, start=0, stop=None, columns=None):
+        """Builds the sparse token count matrix of a range of corpus users.
+
+        The matrix is the one model.features() returns for the tweets of the
+        users, built from their token ids with numpy array operations, so no
+        text is read or tokenized.
+
+        Parameters
+        ----------
+        model : twikwak17.gender.SpeksLexiconModel
+            The model to build features for.
+        start : int, default 0
+            The index of the first user of the range.
+        stop : int, optional
+            The index one past the last user of the range. Defaults to the
+            number of users in the corpus.
+        columns : numpy.ndarray, optional
+            The feature columns of the token ids, as returned by
+            vocab_columns(). Computed if not given; pass them when building
+            the features of many ranges for the same model.
+
+        Returns
+        -------
+        indptr, indices, counts, lengths : numpy.ndarray
+            The CSR row pointers, column (vocabulary) indices and token counts
+            of the matrix, and the total number of tokens of each user.
+        """
+        if stop is None:
+            stop = len(self)
+        if columns is None:
+            columns = self.vocab_columns(model)
+        n_rows = stop - start
+        n_cols = max(len(model.vocab), 1)
+        offsets = np.asarray(self.offsets[start:stop+1])
+        lengths = np.diff(offsets)
+        token_ids = np.asarray(self.tokens[offsets[0]:offsets[-1]])
+        rows = np.repeat(np.arange(n_rows, dtype=np.int64), lengths)
+        cols = columns[token_ids]
+        in_vocab = cols >= 0
+        keys = rows[in_vocab] * n_cols + cols[in_vocab]
+        keys, first_ix, counts = np.unique(
+            keys, return_index=True, return_counts=True)
+        # model.features() lists the tokens of a text by first appearance
+        order = np.argsort(first_ix, kind='stable')
+        keys = keys[order]
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(keys // n_cols, minlength=n_rows), out=indptr[1:])
+        return (
+            indptr,
+            keys % n_cols,
+            counts[order].astype(np.float64),
+            lengths.astype(np.float64),
+        )
@@ -0,0 +1,219 @@
+"""A compact uid membership structure, with optional gender lookup.
+
+kwak10 uids are bounded, so a set of them is kept as a bitmap of one bit per
+possible uid, with an optional table of two bits per possible uid coding the
+gender of each user - 0 for users not in the set, or gender + 1. For uid sets
+too sparse for a bitmap to pay off, a sorted uid array, and an aligned gender
+array, are kept instead.
+
+Either way, lookups are vectorized, and the structure is saved to a folder of
+.npy files which are memory-mapped on loading, so several processes can share
+it.
+"""
+
+import os
+import json
+
+import numpy as np
+
+from twikwak17.edges import (
+    is_in_sorted,
+    lookup_sorted,
+    read_uid2gender_file,
+)
+
+
+BITMAP = 'bitmap'
+SORTED = 'sorted'
+BITS_FNAME = 'bits.npy'
+GENDER_CODES_FNAME = 'gender_codes.npy'
+UIDS_FNAME = 'uids.npy'
+GENDERS_FNAME = 'genders.npy'
+META_FNAME = 'meta.json'
+NOT_FOUND = -1
+# a bitmap is used if it is at most as large as the sorted uid array
+SORTED_BYTES_PER_UID = 8
+
+
+def _pack_bits(uids, values, bits_per_uid):
+    """Packs a value of the given number of bits per uid into a uint8 array,
+    given sorted, distinct uids."""
+    per_byte = 8 // bits_per_uid
+    n_bytes = int(uids[-1]) // per_byte + 1 if len(uids) > 0 else 0
+    packed = np.zeros(n_bytes, dtype=np.uint8)
+    if len(uids) == 0:
+        return packed
+    byte_ix = uids // per_byte
+    shifted = (values.astype(np.uint8) << (
+        (uids % per_byte) * bits_per_uid).astype(np.uint8))
+    group_starts = np.flatnonzero(np.diff(byte_ix, prepend=-1))
+    packed[byte_ix[group_starts]] = np.bitwise_or.reduceat(
+        shifted, group_starts)
+    return packed
+
+
+def _unpack_bits(packed, uids, bits_per_uid):
+    """Returns the value of each given uid in a packed array; 0 for uids out
+    of its range."""
+    per_byte = 8 // bits_per_uid
+    uids = np.asarray(uids, dtype=np.int64)
+    in_range = (uids >= 0) & (uids < len(packed) * per_byte)
+    in_range_uids = np.where(in_range, uids, 0)
+    if len(packed) == 0:
+        return np.zeros(uids.shape, dtype=np.uint8)
+    shift = ((in_range_uids % per_byte) * bits_per_uid).astype(np.uint8)
+    mask = np.uint8((1 << bits_per_uid) - 1)
+    values = (packed[in_range_uids // per_byte] >> shift) & mask
+    return np.where(in_range, values, 0).astype(np.uint8)
+
+
+class UidBitmap(object):
+    """A set of uids, and optionally their genders, with vectorized lookups.
+
+    Use from_uid2gender_file() or load() rather than the constructor.
+
+    Parameters
+    ----------
+    kind : str
+        Either 'bitmap' or 'sorted'.
+    arrays : dict
+        The arrays of this kind of structure, by file name.
+    count : int
+        The number of uids in the set.
+    """
+
+    def __init__(self, kind, arrays, count):
+        self.kind = kind
+        self.arrays = arrays
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def with_genders(self):
+        return (GENDER_CODES_FNAME in self.arrays
+                or GENDERS_FNAME in self.arrays)
+
+    @classmethod
+    def from_uids(cls, uids, genders=None, kind=None):
+        """Builds a uid set from sorted, distinct uids.
+
+        Parameters
+        ----------
+        uids : numpy.ndarray
+            A sorted int64 array of distinct, non-negative uids.
+        genders : numpy.ndarray, optional
+            The gender, 0 or 1, of each uid. If not given, gender lookups are
+            not supported.
+        kind : str, optional
+            Either 'bitmap' or 'sorted'. By default, a bitmap is used if it
+            is no larger than a sorted uid array.
+        """
+        uids = np.asarray(uids, dtype=np.int64)
+        if kind is None:
+            max_uid = int(uids[-1]) if len(uids) > 0 else 0
+            kind = BITMAP
+            if max_uid // 8 > SORTED_BYTES_PER_UID * len(uids):
+                kind = SORTED
+        if kind == BITMAP:
+            arrays = {BITS_FNAME: _pack_bits(
+                uids, np.ones(len(uids), dtype=np.uint8), 1)}
+            if genders is not None:
+                arrays[GENDER_CODES_FNAME] = _pack_bits(
+                    uids, np.asarray(genders) + 1, 2)
+        elif kind == SORTED:
+            arrays = {UIDS_FNAME: uids}
+            if genders is not None:
+                arrays[GENDERS_FNAME] = np.asarray(genders, dtype=np.int8)
+        else:
+            raise ValueError(f"Unknown uid set kind {kind}.")
+        return cls(kind, arrays, len(uids))
+
+    @classmethod
+    def from_uid2gender_file(cls, uid2gender_fpath, with_genders=True,
+                             kind=None):
+        """Builds a uid set from a gzipped uid-to-gender file.
+
+        Of several lines with the same uid only the last is kept.
+
+        Parameters
+        ----------
+        uid2gender_fpath : str
+            The full qualified path to a gzipped uid-to-gender file.
+        with_genders : bool, default True
+            Whether to keep the gender of each uid.
+        kind : str, optional
+            Either 'bitmap' or 'sorted'. Chosen by uid density by default.
+        """
+        uids, genders = read_uid2gender_file(uid2gender_fpath)
+        if not with_genders:
+            genders = None
+        return cls.from_uids(uids, genders, kind)
+
+    def save(self, dpath):
+        """Saves this uid set to the given folder, created if needed."""
+        os.makedirs(dpath, exist_ok=True)
+        for fname, array in self.arrays.items():
+            np.save(os.path.join(dpath, fname), array)
+        with open(os.path.join(dpath, META_FNAME), 'wt+') as f:
+            json.dump({
+                'kind': self.kind,
+                'count': self.count,
+                'arrays': sorted(self.arrays),
+            }, f)
+
+    @classmethod
+    def load(cls, dpath):
+        """Loads a uid set saved to the given folder, memory-mapping its
+        arrays."""
+        with open(os.path.join(dpath, META_FNAME), 'rt') as f:
+            meta = json.load(f)
+        arrays = {
+            fname: np.load(os.path.join(dpath, fname), mmap_mode='r')
+            for fname in meta['arrays']
+        }
+        return cls(meta['kind'], arrays, meta['count'])
+
+    def contains(self, uids):
+        """Returns a boolean array of which of the given uids are in the set.
+
+        Parameters
+        ----------
+        uids : array-like of int
+            The uids to look up, of any shape.
+        """
+        if self.kind == BITMAP:
+            bits = _unpack_bits(self.arrays[BITS_FNAME], uids, 1)
+            return bits.astype(bool)
+        return is_in_sorted(self.arrays[UIDS_FNAME], uids)
+
+    def genders(self, uids):
+        """Returns the gender of each of the given uids.
+
+        Parameters
+        ----------
+        uids : array-like of int
+            The uids to look up, of any shape.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int8 array of the gender of each uid, or NOT_FOUND (-1) for
+            uids not in the set.
+        """
+        if not self.with_genders:
+            raise ValueError("This uid set was built without genders.")
+        if self.kind == BITMAP:
+            codes = _unpack_bits(self.arrays[GENDER_CODES_FNAME], uids, 2)
+            return codes.astype(np.int8) - 1
+        indices, found = lookup_sorted(self.arrays[UIDS_FNAME], uids)
+        if self.count == 0:
+            return np.full(found.shape, NOT_FOUND, dtype=np.int8)
+        return np.where(
+            found, self.arrays[GENDERS_FNAME][indices], NOT_FOUND
+        ).astype(np.int8)
+
+
+def uid_bitmap_exists(dpath):
+    return os.path.isfile(os.path.join(dpath, META_FNAME))
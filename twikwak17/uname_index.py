@@ -0,0 +1,178 @@
+"""A memory-mapped, sorted username-to-uid index with batched lookups."""
+
+import os
+import json
+import gzip
+from array import array
+
+import numpy as np
+
+from twikwak17.packed import (
+    PackedStrings,
+    PackedStringsBuilder,
+)
+
+
+BLOB_FNAME = 'unames_blob.npy'
+OFFSETS_FNAME = 'unames_offsets.npy'
+UIDS_FNAME = 'uids.npy'
+META_FNAME = 'meta.json'
+NOT_FOUND = -1
+
+
+def write_packed_unames(unames, dpath):
+    """Writes sorted, packed usernames as memory-mappable files.
+
+    Parameters
+    ----------
+    unames : twikwak17.packed.PackedStrings
+        Unique usernames, sorted in native byte order.
+    dpath : str
+        The path to the designated folder. Created if needed.
+    """
+    os.makedirs(dpath, exist_ok=True)
+    np.save(os.path.join(dpath, BLOB_FNAME), unames.arena)
+    np.save(os.path.join(dpath, OFFSETS_FNAME), unames.offsets)
+    meta = {'count': len(unames), 'max_len': unames.max_len()}
+    with open(os.path.join(dpath, META_FNAME), 'wt+') as f:
+        json.dump(meta, f)
+
+
+def load_packed_unames(dpath):
+    """Memory maps packed usernames written by write_packed_unames().
+
+    Returns
+    -------
+    unames, max_len : twikwak17.packed.PackedStrings, int
+        The memory-mapped usernames and the length of the longest one.
+    """
+    with open(os.path.join(dpath, META_FNAME), 'rt') as f:
+        meta = json.load(f)
+    unames = PackedStrings(
+        arena=np.load(os.path.join(dpath, BLOB_FNAME), mmap_mode='r'),
+        offsets=np.load(os.path.join(dpath, OFFSETS_FNAME), mmap_mode='r'),
+    )
+    return unames, meta['max_len']
+
+
+def write_uname_index(unames, uids, dpath):
+    """Writes a sorted username-to-uid mapping as a memory-mappable index.
+
+    Parameters
+    ----------
+    unames : twikwak17.packed.PackedStrings
+        Unique usernames, sorted in native byte order.
+    uids : numpy.ndarray
+        An int64 array of the corresponding user ids.
+    dpath : str
+        The path to the index folder. Created if needed.
+    """
+    write_packed_unames(unames, dpath)
+    np.save(os.path.join(dpath, UIDS_FNAME), uids.astype(np.int64))
+
+
+UNAME2ID_SEP = b' '
+
+
+def build_uname_index_from_file(uname2id_fpath, dpath):
+    """Builds a username-to-uid index from a sorted username-to-id file.
+
+    Of several consecutive lines with the same username only the last is
+    kept, like loading the file into a dict would.
+
+    Parameters
+    ----------
+    uname2id_fpath : str
+        The full qualified path to a sorted, gzipped username-to-id file.
+    dpath : str
+        The path to the index folder. Created if needed.
+
+    Returns
+    -------
+    int
+        The number of usernames in the index.
+    """
+    unames = PackedStringsBuilder()
+    uids = array('q')
+    prev_uname = None
+    with gzip.open(uname2id_fpath, 'rb') as f:
+        for line in f:
+            uname, _, uid = line.rstrip(b'\n').rpartition(UNAME2ID_SEP)
+            if not uname:
+                continue
+            if uname == prev_uname:
+                uids[-1] = int(uid)
+                continue
+            unames.append(uname)
+            uids.append(int(uid))
+            prev_uname = uname
+    write_uname_index(
+        unames.build(), np.frombuffer(uids, dtype=np.int64), dpath)
+    return len(uids)
+
+
+def uname_index_exists(dpath):
+    return os.path.isfile(os.path.join(dpath, META_FNAME))
+
+
+class UnameIndex(object):
+    """A read-only, memory-mapped username-to-uid index.
+
+    All arrays are memory mapped, so loading is near instantaneous, and
+    processes using the same index share its pages.
+
+    Parameters
+    ----------
+    dpath : str
+        The path to an index folder written by write_uname_index().
+    """
+
+    def __init__(self, dpath):
+        self.unames, self.max_len = load_packed_unames(dpath)
+        self.uids = np.load(os.path.join(dpath, UIDS_FNAME), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.uids)
+
+    def positions(self, unames):
+        """Finds the positions of the given usernames in the index.
+
+        Parameters
+        ----------
+        unames : list of str or bytes
+            The usernames to look up.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int64 array with the position of each username in the index, or
+            NOT_FOUND (-1) for usernames not in it.
+        """
+        return self.unames.search(unames, width=self.max_len)
+
+    def lookup(self, unames):
+        """Looks up the uids of the given usernames.
+
+        Parameters
+        ----------
+        unames : list of str or bytes
+            The usernames to look up.
+
+        Returns
+        -------
+        numpy.ndarray
+            An int64 array of the uid of each username, or NOT_FOUND (-1) for
+            usernames not in the index.
+        """
+        positions = self.positions(unames)
+        found = positions != NOT_FOUND
+        uids = np.full(len(positions), NOT_FOUND, dtype=np.int64)
+        uids[found] = self.uids[positions[found]]
+        return uids
+
+    def get(self, uname, default=None):
+        """Returns the uid of a single username, or default if not found."""
+        uid = int(self.lookup([uname])[0])
+        if uid == NOT_FOUND:
+            return default
+        return uid